@@ -1,17 +1,37 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 import logging
 from dotenv import load_dotenv
 import os
-from services.route_service import generate_running_route
+from services.route_service import PLACEMENT_MAX_TOP_K, directions_cache, generate_running_route
+from services.poi_cache import poi_cache
+from services.metrics import http_request_seconds, metrics, stage
+from services.detour_service import get_detour_factor, record_detour_sample
+from services.job_service import JobQueue, JobTimeoutError, QueueFullError
+from services.shape_registry import shape_registry
+from services.shape_upload_service import ShapeUploadService
+from services.adherence_service import run_adherence
+from services.geometry_service import compact_geojson, expand_geojson
+from services.route_lookup_service import find_nearby_routes, find_reusable_route, start_geohash
+from services.response_cache import EncodedResponse, choose_encoding, encode_json, etag_matches, route_responses
+from services.stats_service import clear_stats_cache, run_stats
+from services.track_service import TrackOffsetError, append_track_points, load_metrics, track_geometry
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import defer
 
 from config import Config
 from models import db, Route, Run, TrackPoint
 import uuid
 import json
+import time
+import base64
+import binascii
+from datetime import datetime
 
 app = Flask(__name__)
-CORS(app)
+# ページングのカーソルをフロントエンドから読めるようにする
+CORS(app, expose_headers=["X-Next-Cursor"])
 
 # 設定をアプリケーションに適用
 app.config.from_object(Config)
@@ -19,216 +39,649 @@ app.config.from_object(Config)
 # データベース初期化
 db.init_app(app)
 
+# ルート生成ジョブのワーカープール
+route_jobs = JobQueue(
+    "route",
+    max_workers=app.config["ROUTE_JOB_WORKERS"],
+    max_queue=app.config["ROUTE_JOB_MAX_QUEUE"],
+    timeout_sec=app.config["ROUTE_JOB_TIMEOUT_SEC"]
+)
+
 # 一つ上のディレクトリにある .env を読み込む
 load_dotenv()
 
 # 環境変数からOpenRouteServiceのAPIキーを取得
 ORS_API_KEY = os.getenv("ORS_API_KEY")
-print(f"ORS_API_KEY: {ORS_API_KEY}")
-
-# イラストと座標点データの紐づけ（のちのちデータベースに移行）
-SHAPES = {
-    "hiyoko":  [
-            (2, 624),  # x1, y1 は現在地に対応
-            (889, 27),
-            (1559, 193),
-            (2751, 911),
-            (1684, 2728),
-            (806, 2506)
-        ],
-    "kuma":  [
-            (136, 177),  # x1, y1 は現在地に対応
-            (2585, 129),
-            (2770, 565),
-            (2532, 2219),
-            (320, 2300),
-            (70, 1804)
-        ],
-    "uma":  [
-            (306, 0),  # x1, y1 は現在地に対応
-            (997, 0),
-            (1205, 285),
-            (1004, 2601),
-            (758, 2767),
-            (325, 2621)
-        ],
-    "yunicorn":  [
-            (1668, 119),  # x1, y1 は現在地に対応
-            (1838, 174),
-            (2759, 51),
-            (2438, 1907),
-            (1179, 2210),
-            (0, 1697)
-        ]
-}
-
-#イラストと距離を受け取り、ルートを生成する
-@app.route("/api/route/generate", methods=["POST"])
-def generate_route():
-    try:
-        # フロントエンドからのデータを取得
-        data = request.json
-        
-        # データのバリデーション
-        if not data:
-            return jsonify({"error": "データが送信されていません"}), 400
+if not ORS_API_KEY:
+    logging.warning("ORS_API_KEY が設定されていません")
+
+# イラストと座標点データの紐づけ（特徴点抽出の結果を起動時に読み込む）
+shape_registry.load_directory(os.path.join(app.root_path, "static", "keypoints_results"))
+
+# アップロードされたイラストの特徴点抽出（抽出済みの図形は起動時に登録する）
+shape_uploads = ShapeUploadService(
+    app.config["SHAPE_UPLOAD_DIR"],
+    workers=app.config["SHAPE_JOB_WORKERS"],
+    max_queue=app.config["SHAPE_JOB_MAX_QUEUE"],
+    timeout_sec=app.config["SHAPE_JOB_TIMEOUT_SEC"],
+    processes=app.config["SHAPE_EXTRACT_PROCESSES"]
+)
+shape_uploads.load()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    """ハンドラの処理時間を、URLのパターン（/api/route/<route_id> など）ごとに記録する"""
+    start = g.pop("request_start", None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        http_request_seconds.observe(
+            time.perf_counter() - start,
+            method=request.method, endpoint=endpoint, status=response.status_code
+        )
+    return response
+
+@metrics.collector
+def collect_cache_stats():
+    """キャッシュのヒット・ミス数（ヒット率は hits / (hits + misses) で求める）"""
+    poi = poi_cache.stats()
+    directions = directions_cache.stats()
+    responses = route_responses.stats()
+    yield "gpsketch_cache_requests_total", "counter", "キャッシュの参照数（result は hit / miss）", [
+        ({"cache": "poi", "result": "hit"}, poi["memory_hits"] + poi["disk_hits"]),
+        ({"cache": "poi", "result": "miss"}, poi["misses"]),
+        ({"cache": "directions", "result": "hit"}, directions["hits"]),
+        ({"cache": "directions", "result": "miss"}, directions["misses"]),
+        ({"cache": "route_responses", "result": "hit"}, responses["hits"]),
+        ({"cache": "route_responses", "result": "miss"}, responses["misses"]),
+    ]
+    yield "gpsketch_cache_entries", "gauge", "キャッシュに保持しているエントリ数", [
+        ({"cache": "poi"}, poi["memory_size"]),
+        ({"cache": "directions"}, directions["size"]),
+        ({"cache": "route_responses"}, responses["size"]),
+    ]
+
+# 計測値（Prometheusのテキスト形式）
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def parse_generate_request(data):
+    """
+    ルート生成リクエストのパラメータを取り出して検証する
+    
+    Args:
+        data: フロントエンドから送信されたJSON
         
-        # 必要なパラメータを取得
-        shape = data.get("shape", "hiyoko")  # イラストname
-        target_distance = data.get("length", 10.0)      # 距離（km）
-        current_lat = data.get("latitude", 35.681236)       # 緯度
-        current_lon = data.get("longitude", 139.767125)     # 経度
+    Returns:
+        ルート生成のパラメータの辞書
         
-        # 緯度経度のバリデーション
-        if current_lat is None or current_lon is None:
-            return jsonify({"error": "緯度・経度が指定されていません"}), 400
+    Raises:
+        ValueError: パラメータが不正な場合
+    """
+    # データのバリデーション
+    if not data:
+        raise ValueError("データが送信されていません")
+    
+    # 必要なパラメータを取得
+    params = {
+        "shape": data.get("shape", "hiyoko"),                 # イラストname
+        "target_distance": data.get("length", 10.0),          # 距離（km）
+        "current_lat": data.get("latitude", 35.681236),       # 緯度
+        "current_lon": data.get("longitude", 139.767125),     # 経度
+        "candidates": data.get("candidates", 1),              # ORSで検証する配置候補の数（2以上で配置を探索）
+        "reuse": bool(data.get("reuse", False)),              # 近くに同じイラスト・距離のルートがあれば使い回す
+    }
+    
+    # 配置候補の数は整数（2.7・true・"3" は受け付けない）で、1〜PLACEMENT_MAX_TOP_Kに収める
+    candidates = params["candidates"]
+    if not isinstance(candidates, int) or isinstance(candidates, bool):
+        raise ValueError("candidates は整数で指定してください")
+    params["candidates"] = min(max(candidates, 1), PLACEMENT_MAX_TOP_K)
+    
+    # 緯度経度のバリデーション
+    if params["current_lat"] is None or params["current_lon"] is None:
+        raise ValueError("緯度・経度が指定されていません")
+    
+    # イラスト名は routes.animal_name（VARCHAR(64)）に保存する
+    if not isinstance(params["shape"], str) or not 0 < len(params["shape"]) <= 64:
+        raise ValueError("shape は64文字以内で指定してください")
+    
+    return params
+
+def create_route(params, deadline=None):
+    """
+    ルートを生成してデータベースに保存する
+    
+    Args:
+        params: parse_generate_request が返すパラメータ
+        deadline: 保存を諦める時刻（time.monotonic() 基準、Noneなら無制限）
         
-        # 座標点データを生成
-        if shape not in SHAPES:
-            points = SHAPES["hiyoko"] #用意されていないイラストの場合はhiyokoとする
-        else:
-            points = SHAPES[shape]
+    Returns:
+        フロントエンドに返すルート情報の辞書（既存のルートを使い回した場合は "reused": True）
         
-        # フロントエンドに返す経路一覧を格納するリスト
-        features = []
+    Raises:
+        RuntimeError: ルートを生成できなかった場合
+        JobTimeoutError: 保存前に締め切りを過ぎた場合
+    """
+    shape = params["shape"]
+    target_distance = params["target_distance"]
+    current_lat = params["current_lat"]
+    current_lon = params["current_lon"]
+
+    # 使い回せる既存のルートがあれば、OverpassとORSを呼ばずにそのルートを返す
+    if params.get("reuse"):
+        with stage("reuse_lookup"):
+            reused = find_reusable_route(params)
+        if reused is not None:
+            return reused
+    
+    # 座標点データを取得（用意されていないイラストの場合はhiyokoとする）
+    points = shape_registry.get(shape)
+    
+    # フロントエンドに返す経路一覧を格納するリスト
+    features = []
+
+    # 地域ごとに学習した迂回係数で図形の縮尺を決める
+    detour_factor = get_detour_factor(current_lat, current_lon)
+
+    # ルート作成処理を呼び出す
+    route_data = generate_running_route(current_lat, current_lon, points, target_distance, ORS_API_KEY, detour_factor, top_k=params["candidates"])
+    
+    # 結果が期待通りでない場合、エラーログを追加
+    if not route_data or not route_data["route"]:
+        raise RuntimeError("Failed to generate route")
+
+    # 成功した場合はフロントエンドに返す
+    features.append(route_data["route"]["features"][0])
+    
+    route_id = str(uuid.uuid4())
+    route_geojson = {
+        "type": "FeatureCollection",
+        "features": features,
+        "waypoints": route_data["waypoints"],
+        "total_distance": route_data["total_distance"]
+    }
+    route = Route(
+        id=route_id,
+        animal_name=shape,
+        distance_km=target_distance,
+        actual_route_distance_km=route_data["total_distance"],
+        straight_distance_km=route_data["straight_distance"],
+        # 経路の座標列は間引いてエンコード済みポリラインで保存する（読み出し時に戻す）
+        route_geojson=compact_geojson(route_geojson),
+        stat_end_latitude=current_lat,
+        stat_end_longitude=current_lon,
+        start_geohash=start_geohash(current_lat, current_lon)
+    )
+    with stage("persist"):
+        db.session.add(route)
 
-        # ルート作成処理を呼び出す
-        route_data = generate_running_route(current_lat, current_lon, points, target_distance, ORS_API_KEY)
-        
-        # 結果が期待通りでない場合、エラーログを追加
-        if not route_data:
-            return jsonify({"error": "Failed to generate route"}), 500
+        # 実距離と直線距離の比を地域の迂回係数に反映
+        record_detour_sample(current_lat, current_lon, route_data["straight_distance"], route_data["total_distance"])
 
-        # 成功した場合はフロントエンドに返す
-        features.append(route_data["route"]["features"][0])
-        
-        route_id = str(uuid.uuid4())
-        route = Route(
-            id=route_id,
-            animal_name=shape,
-            distance_km=target_distance,
-            actual_route_distance_km=route_data["total_distance"],
-            route_geojson=json.dumps({
-                "type": "FeatureCollection",
-                "features": route_data["route"]["features"][0],
-                "waypoints": route_data["waypoints"],
-                "total_distance": route_data["total_distance"]
-            }),
-            stat_end_latitude=current_lat,
-            stat_end_longitude=current_lon
-        )
-        db.session.add(route)
+        # 締め切りを過ぎていれば保存しない（コミットしたルートは必ずジョブの結果として返す）
+        if deadline is not None and time.monotonic() > deadline:
+            db.session.rollback()
+            raise JobTimeoutError("job timed out before the route was saved")
         db.session.commit()
 
-        return jsonify({
-            "route_id": route_id,
-            "type": "FeatureCollection",
-            "features": features,
-            "waypoints":route_data["waypoints"],
-            "total_distance":route_data["total_distance"]
-        })
+    return {
+        "route_id": route_id,
+        "type": "FeatureCollection",
+        "features": features,
+        "waypoints":route_data["waypoints"],
+        "total_distance":route_data["total_distance"]
+    }
+
+#イラストと距離を受け取り、ルートを生成する
+@app.route("/api/route/generate", methods=["POST"])
+def generate_route():
+    try:
+        # フロントエンドからのデータを取得
+        params = parse_generate_request(request.json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        return jsonify(create_route(params))
 
     except Exception as e:
         # 例外発生時のエラーログ
         return jsonify({"error": str(e)}), 500
 
+def _run_route_job(deadline, params):
+    """ワーカースレッドでルートを生成・保存する（アプリケーションコンテキストを張る）"""
+    with app.app_context():
+        try:
+            return create_route(params, deadline)
+        except Exception:
+            db.session.rollback()
+            raise
+
+# ルート生成ジョブの登録（すぐにジョブIDを返し、生成はワーカーで行う）
+@app.route("/api/route/jobs", methods=["POST"])
+def submit_route_job():
+    try:
+        params = parse_generate_request(request.json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        job_id = route_jobs.submit(_run_route_job, params)
+    except QueueFullError:
+        return jsonify({"error": "混雑しています。しばらくしてから再度お試しください"}), 503
+
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+# ルート生成ジョブの状態取得（完了していれば生成結果を返す）
+@app.route("/api/route/jobs/<job_id>", methods=["GET"])
+def get_route_job(job_id):
+    job = route_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    response = {"job_id": job["id"], "status": job["status"]}
+    if job["status"] == "succeeded":
+        response["result"] = job["result"]
+    elif job["error"]:
+        response["error"] = job["error"]
+    return jsonify(response)
+
+# 登録済みの図形一覧
+@app.route("/api/shapes", methods=["GET"])
+def get_shapes():
+    return jsonify([shape_registry.get(name).to_dict() for name in shape_registry.names()])
+
+# イラストのアップロード（特徴点はワーカーで抽出し、同じ画像なら抽出済みの結果を返す）
+@app.route("/api/shapes", methods=["POST"])
+def upload_shape():
+    image = request.files.get("image")
+    if image is None:
+        return jsonify({"error": "画像が送信されていません"}), 400
+
+    try:
+        shape_id, status = shape_uploads.submit(image.read(), image.filename)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFullError:
+        return jsonify({"error": "混雑しています。しばらくしてから再度お試しください"}), 503
+
+    if status == "ready":
+        return jsonify(shape_uploads.status(shape_id)), 200
+    return jsonify({"shape_id": shape_id, "status": status}), 202
+
+# アップロードしたイラストの抽出状態（抽出済みなら特徴点を返す）
+@app.route("/api/shapes/<shape_id>", methods=["GET"])
+def get_shape(shape_id):
+    status = shape_uploads.status(shape_id)
+    if status is None:
+        return jsonify({"error": "Shape not found"}), 404
+    if status["status"] == "ready":
+        return jsonify(status), 200
+    if status["status"] in ("failed", "timeout"):
+        return jsonify(status), 422
+    return jsonify(status), 202
+
+# 出発地点が近い既存のルートの一覧
+@app.route("/api/route/nearby", methods=["GET"])
+def get_nearby_routes():
+    """
+    クエリ: lat, lon（必須）, radius_m（既定300、最大5000）, shape, length, limit（既定20、最大100）
+    """
+    try:
+        lat = float(request.args["lat"])
+        lon = float(request.args["lon"])
+        radius_m = float(request.args.get("radius_m", 300))
+        length = request.args.get("length")
+        distance_km = float(length) if length is not None else None
+        limit = int(request.args.get("limit", 20))
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat, lon は数値で指定してください"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or not 0 < radius_m <= 5000 or not 0 < limit <= 100:
+        return jsonify({"error": "パラメータの範囲が不正です"}), 400
+
+    try:
+        nearby = find_nearby_routes(
+            lat, lon, radius_m,
+            animal_name=request.args.get("shape"), distance_km=distance_km, limit=limit
+        )
+        return jsonify([
+            {
+                "id": route.id,
+                "animal_name": route.animal_name,
+                "distance_km": route.distance_km,
+                "actual_route_distance_km": route.actual_route_distance_km,
+                "stat_end_latitude": route.stat_end_latitude,
+                "stat_end_longitude": route.stat_end_longitude,
+                "distance_m": round(distance_m, 1),
+                "created_at": route.created_at.isoformat() if route.created_at else None
+            }
+            for route, distance_m in nearby
+        ])
+    except Exception as e:
+        logging.error(f"Error in get_nearby_routes: {e}")
+        return jsonify({"error": str(e)}), 500
+
 # ルート取得
+def route_response_payload(route):
+    """
+    GET /api/route/<route_id> で返すルート情報を作る
+
+    route_geojson は以前のクライアントに合わせてJSON文字列で返す
+    """
+    # 以前は route_geojson を文字列で保存していた
+    route_geojson = route.route_geojson
+    if isinstance(route_geojson, str):
+        route_geojson = json.loads(route_geojson)
+
+    # 圧縮して保存した座標列を元のGeoJSONの形に戻す
+    route_geojson = expand_geojson(route_geojson)
+
+    # featuresがリストでなければリスト化する
+    if isinstance(route_geojson.get("features"), dict):
+        route_geojson["features"] = [route_geojson["features"]]
+
+    return {
+        "id": route.id,
+        "animal_name": route.animal_name,
+        "distance_km": route.distance_km,
+        "actual_route_distance_km": route.actual_route_distance_km,
+        "route_geojson": json.dumps(route_geojson),
+        "stat_end_latitude": route.stat_end_latitude,
+        "stat_end_longitude": route.stat_end_longitude,
+        "image_url": route.image_url,
+        "image_bounds": route.image_bounds
+    }
+
+
+def load_route_response(route_id):
+    """
+    ルートのエンコード済みレスポンスを取得
+
+    最初に取得されたときにルートから作り、プロセス内のキャッシュにだけ保持する
+    （データベースには圧縮した route_geojson だけを保存し、展開したレスポンスは保存しない）。
+    ETag は内容から決まるので、作り直してもプロセスが違っても同じ値になる
+
+    Returns:
+        EncodedResponse（ルートが見つからない場合はNone）
+    """
+    encoded = route_responses.get(route_id)
+    if encoded is not None:
+        return encoded
+
+    route = db.session.get(Route, route_id)
+    if route is None:
+        return None
+    encoded = EncodedResponse(*encode_json(route_response_payload(route)))
+    route_responses.put(route_id, encoded)
+    return encoded
+
+
 @app.route("/api/route/<route_id>", methods=["GET"])
 def get_route_by_id(route_id):
     try:
-        route = Route.query.get(route_id)
-        if not route:
+        encoded = load_route_response(route_id)
+        if encoded is None:
             return jsonify({"error": "Route not found"}), 404
 
-        # route_geojsonをロードしてチェック
-        route_geojson = route.route_geojson
-        if isinstance(route_geojson, str):
-            import json
-            route_geojson = json.loads(route_geojson)
-
-        # featuresがリストでなければリスト化する
-        if isinstance(route_geojson.get("features"), dict):
-            route_geojson["features"] = [route_geojson["features"]]
-
-        route_data = {
-            "id": route.id,
-            "animal_name": route.animal_name,
-            "distance_km": route.distance_km,
-            "actual_route_distance_km": route.actual_route_distance_km,
-            "route_geojson": json.dumps(route_geojson),  # ここでまた文字列に戻して渡す
-            "stat_end_latitude": route.stat_end_latitude,
-            "stat_end_longitude": route.stat_end_longitude,
-            "image_url": route.image_url,
-            "image_bounds": route.image_bounds
+        encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+        headers = {
+            "ETag": encoded.etag_for(encoding),
+            "Vary": "Accept-Encoding",
+            # ルートは作成後に変わらない
+            "Cache-Control": "public, max-age=31536000, immutable"
         }
-        return jsonify(route_data)
+        if etag_matches(request.headers.get("If-None-Match"), encoded.etag):
+            return Response(status=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(encoded.body(encoding), status=200, headers=headers, mimetype="application/json")
 
     except Exception as e:
+        db.session.rollback()
         logging.error(f"Error fetching route: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/runs/start", methods=["POST"])
+def start_run():
+    """ランを開始し、軌跡を送信するためのランIDを発行する"""
+    try:
+        data = request.get_json() or {}
+        route_id = data.get("route_id")
+        if not route_id:
+            return jsonify({"error": "route_id が必要です"}), 400
+        if db.session.get(Route, route_id) is None:
+            return jsonify({"error": "Route not found"}), 404
+
+        start_time_str = data.get("start_time")
+        start_time = datetime.fromisoformat(start_time_str) if start_time_str else datetime.now()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        new_run = Run(route_id=route_id, start_time=start_time)
+        db.session.add(new_run)
+        db.session.commit()
+        return jsonify({"run_id": new_run.id}), 201
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in start_run: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/runs/<run_id>/track", methods=["POST"])
+def upload_track(run_id):
+    """
+    ラン中の測位点をチャンクで受け取って記録する
+
+    リクエスト: {"offset": 送信済みの点数, "points": [{"latitude", "longitude", "timestamp", "route_index"}, ...]}
+    timestamp のない点を含む場合は 400 を返す。
+    offset が記録済みの点数と合わない場合は 409 と記録済みの点数（expected_offset）を返す
+    """
+    data = request.get_json() or {}
+    points = data.get("points")
+    try:
+        offset = int(data.get("offset", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "offset は整数で指定してください"}), 400
+    if not isinstance(points, list) or not points or offset < 0:
+        return jsonify({"error": "points と offset が必要です"}), 400
+    if len(points) > app.config["TRACK_CHUNK_MAX_POINTS"]:
+        return jsonify({"error": f"1回に送信できる点は{app.config['TRACK_CHUNK_MAX_POINTS']}点までです"}), 413
+
+    try:
+        result = append_track_points(run_id, points, offset)
+        db.session.commit()
+    except LookupError:
+        db.session.rollback()
+        return jsonify({"error": "Run not found"}), 404
+    except TrackOffsetError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e), "expected_offset": e.expected}), 409
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in upload_track: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    result["run_id"] = run_id
+    return jsonify(result), 200
+
+
+@app.route("/api/runs/<run_id>/adherence", methods=["GET"])
+def get_run_adherence(run_id):
+    """
+    ランが予定ルートをどれだけなぞれたか
+
+    追従度は complete_route で計算して保存する。完了前のランは記録済みの軌跡から計算して返す（保存はしない）
+    """
+    try:
+        run = db.session.get(Run, run_id)
+        if run is None:
+            return jsonify({"error": "Run not found"}), 404
+        adherence = run.adherence if run.adherence is not None else run_adherence(run)
+        if adherence is None:
+            return jsonify({"error": "ルートか軌跡のデータがありません"}), 404
+        return jsonify(dict(adherence, run_id=run_id)), 200
+    except Exception as e:
+        logging.error(f"Error in get_run_adherence: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/route/complete", methods=["POST"])
 def complete_route():
+    """
+    ランを完了させ、記録した軌跡から計算した指標と追従度を保存する
+
+    軌跡を記録していないラン（run_id なしで完了したものを含む）は、距離・ペース・追従度を
+    計算せずに null で保存する（送られた geojson は予定ルートなので実際の軌跡として扱わない）
+    """
     try:
         data = request.get_json()
 
+        run_id = data.get("run_id")
         route_id = data.get("route_id")
         start_time_str = data.get("start_time")
-        geojson = data.get("geojson")
 
-        if not route_id or not start_time_str or not geojson:
+        # /api/runs/start で開始したランは記録済みの軌跡から完了させる
+        if run_id:
+            run = db.session.get(Run, run_id)
+            if run is None:
+                return jsonify({"error": "Run not found"}), 404
+            track = track_geometry(run_id)
+        elif not route_id or not start_time_str:
             return jsonify({"error": "必要なデータが足りません。"}), 400
+        else:
+            run = Run(route_id=route_id)
+            track = None
 
         # start_timeをdatetime型に変換
-        start_time = datetime.fromisoformat(start_time_str)
+        if start_time_str:
+            run.start_time = datetime.fromisoformat(start_time_str)
 
         # 現在時刻をend_timeに設定
-        end_time = datetime.now()
-
-        # 実際の距離（km）をgeojsonから取得する（total_distanceフィールド想定）
-        actual_distance_km = geojson.get("total_distance", 0.0)
-
-        # 仮にペース・カロリーを適当に設定する（あとでちゃんと計算してもOK）
-        # 例：5分/km固定、カロリー=距離(㎞)×60kcalくらい
-        pace_min_per_km = 5.0
-        calories = int(actual_distance_km * 60)
-
-        new_run = Run(
-            route_id=route_id,
-            start_time=start_time,
-            end_time=end_time,
-            actual_distance_km=actual_distance_km,
-            pace_min_per_km=pace_min_per_km,
-            calories=calories,
-            track_geojson=geojson
-        )
+        run.end_time = datetime.now()
+
+        if track is not None:
+            # 記録した軌跡の座標と時刻から計算済みの指標
+            metrics = load_metrics(run)
+            summary = metrics.summary()
+            run.actual_distance_km = summary["distance_km"]
+            run.pace_min_per_km = summary["pace_min_per_km"]
+            run.calories = summary["calories"]
+            # 集計結果は計算途中の状態とは別のキーに保存する
+            run.metrics = {"state": metrics.to_dict(), "summary": summary}
+            run.track_geojson = compact_geojson(track)
+        else:
+            summary = None
+
+        db.session.add(run)
+        db.session.flush()
+        # 予定ルートをどれだけなぞれたかを評価して保存する（軌跡がなければNone）
+        run.adherence = run_adherence(run) if track is not None else None
 
-        db.session.add(new_run)
         db.session.commit()
+        # 完了したランをすぐに集計に反映する
+        clear_stats_cache()
 
-        return jsonify({"message": "Runデータ登録成功！", "run_id": new_run.id}), 201
+        return jsonify({
+            "message": "Runデータ登録成功！",
+            "run_id": run.id,
+            "metrics": summary,
+            "adherence": run.adherence
+        }), 201
 
     except Exception as e:
+        db.session.rollback()
         logging.error(f"Error in complete_route: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+def encode_runs_cursor(run):
+    """ラン履歴の次ページのカーソル（最後に返したランの start_time と id）を作る"""
+    start_time = run.start_time.isoformat() if run.start_time else None
+    raw = json.dumps([start_time, run.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_runs_cursor(cursor):
+    """
+    カーソルを (start_time, id) に戻す
+
+    Raises:
+        ValueError: カーソルが不正な場合
+    """
+    try:
+        start_time, run_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (datetime.fromisoformat(start_time) if start_time else None), str(run_id)
+    except (binascii.Error, UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"不正なカーソルです: {cursor}") from e
+
+
+def runs_after(start_time, run_id):
+    """
+    (start_time, id) の降順で、カーソルより後ろにあるランの条件
+
+    MySQLの降順では start_time がNULLのランは最後に並ぶので、その分も条件に含める
+    """
+    if start_time is None:
+        return and_(Run.start_time.is_(None), Run.id < run_id)
+    return or_(
+        Run.start_time < start_time,
+        and_(Run.start_time == start_time, Run.id < run_id),
+        Run.start_time.is_(None)
+    )
+
+
 @app.route("/api/runs", methods=["GET"])
 def get_runs():
+    """
+    ラン履歴を新しい順に返す
+
+    クエリパラメータ:
+        limit: 1ページの件数（省略時 RUNS_PAGE_DEFAULT_LIMIT）
+        cursor: 前のページの X-Next-Cursor ヘッダーの値
+        include_track: 1 の場合は track_geojson も返す（省略時は返さない）
+
+    続きがある場合は X-Next-Cursor ヘッダーに次ページのカーソルを付ける
+    """
     try:
-        # `runs` テーブルの全データを取得
-        runs = Run.query.all()
-        
+        limit = int(request.args.get("limit", app.config["RUNS_PAGE_DEFAULT_LIMIT"]))
+        if limit < 1:
+            raise ValueError("limit は1以上を指定してください")
+        limit = min(limit, app.config["RUNS_PAGE_MAX_LIMIT"])
+        cursor = request.args.get("cursor")
+        after = decode_runs_cursor(cursor) if cursor else None
+        include_track = request.args.get("include_track", "0").lower() in ("1", "true", "yes")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # ルート名は結合して1回のクエリで取得する
+        query = db.session.query(Run, Route.animal_name).outerjoin(Route, Run.route_id == Route.id)
+        if not include_track:
+            # 重い軌跡データは読み込まない
+            query = query.options(defer(Run.track_geojson))
+        if after:
+            query = query.filter(runs_after(*after))
+
+        # 1件多く取得して次のページがあるかを判定する
+        rows = query.order_by(Run.start_time.desc(), Run.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
         # データをシリアライズしてJSON形式で返す
         runs_data = []
-        for run in runs:
-            # route_idを使ってRouteテーブルからanimal_nameを取得
-            route = Route.query.get(run.route_id)
-            animal_name = route.animal_name if route else None
-            
-            # データを構築
-            runs_data.append({
+        for run, animal_name in rows:
+            run_data = {
                 "id": run.id,
                 "route_id": run.route_id,
                 "start_time": run.start_time,
@@ -236,16 +689,45 @@ def get_runs():
                 "actual_distance_km": run.actual_distance_km,
                 "pace_min_per_km": run.pace_min_per_km,
                 "calories": run.calories,
-                "track_geojson": run.track_geojson,
                 "animal_name": animal_name
-            })
-            
-        return jsonify(runs_data), 200
+            }
+            if include_track:
+                run_data["track_geojson"] = expand_geojson(run.track_geojson)
+            runs_data.append(run_data)
+
+        response = jsonify(runs_data)
+        if has_more:
+            response.headers["X-Next-Cursor"] = encode_runs_cursor(rows[-1][0])
+        return response, 200
     except Exception as e:
         logging.error(f"Error fetching runs: {e}")
         return jsonify({"error": "Failed to fetch runs"}), 500
 
 
+@app.route("/api/runs/stats", methods=["GET"])
+def get_run_stats():
+    """
+    ラン記録の集計（合計・動物ごと・期間ごと）を返す
+
+    クエリパラメータ:
+        from: 集計する開始時刻の下限（ISO 8601、含む）
+        to: 集計する開始時刻の上限（ISO 8601、含まない）
+        period: 期間ごとの集計の単位（day / week / month、省略時 month）
+    """
+    try:
+        start = request.args.get("from")
+        end = request.args.get("to")
+        start = datetime.fromisoformat(start) if start else None
+        end = datetime.fromisoformat(end) if end else None
+        stats = run_stats(start, end, request.args.get("period", "month"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error fetching run stats: {e}")
+        return jsonify({"error": "Failed to fetch run stats"}), 500
+    return jsonify(stats), 200
+
+
 # ログの設定
 if __name__ == "__main__":
     # ログレベル設定（DEBUGにして詳細なログを取得）
@@ -0,0 +1,3 @@
+"""
+エンドツーエンドのベンチマーク（Overpass・ORSのスタブサーバーと負荷ドライバ）
+"""
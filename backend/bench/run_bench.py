@@ -0,0 +1,385 @@
+"""
+エンドツーエンドのベンチマーク
+Overpass・ORSのスタブサーバーを起動してルート生成の接続先を向け、
+/api/route/generate・/api/route/<id>・/api/runs に指定した並行数でリクエストを送り、
+スループットと p50 / p95 / p99 の応答時間を計測します。
+結果は results/ にJSONで保存し、前回の結果との差を表示します
+
+実行例（backend ディレクトリで実行）:
+    python -m bench.run_bench --requests 200 --concurrency 8 --label after-change
+
+--base-url を指定しない場合は、SQLiteのデータベースでアプリをこのプロセス内に起動する。
+起動済みのサーバー（MySQL）を計測する場合は、サーバー側の OVERPASS_URL / ORS_BASE_URL を
+python -m bench.stub_servers で起動したスタブに向けてから --base-url を指定する
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import requests
+
+from bench.stub_servers import start_stub_servers
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+SCENARIOS = ("generate", "route", "runs")
+BENCH_ORIGIN = (35.681236, 139.767125)  # 記録したOverpassのレスポンスの中心（東京駅）
+SHAPES = ("hiyoko",)
+
+
+def start_local_app(database_uri):
+    """
+    アプリをこのプロセス内のスレッドで起動
+
+    環境変数（接続先など）はアプリを読み込む前に設定しておくこと
+
+    Returns:
+        (ベースURL, サーバー)
+    """
+    from werkzeug.serving import make_server
+
+    os.environ["SQLALCHEMY_DATABASE_URI"] = database_uri
+    from app import app
+    from models import db
+
+    with app.app_context():
+        db.create_all()
+
+    # リクエストごとのアクセスログは出さない
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+class LoadDriver:
+    """指定した並行数でリクエストを送り、1件ごとの応答時間とステータスを記録する"""
+
+    def __init__(self, base_url, concurrency, timeout=120):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        # スレッドごとにkeep-alive接続を使い回す
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def call(self, method, path, **kwargs):
+        """
+        1件のリクエストを送信
+
+        Returns:
+            (応答時間（秒）, ステータスコード（接続できなかった場合は0）, レスポンス)
+        """
+        start = time.perf_counter()
+        try:
+            response = self._session().request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            return time.perf_counter() - start, response.status_code, response
+        except requests.RequestException:
+            return time.perf_counter() - start, 0, None
+
+    def run(self, requests_list):
+        """
+        (method, path, kwargs) のリストを並行に送信
+
+        Returns:
+            (結果のリスト（送信順）, 全体の所要時間（秒）)
+        """
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = list(executor.map(lambda item: self.call(item[0], item[1], **item[2]), requests_list))
+        return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed_sec):
+    """応答時間の分布とスループットを集計"""
+    latencies_ms = np.array([latency for latency, _, _ in results]) * 1000
+    statuses = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(1 for _, status, _ in results if status == 0 or status >= 400)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "statuses": statuses,
+        "elapsed_sec": round(elapsed_sec, 3),
+        "throughput_rps": round(len(results) / elapsed_sec, 2) if elapsed_sec > 0 else None,
+        "mean_ms": round(float(latencies_ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "max_ms": round(float(latencies_ms.max()), 2),
+    }
+
+
+def generate_requests(count, rng, jitter_m, candidates):
+    """出発地点を少しずつずらしたルート生成リクエスト"""
+    offsets = rng.uniform(-jitter_m, jitter_m, size=(count, 2)) / 111195
+    items = []
+    for i, (dlat, dlon) in enumerate(offsets):
+        items.append(("POST", "/api/route/generate", {"json": {
+            "shape": SHAPES[i % len(SHAPES)],
+            "length": float(rng.choice([3.0, 5.0, 8.0])),
+            "latitude": BENCH_ORIGIN[0] + dlat,
+            "longitude": BENCH_ORIGIN[1] + dlon / np.cos(np.radians(BENCH_ORIGIN[0])),
+            "candidates": candidates,
+        }}))
+    return items
+
+
+def seed_run(driver, route_id, start_time):
+    """
+    ランを開始し、軌跡を送ってから完了させる（アプリと同じ記録済みの軌跡から完了する経路）
+
+    Returns:
+        完了できた場合はTrue
+    """
+    lat, lon = BENCH_ORIGIN
+    _, status, response = driver.call("POST", "/api/runs/start", json={
+        "route_id": route_id, "start_time": start_time.isoformat()
+    })
+    if status != 201:
+        return False
+    run_id = response.json()["run_id"]
+
+    # 東へ約9mずつ5秒ごとに進む軌跡
+    points = [
+        {
+            "latitude": lat + 0.00005 * (k % 2),
+            "longitude": lon + 0.0001 * k,
+            "timestamp": (start_time + timedelta(seconds=5 * k)).isoformat(),
+        }
+        for k in range(40)
+    ]
+    _, status, _ = driver.call("POST", f"/api/runs/{run_id}/track", json={"offset": 0, "points": points})
+    if status != 200:
+        return False
+    _, status, _ = driver.call("POST", "/api/route/complete", json={"run_id": run_id})
+    return status == 201
+
+
+def seed_runs(driver, route_ids, count):
+    """ラン履歴の計測用に、完了したランを登録"""
+    start = datetime(2025, 1, 1, 6, 0, 0)
+    with ThreadPoolExecutor(max_workers=driver.concurrency) as executor:
+        completed = list(executor.map(
+            lambda i: seed_run(driver, route_ids[i % len(route_ids)], start + timedelta(hours=i)), range(count)
+        ))
+    return sum(completed)
+
+
+def scrape_stages(base_url):
+    """/metrics からルート生成の段階ごとの平均時間（ミリ秒）と回数を取り出す"""
+    try:
+        text = requests.get(base_url + "/metrics", timeout=10).text
+    except requests.RequestException:
+        return {}
+    sums = dict(re.findall(r'gpsketch_route_stage_duration_seconds_sum\{stage="(\w+)"\} (\S+)', text))
+    counts = dict(re.findall(r'gpsketch_route_stage_duration_seconds_count\{stage="(\w+)"\} (\S+)', text))
+    return {
+        name: {"count": int(float(counts[name])), "mean_ms": round(float(sums[name]) / float(counts[name]) * 1000, 2)}
+        for name in sums if name in counts and float(counts[name]) > 0
+    }
+
+
+def git_revision():
+    """計測したコードのコミット（取得できない場合はNone）"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latest_result(directory, exclude=None):
+    """保存済みの結果のうち最も新しいファイル"""
+    paths = sorted(path for path in glob.glob(os.path.join(directory, "*.json")) if path != exclude)
+    return paths[-1] if paths else None
+
+
+def compare(current, baseline, threshold):
+    """
+    前回の結果との差を表示
+
+    Returns:
+        応答時間（p95）が threshold の割合より悪化したシナリオのリスト
+    """
+    regressions = []
+    print(f"\n前回の結果との比較（{baseline.get('label')} @ {baseline.get('git_revision')}）")
+    print(f"{'scenario':<10}{'throughput':>14}{'p50':>12}{'p95':>12}{'p99':>12}")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+
+        def change(key):
+            if not before.get(key):
+                return None
+            return (result[key] - before[key]) / before[key]
+
+        changes = {key: change(key) for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")}
+        print(f"{name:<10}" + "".join(
+            f"{'-' if value is None else f'{value:+.1%}':>{14 if key == 'throughput_rps' else 12}}"
+            for key, value in changes.items()
+        ))
+        if changes["p95_ms"] is not None and changes["p95_ms"] > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def print_table(results):
+    print(f"\n{'scenario':<10}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, result in results.items():
+        print(
+            f"{name:<10}{result['requests']:>10}{result['errors']:>8}{result['throughput_rps']:>10}"
+            f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ルート生成・ルート取得・ラン履歴のAPIを計測します")
+    parser.add_argument("--requests", type=int, default=100, help="シナリオごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に送るリクエスト数")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="計測するシナリオ（カンマ区切り）")
+    parser.add_argument("--candidates", type=int, default=1, help="ルート生成で検証する配置候補の数")
+    parser.add_argument("--jitter-m", type=float, default=1500.0, help="出発地点をずらす範囲（メートル）")
+    parser.add_argument("--seed-runs", type=int, default=200, help="ラン履歴の計測前に登録するランの数")
+    parser.add_argument("--overpass-latency-ms", type=float, default=800.0, help="Overpassのスタブの遅延（ミリ秒）")
+    parser.add_argument("--ors-latency-ms", type=float, default=300.0, help="ORSのスタブの遅延（ミリ秒）")
+    parser.add_argument("--latency-jitter", type=float, default=0.2, help="スタブの遅延のばらつき（割合）")
+    parser.add_argument("--overpass-payload", help="Overpassのスタブが返すJSONファイル")
+    parser.add_argument("--ors-payload", help="ORSのスタブが返すレスポンスの雛形")
+    parser.add_argument("--base-url", help="起動済みのサーバーを計測する場合のURL")
+    parser.add_argument("--database-uri", help="アプリをこのプロセスで起動する場合のデータベース（既定は一時的なSQLite）")
+    parser.add_argument("--label", default="", help="結果に付けるラベル")
+    parser.add_argument("--output-dir", default=RESULTS_DIR, help="結果を保存するディレクトリ")
+    parser.add_argument("--baseline", help="比較する結果のファイル（既定は保存済みの最新の結果）")
+    parser.add_argument("--regression-threshold", type=float, default=0.2, help="p95の悪化をリグレッションとする割合")
+    parser.add_argument("--fail-on-regression", action="store_true", help="リグレッションがあれば終了コード1で終わる")
+    parser.add_argument("--seed", type=int, default=0, help="リクエストを作る乱数のシード")
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    overpass, ors = start_stub_servers(
+        args.overpass_latency_ms, args.ors_latency_ms, args.latency_jitter,
+        overpass_payload=args.overpass_payload, ors_payload=args.ors_payload
+    )
+    workdir = tempfile.mkdtemp(prefix="gpsketch-bench-")
+    server = None
+    try:
+        base_url = args.base_url
+        if base_url is None:
+            # アプリを読み込む前に接続先とキャッシュの保存先を切り替える
+            os.environ["OVERPASS_URL"] = overpass.url + "/api/interpreter"
+            os.environ["ORS_BASE_URL"] = ors.url
+            os.environ.setdefault("ORS_API_KEY", "bench")
+            os.environ["POI_CACHE_PATH"] = os.path.join(workdir, "poi_cache.sqlite3")
+            database_uri = args.database_uri or f"sqlite:///{os.path.join(workdir, 'bench.sqlite3')}?timeout=30"
+            base_url, server = start_local_app(database_uri)
+        print(f"target: {base_url}  overpass stub: {overpass.url}  ors stub: {ors.url}")
+
+        driver = LoadDriver(base_url, args.concurrency)
+        rng = np.random.default_rng(args.seed)
+        results = {}
+        route_ids = []
+
+        if "generate" in scenarios:
+            responses, elapsed = driver.run(generate_requests(args.requests, rng, args.jitter_m, args.candidates))
+            results["generate"] = summarize(responses, elapsed)
+            route_ids = [response.json()["route_id"] for _, status, response in responses if status == 200]
+
+        if ("route" in scenarios or "runs" in scenarios) and not route_ids:
+            # 取得するルートを先に作っておく（計測には含めない）
+            seeded, _ = driver.run(generate_requests(min(args.requests, 10), rng, args.jitter_m, 1))
+            route_ids = [response.json()["route_id"] for _, status, response in seeded if status == 200]
+        if ("route" in scenarios or "runs" in scenarios) and not route_ids:
+            print("ルートを生成できなかったため、route / runs シナリオを計測できません", file=sys.stderr)
+            return 1
+
+        if "route" in scenarios:
+            items = [("GET", f"/api/route/{route_ids[i % len(route_ids)]}", {
+                "headers": {"Accept-Encoding": "gzip"}
+            }) for i in range(args.requests)]
+            results["route"] = summarize(*driver.run(items))
+
+        if "runs" in scenarios:
+            seeded = seed_runs(driver, route_ids, args.seed_runs)
+            if seeded < args.seed_runs:
+                print(f"ランの登録に失敗しました（{seeded}/{args.seed_runs}件を登録）", file=sys.stderr)
+            items = [("GET", "/api/runs?limit=50", {}) for _ in range(args.requests)]
+            results["runs"] = summarize(*driver.run(items))
+
+        report = {
+            "label": args.label,
+            "git_revision": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "config": {
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "candidates": args.candidates,
+                "overpass_latency_ms": args.overpass_latency_ms,
+                "ors_latency_ms": args.ors_latency_ms,
+                "latency_jitter": args.latency_jitter,
+                "target": "external" if args.base_url else "in-process",
+            },
+            "results": results,
+            "route_stages": scrape_stages(base_url),
+            "upstream_requests": {"overpass": overpass.requests, "ors": ors.requests},
+        }
+    finally:
+        if server is not None:
+            server.shutdown()
+        overpass.stop()
+        ors.stop()
+
+    print_table(results)
+    if report["route_stages"]:
+        print("\nroute stages (mean ms): " + ", ".join(
+            f"{name}={stage['mean_ms']}" for name, stage in sorted(report["route_stages"].items())
+        ))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    name = datetime.now().strftime("%Y%m%d-%H%M%S")
+    if report["git_revision"]:
+        name += "-" + report["git_revision"]
+    if args.label:
+        name += "-" + re.sub(r"[^\w.-]+", "_", args.label)
+    path = os.path.join(args.output_dir, name + ".json")
+
+    baseline_path = args.baseline or latest_result(args.output_dir)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存しました: {path}")
+
+    if baseline_path and os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.regression_threshold)
+        if regressions:
+            print(f"p95 が {args.regression_threshold:.0%} 以上悪化: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Overpass・OpenRouteService のスタブサーバー
+記録したレスポンスを指定した遅延で返すローカルのHTTPサーバーです。
+OVERPASS_URL / ORS_BASE_URL をこのサーバーに向けると、APIの利用枠やネットワークの
+ばらつきに左右されずにルート生成を計測できます
+
+単体で起動する場合（backend ディレクトリで実行）:
+    python -m bench.stub_servers --overpass-port 18001 --ors-port 18002
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from utils import geodesy
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+ORS_STEP_M = 25.0           # 合成する経路の点の間隔（メートル）
+ORS_SPEED_MPS = 1.4         # 所要時間の計算に使う歩行速度
+
+
+class StubServer:
+    """
+    別スレッドで動くスタブサーバー
+
+    レスポンスを返す前に latency_ms ± jitter の時間だけ待つ（リクエストは並行に処理する）
+    """
+
+    def __init__(self, respond, port=0, latency_ms=0.0, jitter=0.0, host="127.0.0.1"):
+        """
+        Args:
+            respond: (パス, リクエストボディ) を受け取り (ステータスコード, レスポンスボディ) を返す関数
+            port: 待ち受けるポート（0なら空いているポート）
+            latency_ms: 応答までの遅延（ミリ秒）
+            jitter: 遅延のばらつき（割合、0.2なら ±20%）
+        """
+        self.respond = respond
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                server._delay()
+                status, payload = server.respond(self.path, body)
+                with server._lock:
+                    server.requests += 1
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                # リクエストごとのアクセスログは出さない
+                pass
+
+        return Handler
+
+    def _delay(self):
+        """設定した遅延だけ待つ"""
+        if self.latency_ms <= 0:
+            return
+        factor = 1.0 + random.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, self.latency_ms * factor) / 1000)
+
+    def start(self):
+        """バックグラウンドのスレッドで待ち受けを始める"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """待ち受けを止める"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _load_payload(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def overpass_responder(payload_path=None):
+    """
+    記録したOverpassのレスポンスをそのまま返す
+
+    クエリの検索範囲では絞らない（範囲外の要素はルート生成側で距離により除かれる）
+    """
+    body = json.dumps(
+        _load_payload(payload_path or os.path.join(PAYLOAD_DIR, "overpass.json")), ensure_ascii=False
+    ).encode("utf-8")
+
+    def respond(path, request_body):
+        return 200, body
+
+    return respond
+
+
+def ors_responder(payload_path=None, step_m=ORS_STEP_M):
+    """
+    記録したORSのレスポンスを雛形に、経由地点を直線で結んだ経路を返す
+
+    座標列・区間（segments）・way_points・距離は、リクエストされた経由地点から作る。
+    それ以外の項目（metadata など）は記録したレスポンスのまま
+    """
+    template = _load_payload(payload_path or os.path.join(PAYLOAD_DIR, "ors.json"))
+
+    def respond(path, request_body):
+        try:
+            coordinates = json.loads(request_body)["coordinates"]
+        except (ValueError, KeyError, TypeError):
+            return 400, b'{"error": {"code": 2000, "message": "Unable to parse JSON request."}}'
+        if len(coordinates) < 2:
+            return 400, b'{"error": {"code": 2003, "message": "Need at least 2 coordinates."}}'
+
+        lngs = np.array([c[0] for c in coordinates], dtype=float)
+        lats = np.array([c[1] for c in coordinates], dtype=float)
+        leg_m = geodesy.haversine(lats[:-1], lngs[:-1], lats[1:], lngs[1:]) * 1000
+
+        # 区間ごとに step_m 間隔で点を補う
+        line = []
+        segments = []
+        for i, length in enumerate(leg_m):
+            pieces = max(1, int(np.ceil(length / step_m)))
+            start = len(line) - 1 if line else 0
+            t = np.arange(0 if not line else 1, pieces + 1) / pieces
+            line.extend(
+                [round(float(lng), 6), round(float(lat), 6)]
+                for lng, lat in zip(lngs[i] + t * (lngs[i + 1] - lngs[i]), lats[i] + t * (lats[i + 1] - lats[i]))
+            )
+            segments.append({
+                "distance": round(float(length), 1),
+                "duration": round(float(length) / ORS_SPEED_MPS, 1),
+                "steps": [{
+                    "distance": round(float(length), 1),
+                    "duration": round(float(length) / ORS_SPEED_MPS, 1),
+                    "type": 11 if i == 0 else 6,
+                    "instruction": "Head straight",
+                    "name": "-",
+                    "way_points": [start, len(line) - 1]
+                }]
+            })
+
+        response = copy.deepcopy(template)
+        feature = response["features"][0]
+        feature["geometry"]["coordinates"] = line
+        feature["bbox"] = [float(lngs.min()), float(lats.min()), float(lngs.max()), float(lats.max())]
+        response["bbox"] = feature["bbox"]
+        properties = feature["properties"]
+        properties["segments"] = segments
+        properties["way_points"] = [segment["steps"][0]["way_points"][0] for segment in segments] + [len(line) - 1]
+        properties["summary"] = {
+            "distance": round(float(leg_m.sum()), 1),
+            "duration": round(float(leg_m.sum()) / ORS_SPEED_MPS, 1)
+        }
+        response.setdefault("metadata", {}).setdefault("query", {})["coordinates"] = coordinates
+        return 200, json.dumps(response).encode("utf-8")
+
+    return respond
+
+
+def start_stub_servers(overpass_latency_ms=0.0, ors_latency_ms=0.0, jitter=0.0,
+                       overpass_port=0, ors_port=0, overpass_payload=None, ors_payload=None):
+    """
+    OverpassとORSのスタブサーバーを起動
+
+    Returns:
+        (Overpassのスタブ, ORSのスタブ)。OVERPASS_URL は overpass.url + "/api/interpreter"、
+        ORS_BASE_URL は ors.url に設定する
+    """
+    overpass = StubServer(overpass_responder(overpass_payload), overpass_port, overpass_latency_ms, jitter).start()
+    ors = StubServer(ors_responder(ors_payload), ors_port, ors_latency_ms, jitter).start()
+    return overpass, ors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Overpass・ORSのスタブサーバーを起動します")
+    parser.add_argument("--overpass-port", type=int, default=18001, help="Overpassのスタブのポート")
+    parser.add_argument("--ors-port", type=int, default=18002, help="ORSのスタブのポート")
+    parser.add_argument("--overpass-latency-ms", type=float, default=800.0, help="Overpassの応答の遅延（ミリ秒）")
+    parser.add_argument("--ors-latency-ms", type=float, default=300.0, help="ORSの応答の遅延（ミリ秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="遅延のばらつき（割合）")
+    parser.add_argument("--overpass-payload", help="Overpassのレスポンスとして返すJSONファイル")
+    parser.add_argument("--ors-payload", help="ORSのレスポンスの雛形にするJSONファイル")
+    args = parser.parse_args()
+
+    overpass, ors = start_stub_servers(
+        args.overpass_latency_ms, args.ors_latency_ms, args.jitter,
+        args.overpass_port, args.ors_port, args.overpass_payload, args.ors_payload
+    )
+    print(f"OVERPASS_URL={overpass.url}/api/interpreter")
+    print(f"ORS_BASE_URL={ors.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        overpass.stop()
+        ors.stop()
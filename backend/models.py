@@ -6,15 +6,24 @@ db = SQLAlchemy()
 
 class Route(db.Model):
     __tablename__ = 'routes'
+    __table_args__ = (
+        db.Index('idx_routes_animal_name', 'animal_name'),
+        db.Index('idx_routes_created_at', 'created_at'),
+        # 出発地点の近いルートの検索（ジオハッシュの前方一致）
+        db.Index('idx_routes_start_geohash', 'start_geohash', 'animal_name'),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    animal_name = db.Column(db.Text, nullable=False)
+    animal_name = db.Column(db.String(64), nullable=False)
     distance_km = db.Column(db.Float, nullable=False)
     actual_route_distance_km = db.Column(db.Float)
+    straight_distance_km = db.Column(db.Float)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     route_geojson = db.Column(JSON)
     stat_end_latitude = db.Column(db.Float)
     stat_end_longitude = db.Column(db.Float)
+    # 出発地点のジオハッシュ（9文字）
+    start_geohash = db.Column(db.String(12))
     image_url = db.Column(db.Text)
     image_bounds = db.Column(JSON)
 
@@ -22,6 +31,16 @@ class Route(db.Model):
 
 class Run(db.Model):
     __tablename__ = 'runs'
+    __table_args__ = (
+        # ラン履歴のキーセットページング（start_time, id の降順）用
+        db.Index('idx_runs_start_time_id', 'start_time', 'id'),
+        # ルートとの結合と、期間で絞った集計をインデックスだけで行う
+        db.Index('idx_runs_route_id_start_time', 'route_id', 'start_time'),
+        db.Index(
+            'idx_runs_start_time_stats',
+            'start_time', 'route_id', 'actual_distance_km', 'pace_min_per_km', 'calories'
+        ),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     route_id = db.Column(db.String(36), db.ForeignKey('routes.id'), nullable=False)
@@ -31,16 +50,31 @@ class Run(db.Model):
     pace_min_per_km = db.Column(db.Float)
     calories = db.Column(db.Integer)
     track_geojson = db.Column(JSON)
+    # 軌跡から計算した指標（{"state": 計算途中の状態, "summary": 完了時の集計結果}）
+    metrics = db.Column(JSON)
+    # 予定ルートに対する追従度（なぞれた割合・最大のずれ・ルートを外れた区間）
+    adherence = db.Column(JSON)
 
     track_points = db.relationship('TrackPoint', backref='run', lazy=True)
 
 class TrackPoint(db.Model):
     __tablename__ = 'track_points'
+    # ランごとの通し番号で並べて読み出す
+    __table_args__ = (db.UniqueConstraint('run_id', 'seq', name='uq_track_points_run_seq'),)
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    route_id = db.Column(db.String(36), db.ForeignKey('runs.id'), nullable=False)
+    run_id = db.Column(db.String(36), db.ForeignKey('runs.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
     timestamp = db.Column(db.DateTime)
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
     distance_from_start = db.Column(db.Float)
     route_index = db.Column(db.Integer)
+
+class DetourEstimate(db.Model):
+    __tablename__ = 'detour_estimates'
+
+    cell = db.Column(db.String(12), primary_key=True)
+    factor = db.Column(db.Float, nullable=False)
+    samples = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
@@ -0,0 +1,263 @@
+"""
+ルート追従度の評価モジュール
+ランの軌跡の各点を予定ルート（ORSの経路の線）の最も近い線分に対応づけ、
+ルートをどれだけなぞれたか・最大のずれ・ルートを外れた区間を求めます。
+線分は一様グリッドに登録しておき、各点は周囲のセルの線分とだけ距離を計算します。
+許容距離以内に線分がない点は、セルの大きいグリッドでもう一度だけ探します
+"""
+
+import json
+import os
+
+import numpy as np
+
+from models import db, Route, TrackPoint
+from services.geometry_service import expand_geojson, line_coordinates
+from utils import geodesy
+
+ADHERENCE_TOLERANCE_M = float(os.getenv("ADHERENCE_TOLERANCE_M", "30"))  # ルート上とみなす距離（メートル）
+ADHERENCE_MAX_GAP_M = 200.0      # ルート上の連続する2点の間をなぞったとみなすルート上の距離の上限
+ADHERENCE_MAX_STRETCHES = 50     # 返すルート外の区間の数の上限
+ADHERENCE_FAR_CELL_M = 500.0     # ルートから離れた点のずれを求める範囲（これより遠い点のずれはこの値にする）
+FAR_POINTS_CHUNK = 4096          # 離れた点の候補の組を一度に作る点数
+
+
+class SegmentGrid:
+    """
+    線分を一様グリッドに登録した空間インデックス
+
+    セルの大きさは許容距離と同じにして、点から許容距離以内にある線分は
+    その点のセルと周囲8セルのどれかに必ず登録されているようにする。
+    線分はセルの大きさ以下に分割してから渡すこと（外接矩形が最大2x2セルになる）
+    """
+
+    def __init__(self, ax, ay, bx, by, cell_size):
+        self.ax, self.ay, self.bx, self.by = ax, ay, bx, by
+        self.cell_size = cell_size
+
+        # 各線分の外接矩形が重なるセルに登録する
+        x0 = np.floor(np.minimum(ax, bx) / cell_size).astype(np.int64)
+        x1 = np.floor(np.maximum(ax, bx) / cell_size).astype(np.int64)
+        y0 = np.floor(np.minimum(ay, by) / cell_size).astype(np.int64)
+        y1 = np.floor(np.maximum(ay, by) / cell_size).astype(np.int64)
+        widths = x1 - x0 + 1
+        heights = y1 - y0 + 1
+        counts = widths * heights
+
+        segments = np.repeat(np.arange(len(ax)), counts)
+        # 線分ごとの矩形内でのセルの番号
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = np.repeat(x0, counts) + local % np.repeat(widths, counts)
+        cy = np.repeat(y0, counts) + local // np.repeat(widths, counts)
+
+        keys = self._key(cx, cy)
+        order = np.argsort(keys, kind='stable')
+        self.keys, starts = np.unique(keys[order], return_index=True)
+        self.starts = starts
+        self.ends = np.append(starts[1:], len(order))
+        self.segments = segments[order]
+
+    @staticmethod
+    def _key(cx, cy):
+        """セルの座標を1つの整数にまとめる"""
+        return (cx + (1 << 31)) * (1 << 32) + (cy + (1 << 31))
+
+    def candidates(self, px, py):
+        """
+        各点の周囲3x3セルに登録された線分の組を求める
+
+        Returns:
+            (点の番号の配列, 線分の番号の配列)
+        """
+        cx = np.floor(px / self.cell_size).astype(np.int64)
+        cy = np.floor(py / self.cell_size).astype(np.int64)
+        dx, dy = np.meshgrid([-1, 0, 1], [-1, 0, 1])
+        keys = self._key((cx[:, None] + dx.ravel()).ravel(), (cy[:, None] + dy.ravel()).ravel())
+        points = np.repeat(np.arange(len(px)), 9)
+
+        slot = np.searchsorted(self.keys, keys)
+        slot = np.minimum(slot, len(self.keys) - 1)
+        found = self.keys[slot] == keys
+        points, slot = points[found], slot[found]
+
+        counts = self.ends[slot] - self.starts[slot]
+        pair_points = np.repeat(points, counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_segments = self.segments[np.repeat(self.starts[slot], counts) + local]
+        return pair_points, pair_segments
+
+
+def _densify(x, y, max_length):
+    """折れ線の各線分を max_length 以下の長さに等分した点列"""
+    lengths = np.hypot(np.diff(x), np.diff(y))
+    pieces = np.maximum(1, np.ceil(lengths / max_length)).astype(np.int64)
+    segment = np.repeat(np.arange(len(lengths)), pieces)
+    t = (np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces)) / np.repeat(pieces, pieces)
+    dense_x = np.append(x[segment] + t * (x[segment + 1] - x[segment]), x[-1])
+    dense_y = np.append(y[segment] + t * (y[segment + 1] - y[segment]), y[-1])
+    return dense_x, dense_y
+
+
+def _point_segment_distance(px, py, ax, ay, bx, by):
+    """点から線分までの距離と、線分上の最も近い位置（0〜1）"""
+    dx = bx - ax
+    dy = by - ay
+    length_sq = dx * dx + dy * dy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(length_sq > 0, ((px - ax) * dx + (py - ay) * dy) / length_sq, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy)), t
+
+
+def _merged_length(starts, ends):
+    """区間 [start, end] の和集合の長さ"""
+    if len(starts) == 0:
+        return 0.0
+    order = np.argsort(starts)
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+    # 前までの区間の右端より後ろから始まる区間が新しいまとまりの始まり
+    new_group = np.concatenate([[True], starts[1:] > ends[:-1]])
+    group = np.cumsum(new_group) - 1
+    group_starts = starts[new_group]
+    group_ends = np.zeros(group[-1] + 1)
+    np.maximum.at(group_ends, group, ends)
+    return float((group_ends - group_starts).sum())
+
+
+def score_adherence(route_coordinates, track_lats, track_lons, tolerance_m=None):
+    """
+    ランの軌跡が予定ルートをどれだけなぞったかを評価
+
+    Args:
+        route_coordinates: 予定ルートの [[lng, lat], ...] 形式の座標列
+        track_lats, track_lons: 軌跡の緯度・経度の配列（記録順）
+        tolerance_m: ルート上とみなす距離（メートル、省略時は ADHERENCE_TOLERANCE_M）
+
+    Returns:
+        {"coverage_percent": ルートのうちなぞった長さの割合,
+         "on_route_percent": 軌跡の点のうちルート上にある割合,
+         "max_deviation_m": ルートから最も離れた点の距離（ADHERENCE_FAR_CELL_M が上限）,
+         "off_route": [{"start_index", "end_index", "length_m", "max_deviation_m", "start", "end"}, ...]}
+        ルートか軌跡の点が足りない場合はNone
+    """
+    tolerance_m = ADHERENCE_TOLERANCE_M if tolerance_m is None else tolerance_m
+    route = np.asarray(route_coordinates, dtype=float)
+    track_lats = np.asarray(track_lats, dtype=float)
+    track_lons = np.asarray(track_lons, dtype=float)
+    if route.ndim != 2 or len(route) < 2 or len(track_lats) == 0:
+        return None
+
+    # ルートの中心を基準に平面座標（メートル）へ投影する
+    lat0, lon0 = route[:, 1].mean(), route[:, 0].mean()
+    rx, ry = geodesy.local_xy(route[:, 1], route[:, 0], lat0, lon0)
+    rx, ry = _densify(rx, ry, tolerance_m)
+    px, py = geodesy.local_xy(track_lats, track_lons, lat0, lon0)
+    ax, ay, bx, by = rx[:-1], ry[:-1], rx[1:], ry[1:]
+    seg_lengths = np.hypot(bx - ax, by - ay)
+    seg_chainage = np.concatenate([[0.0], np.cumsum(seg_lengths)])  # 各線分の始点までのルート上の距離
+    route_length = seg_chainage[-1]
+
+    # 周囲のセルの線分とだけ距離を計算し、点ごとの最小を求める
+    grid = SegmentGrid(ax, ay, bx, by, tolerance_m)
+    pair_points, pair_segments = grid.candidates(px, py)
+    distances, ts = _point_segment_distance(
+        px[pair_points], py[pair_points],
+        ax[pair_segments], ay[pair_segments], bx[pair_segments], by[pair_segments]
+    )
+    # 点ごとに距離の最も小さい組を選ぶ
+    order = np.lexsort((distances, pair_points))
+    sorted_points = pair_points[order]
+    best = order[np.concatenate([[True], sorted_points[1:] != sorted_points[:-1]])[:len(order)]]
+
+    deviation = np.full(len(px), np.inf)
+    chainage = np.full(len(px), np.nan)
+    deviation[pair_points[best]] = distances[best]
+    chainage[pair_points[best]] = seg_chainage[pair_segments[best]] + ts[best] * seg_lengths[pair_segments[best]]
+
+    # 許容距離以内に線分がない点は、セルの大きいグリッドの周囲の線分と比べてずれを求める。
+    # ADHERENCE_FAR_CELL_M 以内に線分がない点はそれ以上探さず、ずれを ADHERENCE_FAR_CELL_M とする
+    far = np.flatnonzero(deviation > tolerance_m)
+    if len(far):
+        far_cell_m = max(ADHERENCE_FAR_CELL_M, tolerance_m)
+        coarse = SegmentGrid(ax, ay, bx, by, far_cell_m)
+        for start in range(0, len(far), FAR_POINTS_CHUNK):
+            idx = far[start:start + FAR_POINTS_CHUNK]
+            far_points, far_segments = coarse.candidates(px[idx], py[idx])
+            d, _ = _point_segment_distance(
+                px[idx][far_points], py[idx][far_points],
+                ax[far_segments], ay[far_segments], bx[far_segments], by[far_segments]
+            )
+            far_deviation = np.full(len(idx), far_cell_m)
+            np.minimum.at(far_deviation, far_points, d)
+            deviation[idx] = far_deviation
+
+    on_route = deviation <= tolerance_m
+
+    # ルート上の連続する2点の間のルートをなぞったとみなし、なぞった長さを求める
+    on_idx = np.flatnonzero(on_route)
+    c = chainage[on_idx]
+    starts = c - tolerance_m
+    ends = c + tolerance_m
+    consecutive = (np.diff(on_idx) == 1) & (np.abs(np.diff(c)) <= ADHERENCE_MAX_GAP_M)
+    starts = np.concatenate([starts, np.minimum(c[:-1], c[1:])[consecutive]])
+    ends = np.concatenate([ends, np.maximum(c[:-1], c[1:])[consecutive]])
+    covered = _merged_length(np.clip(starts, 0, route_length), np.clip(ends, 0, route_length))
+
+    # ルートを外れた点が続く区間
+    step_lengths = np.concatenate([[0.0], np.hypot(np.diff(px), np.diff(py))])
+    off = (~on_route).astype(np.int8)
+    edges = np.diff(np.concatenate([[0], off, [0]]))
+    stretch_starts = np.flatnonzero(edges == 1)
+    stretch_ends = np.flatnonzero(edges == -1) - 1
+    stretches = []
+    for s, e in zip(stretch_starts[:ADHERENCE_MAX_STRETCHES], stretch_ends[:ADHERENCE_MAX_STRETCHES]):
+        stretches.append({
+            "start_index": int(s),
+            "end_index": int(e),
+            "length_m": round(float(step_lengths[s + 1:e + 1].sum()), 1),
+            "max_deviation_m": round(float(deviation[s:e + 1].max()), 1),
+            "start": [float(track_lons[s]), float(track_lats[s])],
+            "end": [float(track_lons[e]), float(track_lats[e])],
+        })
+
+    return {
+        "coverage_percent": round(100.0 * covered / route_length, 1) if route_length > 0 else 0.0,
+        "on_route_percent": round(100.0 * on_route.mean(), 1),
+        "max_deviation_m": round(float(deviation.max()), 1),
+        "off_route_count": int(len(stretch_starts)),
+        "off_route": stretches,
+    }
+
+
+def run_adherence(run):
+    """
+    ランの記録済みの軌跡と予定ルートから追従度を計算
+
+    Args:
+        run: Run
+
+    Returns:
+        score_adherence の結果（ルートか記録した軌跡の点がない場合はNone）
+    """
+    route = db.session.get(Route, run.route_id)
+    if route is None:
+        return None
+    route_geojson = route.route_geojson
+    if isinstance(route_geojson, str):
+        route_geojson = json.loads(route_geojson)
+    route_coordinates = line_coordinates(expand_geojson(route_geojson))
+    if not route_coordinates:
+        return None
+
+    rows = (
+        db.session.query(TrackPoint.latitude, TrackPoint.longitude)
+        .filter(TrackPoint.run_id == run.id)
+        .order_by(TrackPoint.seq)
+        .all()
+    )
+    # 軌跡の点を記録していないランは評価しない（以前のランの track_geojson は予定ルートの線）
+    if not rows:
+        return None
+    lats, lons = zip(*rows)
+
+    return score_adherence(route_coordinates, lats, lons)
@@ -0,0 +1,67 @@
+"""
+プロセス内キャッシュモジュール
+外部APIの結果などを保持する、スレッドセーフなサイズ上限付きLRUキャッシュを提供します
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    サイズ上限付きのLRUキャッシュ
+    
+    上限を超えると最も長く参照されていないエントリから削除する。
+    ヒット数・ミス数・削除数を記録する
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """キーに対応する値を取得（見つからなければdefault）"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def peek(self, key, default=None):
+        """ヒット・ミスの記録や順序の更新をせずに値を取得"""
+        with self._lock:
+            return self._data.get(key, default)
+
+    def put(self, key, value):
+        """値を登録し、上限を超えた分を古い順に削除"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """全エントリを削除"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """キャッシュの統計情報を返す"""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,126 @@
+"""
+迂回係数の学習モジュール
+生成したルートの「ORSの実距離 ÷ 経由地点の直線距離」を地域（ジオハッシュのセル）ごとに記録し、
+次に同じ地域でルートを作るときの図形の縮尺に使います
+"""
+
+import logging
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, DetourEstimate
+from services.route_service import DEFAULT_DETOUR_FACTOR
+from utils import geohash
+
+logger = logging.getLogger(__name__)
+
+DETOUR_CELL_PRECISION = 5   # セルのジオハッシュ文字数（5で約5km四方）
+DETOUR_PRIOR_WEIGHT = 2     # 既定値を何サンプル分として扱うか
+DETOUR_WINDOW = 50          # 平均に効かせるサンプル数の上限（以降は指数移動平均）
+DETOUR_MIN = 1.0            # 1サンプルとして採用する比率の範囲
+DETOUR_MAX = 3.0
+
+
+def detour_cell(lat, lon):
+    """緯度経度が属するセルのジオハッシュ"""
+    return geohash.encode(lat, lon, DETOUR_CELL_PRECISION)
+
+
+def get_detour_factor(lat, lon):
+    """
+    地域の迂回係数の推定値を取得
+    
+    Args:
+        lat: 緯度
+        lon: 経度
+        
+    Returns:
+        迂回係数（記録がない地域は既定値）
+    """
+    estimate = db.session.get(DetourEstimate, detour_cell(lat, lon))
+    if estimate is None:
+        return DEFAULT_DETOUR_FACTOR
+    return estimate.factor
+
+
+def _upsert_statement(cell, ratio):
+    """
+    セルの推定値にサンプルを加えるINSERT（既にあればUPDATE）文
+
+    読んでから書くと同時に作ったルートのサンプルが上書きされたり、新しいセルで主キーが
+    重複したりするので、更新はデータベースの1文で行う
+
+    Returns:
+        INSERT文。1文で更新する構文がないデータベース（MySQL・SQLite以外）ではNone
+    """
+    prior_samples = DETOUR_PRIOR_WEIGHT + 1
+    # 新しいセルは既定値を事前サンプルとした最初の平均
+    first_factor = DEFAULT_DETOUR_FACTOR + (ratio - DEFAULT_DETOUR_FACTOR) / min(prior_samples, DETOUR_WINDOW)
+
+    table = DetourEstimate.__table__
+    current = table.c
+    dialect = db.session.get_bind().dialect.name
+    insert = {"mysql": mysql_insert, "sqlite": sqlite_insert}.get(dialect)
+    if insert is None:
+        return None
+    statement = insert(table).values(cell=cell, factor=first_factor, samples=1)
+
+    # 既定値を事前サンプルとした平均。サンプルが増えたら直近を重視する
+    weight_count = case(
+        (current.samples + prior_samples < DETOUR_WINDOW, current.samples + prior_samples),
+        else_=DETOUR_WINDOW
+    )
+    new_factor = current.factor + (ratio - current.factor) / weight_count
+
+    if dialect == "mysql":
+        # MySQL は左から順に代入し、後の式は更新後の値を参照するので factor を先に更新する
+        return statement.on_duplicate_key_update([
+            ("factor", new_factor),
+            ("samples", current.samples + 1),
+            ("updated_at", func.now()),
+        ])
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.cell],
+        set_={"factor": new_factor, "samples": current.samples + 1, "updated_at": func.now()}
+    )
+
+
+def record_detour_sample(lat, lon, straight_km, actual_km):
+    """
+    生成したルートの迂回係数を地域の推定値に反映（コミットは呼び出し側で行う）
+    
+    更新はセーブポイントの中で行い、失敗してもログを出すだけで呼び出し側のトランザクションは続けられる
+    
+    Args:
+        lat: 出発地点の緯度
+        lon: 出発地点の経度
+        straight_km: 経由地点を結んだ多角形の直線距離（km）
+        actual_km: ORSが返した実際の距離（km）
+        
+    Returns:
+        更新後の迂回係数。サンプルとして使えない・更新に失敗した場合はNone
+    """
+    if not straight_km or not actual_km or straight_km <= 0:
+        return None
+    
+    ratio = min(max(actual_km / straight_km, DETOUR_MIN), DETOUR_MAX)
+    cell = detour_cell(lat, lon)
+    
+    statement = _upsert_statement(cell, ratio)
+    if statement is None:
+        # サンプルの記録は必須ではないので、ルートの保存は続ける
+        logger.warning(f"Detour sample was not recorded: unsupported database {db.session.get_bind().dialect.name}")
+        return None
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(statement)
+            # セッションに読み込み済みの推定値も更新後の値で読み直す
+            estimate = db.session.get(DetourEstimate, cell, populate_existing=True)
+    except SQLAlchemyError as e:
+        logger.warning(f"Detour sample was not recorded: {e}")
+        return None
+    return estimate.factor
@@ -0,0 +1,172 @@
+"""
+経路ジオメトリの圧縮保存モジュール
+ルート（routes.route_geojson）と走行軌跡（runs.track_geojson）のLineStringを、
+許容誤差の範囲で間引いてエンコード済みポリラインの文字列で保存し、読み出し時に元のGeoJSONの形へ戻します
+"""
+
+import copy
+import os
+
+import numpy as np
+
+from utils import polyline
+
+# 保存時のエンコード（"polyline6": エンコード済みポリライン、"none": GeoJSONのまま保存）
+GEOMETRY_ENCODING = os.getenv("GEOMETRY_ENCODING", "polyline6")
+GEOMETRY_PRECISION = 6  # polyline6 の小数点以下の桁数（約0.1m）
+GEOMETRY_TOLERANCE_M = float(os.getenv("GEOMETRY_TOLERANCE_M", "2.0"))  # 間引きの許容誤差（メートル）
+
+
+def compact_geojson(geojson, tolerance_m=None, encoding=None):
+    """
+    GeoJSONに含まれるLineStringを圧縮した形式に変換
+
+    ORSの経路（Feature）では、区間・ステップの way_points が指す点は間引かずに残し、
+    番号を間引き後の座標列に合わせて付け替える
+
+    Args:
+        geojson: LineString / Feature / FeatureCollection（features が辞書の場合も含む）
+        tolerance_m: 間引きの許容誤差（メートル、省略時は GEOMETRY_TOLERANCE_M）
+        encoding: エンコード（省略時は GEOMETRY_ENCODING）
+
+    Returns:
+        圧縮したGeoJSON（元のオブジェクトは変更しない）
+    """
+    encoding = encoding or GEOMETRY_ENCODING
+    if encoding == "none" or not isinstance(geojson, dict):
+        return geojson
+    if encoding != "polyline6":
+        raise ValueError(f"Unknown geometry encoding: {encoding}")
+    tolerance_m = GEOMETRY_TOLERANCE_M if tolerance_m is None else tolerance_m
+
+    geojson_type = geojson.get("type")
+    if geojson_type == "LineString":
+        compacted, _ = _compact_line(geojson, tolerance_m)
+        return compacted
+    if geojson_type == "Feature":
+        return _compact_feature(geojson, tolerance_m)
+    if geojson_type == "FeatureCollection":
+        features = geojson.get("features")
+        result = dict(geojson)
+        if isinstance(features, dict):
+            result["features"] = compact_geojson(features, tolerance_m, encoding)
+        elif isinstance(features, list):
+            result["features"] = [compact_geojson(feature, tolerance_m, encoding) for feature in features]
+        return result
+    return geojson
+
+
+def expand_geojson(geojson):
+    """
+    compact_geojson で圧縮したGeoJSONを、座標の配列を持つ通常のGeoJSONに戻す
+
+    圧縮されていない（以前に保存された）GeoJSONはそのまま返す
+
+    Args:
+        geojson: 圧縮したGeoJSON
+
+    Returns:
+        通常のGeoJSON
+    """
+    if not isinstance(geojson, dict):
+        return geojson
+
+    geojson_type = geojson.get("type")
+    if geojson_type == "LineString":
+        if geojson.get("encoding") != "polyline6":
+            return geojson
+        expanded = {key: value for key, value in geojson.items() if key != "encoding"}
+        expanded["coordinates"] = polyline.decode(geojson["coordinates"], GEOMETRY_PRECISION)
+        return expanded
+    if geojson_type == "Feature":
+        geometry = geojson.get("geometry")
+        if not isinstance(geometry, dict) or geometry.get("encoding") is None:
+            return geojson
+        return dict(geojson, geometry=expand_geojson(geometry))
+    if geojson_type == "FeatureCollection":
+        features = geojson.get("features")
+        if isinstance(features, dict):
+            return dict(geojson, features=expand_geojson(features))
+        if isinstance(features, list):
+            return dict(geojson, features=[expand_geojson(feature) for feature in features])
+    return geojson
+
+
+def line_coordinates(geojson):
+    """
+    GeoJSON（LineString / Feature / FeatureCollection）から最初の線の座標列を取り出す
+
+    Returns:
+        [[lng, lat], ...] の座標列（見つからない場合はNone）
+    """
+    if not isinstance(geojson, dict):
+        return None
+    geojson_type = geojson.get("type")
+    if geojson_type == "LineString":
+        return geojson.get("coordinates")
+    if geojson_type == "Feature":
+        return line_coordinates(geojson.get("geometry"))
+    if geojson_type == "FeatureCollection":
+        features = geojson.get("features")
+        if isinstance(features, dict):
+            return line_coordinates(features)
+        if isinstance(features, list) and features:
+            return line_coordinates(features[0])
+    return None
+
+
+def _compact_line(geometry, tolerance_m, keep=()):
+    """LineStringを間引いてエンコードし、(圧縮したLineString, 残した点の番号) を返す"""
+    coordinates = geometry.get("coordinates")
+    if geometry.get("encoding") is not None or not _is_2d_line(coordinates):
+        return geometry, None
+
+    kept = polyline.simplify_indices(coordinates, tolerance_m, keep)
+    compacted = dict(geometry)
+    compacted["encoding"] = "polyline6"
+    compacted["coordinates"] = polyline.encode(np.asarray(coordinates, dtype=float)[kept], GEOMETRY_PRECISION)
+    return compacted, kept
+
+
+def _compact_feature(feature, tolerance_m):
+    """Featureのジオメトリを圧縮し、way_points の番号を付け替える"""
+    geometry = feature.get("geometry")
+    if not isinstance(geometry, dict) or geometry.get("type") != "LineString":
+        return feature
+
+    properties = copy.deepcopy(feature.get("properties") or {})
+    way_point_lists = _way_point_lists(properties)
+    keep = [index for way_points in way_point_lists for index in way_points]
+
+    compacted, kept = _compact_line(geometry, tolerance_m, keep)
+    if kept is None:
+        return feature
+
+    # 残した点の中での番号に付け替える（way_points の点は必ず残っている）
+    for way_points in way_point_lists:
+        way_points[:] = np.searchsorted(kept, way_points).tolist()
+
+    result = dict(feature, geometry=compacted)
+    if "properties" in feature:
+        result["properties"] = properties
+    return result
+
+
+def _way_point_lists(properties):
+    """ORSの経路のプロパティに含まれる way_points のリストを全て取り出す"""
+    lists = []
+    if isinstance(properties.get("way_points"), list):
+        lists.append(properties["way_points"])
+    for segment in properties.get("segments") or []:
+        for step in segment.get("steps") or []:
+            if isinstance(step.get("way_points"), list):
+                lists.append(step["way_points"])
+    return lists
+
+
+def _is_2d_line(coordinates):
+    """[[lng, lat], ...] の2次元座標列か（高さ付きの座標は圧縮しない）"""
+    return (
+        isinstance(coordinates, list) and len(coordinates) > 0
+        and all(isinstance(c, (list, tuple)) and len(c) == 2 for c in coordinates)
+    )
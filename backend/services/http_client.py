@@ -0,0 +1,172 @@
+"""
+外部API呼び出し用HTTPクライアントモジュール
+OverpassやOpenRouteServiceへのリクエストを、接続プール・タイムアウト・リトライ付きで実行します
+"""
+
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.metrics import upstream_request_seconds, upstream_requests_total
+
+# HTTPクライアント設定（環境変数で上書き可能）
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))  # 接続タイムアウト（秒）
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "20"))  # 読み込みタイムアウト（秒）
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))  # 初回を除く最大リトライ回数
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))  # バックオフの基準時間（秒）
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))  # バックオフの上限（秒）
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))  # ホストごとに保持するkeep-alive接続数
+HTTP_HOST_CONCURRENCY = int(os.getenv("HTTP_HOST_CONCURRENCY", "4"))  # ホストごとの同時リクエスト数の上限
+HTTP_TOTAL_TIMEOUT = float(os.getenv("HTTP_TOTAL_TIMEOUT", "30"))  # リトライを含めた1回の呼び出しの上限（秒）
+
+# リトライ対象のステータスコード
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+# 読み込みタイムアウトをリトライしてよいメソッド（POSTの重いクエリは再送しても同じだけかかる）
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS"])
+
+
+class HttpClient:
+    """
+    外部APIで共有するHTTPクライアント
+
+    keep-alive接続を使い回すセッションを持ち、ホストごとの同時リクエスト数を制限する。
+    接続エラー・タイムアウト・429/5xxはジッター付き指数バックオフでリトライする
+    """
+
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 max_retries=HTTP_MAX_RETRIES, backoff_base=HTTP_BACKOFF_BASE, backoff_max=HTTP_BACKOFF_MAX,
+                 pool_maxsize=HTTP_POOL_MAXSIZE, host_concurrency=HTTP_HOST_CONCURRENCY,
+                 total_timeout=HTTP_TOTAL_TIMEOUT):
+        self.timeout = (connect_timeout, read_timeout)
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.host_concurrency = host_concurrency
+
+        # リトライはこのクラスで行うので、アダプタ側のリトライは無効にする
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    def _host_semaphore(self, url):
+        """ホストごとの同時リクエスト数を制限するセマフォを取得"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.host_concurrency)
+            return self._host_limits[host]
+
+    def _backoff(self, attempt, response=None):
+        """リトライまでの待ち時間（秒）を計算。Retry-Afterヘッダがあればそれに従う"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    try:
+                        delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                        return min(max(delay, 0.0), self.backoff_max)
+                    except (TypeError, ValueError):
+                        pass
+
+        # フルジッター：0〜指数バックオフの範囲でランダムに待つ
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _attempt_timeout(self, timeout, remaining):
+        """1回の試行のタイムアウト（締め切りまでの残り時間を超えない）"""
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        return (min(connect_timeout, remaining), min(read_timeout, remaining))
+
+    def request(self, method, url, service=None, deadline=None, retry_read_timeout=None, **kwargs):
+        """
+        リトライ付きでHTTPリクエストを送信
+
+        同時リクエスト数の制限による待ち・リトライ・バックオフの待ちも含めて deadline までに終える。
+        各試行のタイムアウトは締め切りまでの残り時間で切り詰め、待つと締め切りを過ぎる場合はリトライしない
+
+        Args:
+            method: HTTPメソッド
+            url: リクエスト先URL
+            service: 計測値に付ける外部APIの名前（省略時はホスト名）
+            deadline: 締め切りの時刻（time.monotonic() 基準、省略時は今から total_timeout 秒後）
+            retry_read_timeout: 読み込みタイムアウトをリトライするか（省略時はGETなど冪等なメソッドだけ）
+            **kwargs: requests.Session.request に渡す引数（timeout省略時は既定値）
+
+        Returns:
+            requests.Response（リトライ後も429/5xxの場合は最後のレスポンス）
+
+        Raises:
+            requests.RequestException: リトライ後も接続エラー・タイムアウトが続いた場合、
+                または締め切りを過ぎた場合（requests.Timeout）
+        """
+        timeout = kwargs.pop("timeout", self.timeout)
+        if deadline is None:
+            deadline = time.monotonic() + self.total_timeout
+        if retry_read_timeout is None:
+            retry_read_timeout = method.upper() in IDEMPOTENT_METHODS
+        semaphore = self._host_semaphore(url)
+        service = service or urlsplit(url).netloc
+
+        for attempt in range(self.max_retries + 1):
+            is_last = attempt == self.max_retries
+            try:
+                # 同時リクエスト数の制限による待ちも締め切りまでに限る
+                if not semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                    raise requests.Timeout(f"deadline exceeded while waiting to request {url}")
+                try:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise requests.Timeout(f"deadline exceeded before requesting {url}")
+                    # 同時リクエスト数の制限による待ちは含めず、外部APIの応答時間だけを計る
+                    with upstream_request_seconds.time(service=service):
+                        response = self.session.request(
+                            method, url, timeout=self._attempt_timeout(timeout, remaining), **kwargs
+                        )
+                finally:
+                    semaphore.release()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                upstream_requests_total.inc(service=service, status=type(e).__name__)
+                read_timed_out = isinstance(e, requests.ReadTimeout)
+                if is_last or (read_timed_out and not retry_read_timeout):
+                    raise
+                delay = self._backoff(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                time.sleep(delay)
+                continue
+
+            upstream_requests_total.inc(service=service, status=response.status_code)
+
+            if response.status_code in RETRY_STATUS_CODES and not is_last:
+                delay = self._backoff(attempt, response)
+                # 待つと締め切りを過ぎる場合は、最後のレスポンスをそのまま返す
+                if time.monotonic() + delay < deadline:
+                    time.sleep(delay)
+                    continue
+
+            return response
+
+    def get(self, url, **kwargs):
+        """GETリクエストを送信"""
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """POSTリクエストを送信"""
+        return self.request("POST", url, **kwargs)
+
+
+# アプリケーション全体で共有するクライアント
+http_client = HttpClient()
@@ -0,0 +1,134 @@
+"""
+バックグラウンドジョブモジュール
+時間のかかる処理を、待ち行列の長さとジョブごとの制限時間付きのワーカープールで実行し、
+ジョブIDで進捗と結果を問い合わせられるようにします
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    """待ち行列が上限に達していてジョブを受け付けられない"""
+
+
+class JobTimeoutError(Exception):
+    """ジョブが制限時間を超えた"""
+
+
+class JobQueue:
+    """
+    上限付きのジョブ実行キュー
+
+    ジョブ関数は第1引数に締め切り（time.monotonic() 基準の時刻）を受け取る。
+    関数側で副作用（DBへの保存など）の直前に締め切りを確認し、過ぎていれば JobTimeoutError を送出すること。
+    関数が正常に戻った場合は、締め切りを少し過ぎていても副作用は済んでいるので、
+    結果を記録して succeeded にする（保存したデータをクライアントが受け取れるように）
+    """
+
+    def __init__(self, name, max_workers=4, max_queue=32, timeout_sec=60.0, ttl_sec=600.0):
+        self.name = name
+        self.max_queue = max_queue
+        self.timeout_sec = timeout_sec
+        self.ttl_sec = ttl_sec
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-job")
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, job_id=None):
+        """
+        ジョブを登録
+
+        Args:
+            fn: 実行する関数 fn(deadline, *args)
+            *args: 関数に渡す引数
+            job_id: ジョブID（省略時はUUIDを発行）。同じIDのジョブが実行待ち・実行中なら
+                新しく登録せず、そのジョブのIDを返す
+
+        Returns:
+            ジョブID
+
+        Raises:
+            QueueFullError: 実行待ち・実行中のジョブ数が上限に達している場合
+        """
+        with self._lock:
+            self._purge_expired()
+            existing = self._jobs.get(job_id) if job_id else None
+            if existing is not None and existing["status"] in ("queued", "running"):
+                return job_id
+            if self._pending >= self.max_queue:
+                raise QueueFullError(f"{self.name} queue is full ({self.max_queue} jobs)")
+            job_id = job_id or str(uuid.uuid4())
+            now = time.monotonic()
+            self._jobs[job_id] = {
+                "id": job_id,
+                "status": "queued",
+                "result": None,
+                "error": None,
+                "created_at": now,
+                "deadline": now + self.timeout_sec,
+                "finished_at": None,
+            }
+            self._pending += 1
+
+        self._executor.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _run(self, job_id, fn, args):
+        """ワーカースレッドでジョブを実行し、状態を更新"""
+        job = self._jobs[job_id]
+        try:
+            if time.monotonic() > job["deadline"]:
+                raise JobTimeoutError("job timed out before it started")
+            job["status"] = "running"
+            result = fn(job["deadline"], *args)
+            job["result"] = result
+            job["status"] = "succeeded"
+        except JobTimeoutError as e:
+            job["error"] = str(e)
+            job["status"] = "timeout"
+        except Exception as e:
+            job["error"] = str(e)
+            job["status"] = "failed"
+        finally:
+            job["finished_at"] = time.monotonic()
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id):
+        """
+        ジョブの状態を取得
+
+        Args:
+            job_id: ジョブID
+
+        Returns:
+            {"id", "status", "result", "error"} の辞書。見つからない場合はNone
+            status は queued / running / succeeded / failed / timeout のいずれか。
+            timeout はジョブ関数が JobTimeoutError で終わった場合だけ返す
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+
+        # 制限時間を過ぎていても、ジョブ関数が終わるまでは queued / running のまま返す
+        # （締め切り後にまだ保存が済む可能性があり、timeout と返すと結果と食い違う）
+        return {"id": job["id"], "status": job["status"], "result": job["result"], "error": job["error"]}
+
+    def _purge_expired(self):
+        """終了してから保持期間を過ぎたジョブを削除（ロック取得済みで呼ぶ）"""
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and now - job["finished_at"] > self.ttl_sec
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        """待ち行列の状態を返す"""
+        with self._lock:
+            return {"pending": self._pending, "max_queue": self.max_queue, "jobs": len(self._jobs)}
@@ -0,0 +1,381 @@
+"""
+ローカル経路探索モジュール
+OpenStreetMapの抽出データ（.osm XML）から歩行者用の道路グラフを読み込み、
+外部APIを使わずに経由地点を順に通る最短経路を求めます。
+結果はOpenRouteServiceの foot-walking/geojson と同じ形のGeoJSONで返します。
+"""
+
+import heapq
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from utils import geodesy
+
+# 歩行者が通れる道路の種類
+PEDESTRIAN_HIGHWAYS = frozenset([
+    'footway', 'path', 'pedestrian', 'steps', 'living_street', 'residential',
+    'service', 'track', 'unclassified', 'tertiary', 'tertiary_link',
+    'secondary', 'secondary_link', 'primary', 'primary_link', 'cycleway', 'road',
+])
+WALKING_SPEED_MPS = 5.0 / 3.6  # ORSの foot-walking と同じ時速5km
+NODE_GRID_CELL_M = 250.0       # 最寄りノード検索のグリッドのセルの大きさ（メートル）
+
+
+class NodeGrid:
+    """
+    ノードを一様グリッドに登録した最寄りノード検索用の空間インデックス
+
+    ノードは基準点の周りの平面座標（メートル）に投影してセルに振り分ける。
+    検索は問い合わせ地点のセルから外側へ1周ずつ広げ、見つかったノードより近いノードが
+    それより外側のセルにないと分かった時点で打ち切る
+    """
+
+    def __init__(self, lats, lons, cell_size=NODE_GRID_CELL_M):
+        self.lat0 = float(np.mean(lats))
+        self.lon0 = float(np.mean(lons))
+        self.cell_size = cell_size
+        self.x, self.y = geodesy.local_xy(lats, lons, self.lat0, self.lon0)
+
+        cx = np.floor(self.x / cell_size).astype(np.int64)
+        cy = np.floor(self.y / cell_size).astype(np.int64)
+        self.cx_range = (int(cx.min()), int(cx.max()))
+        self.cy_range = (int(cy.min()), int(cy.max()))
+        keys = self._key(cx, cy)
+        order = np.argsort(keys, kind='stable')
+        self.keys, self.starts = np.unique(keys[order], return_index=True)
+        self.ends = np.append(self.starts[1:], len(order))
+        self.nodes = order
+
+    @staticmethod
+    def _key(cx, cy):
+        """セルの座標を1つの整数にまとめる"""
+        return (cx + (1 << 31)) * (1 << 32) + (cy + (1 << 31))
+
+    def _ring_nodes(self, cx, cy, ring):
+        """セル (cx, cy) から ring 周目のセルに登録されたノード番号の配列"""
+        if ring == 0:
+            cells_x, cells_y = np.array([cx]), np.array([cy])
+        else:
+            side = np.arange(-ring, ring + 1)
+            inner = np.arange(-ring + 1, ring)
+            cells_x = cx + np.concatenate([side, side, np.full(len(inner), -ring), np.full(len(inner), ring)])
+            cells_y = cy + np.concatenate([np.full(len(side), -ring), np.full(len(side), ring), inner, inner])
+        keys = self._key(cells_x, cells_y)
+        slot = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        slot = slot[self.keys[slot] == keys]
+        if len(slot) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.nodes[self.starts[i]:self.ends[i]] for i in slot])
+
+    def nearest(self, lat, lon):
+        """緯度経度に最も近いノード番号"""
+        x, y = geodesy.local_xy(lat, lon, self.lat0, self.lon0)
+        x, y = float(x), float(y)
+        cx = int(np.floor(x / self.cell_size))
+        cy = int(np.floor(y / self.cell_size))
+        # グリッドの外側の地点でも、全てのセルを覆うまで広げれば必ず見つかる
+        max_ring = max(
+            abs(cx - self.cx_range[0]), abs(cx - self.cx_range[1]),
+            abs(cy - self.cy_range[0]), abs(cy - self.cy_range[1])
+        )
+
+        best_node, best_distance = None, np.inf
+        for ring in range(max_ring + 1):
+            candidates = self._ring_nodes(cx, cy, ring)
+            if len(candidates):
+                distances = np.hypot(self.x[candidates] - x, self.y[candidates] - y)
+                i = int(np.argmin(distances))
+                if distances[i] < best_distance:
+                    best_node, best_distance = int(candidates[i]), float(distances[i])
+            # ring+1 周目より外側のノードは ring × セルの大きさ より遠い
+            if best_distance <= ring * self.cell_size:
+                break
+        return best_node
+
+
+class LocalPedestrianGraph:
+    """
+    配列で表した歩行者用道路グラフ
+
+    ノードの緯度経度を配列で持ち、隣接関係はCSR形式（indptr / indices / weights）で保持する。
+    辺の重みはノード間の直線距離（メートル）
+    """
+
+    def __init__(self, lats, lons, indptr, indices, weights):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self._node_grid = None
+
+    @property
+    def node_count(self):
+        return len(self.lats)
+
+    @classmethod
+    def from_osm_xml(cls, path):
+        """
+        .osm XMLファイルから歩行者用の道路グラフを構築
+
+        Args:
+            path: .osm ファイルのパス
+
+        Returns:
+            LocalPedestrianGraph
+        """
+        node_coords = {}
+        ways = []
+
+        # 大きなファイルでもメモリに全体を載せないよう、要素ごとに読み進めて破棄する
+        for _, elem in ET.iterparse(path, events=('end',)):
+            if elem.tag == 'node':
+                node_coords[elem.get('id')] = (float(elem.get('lat')), float(elem.get('lon')))
+                elem.clear()
+            elif elem.tag == 'way':
+                tags = {tag.get('k'): tag.get('v') for tag in elem.findall('tag')}
+                if _is_walkable(tags):
+                    ways.append([nd.get('ref') for nd in elem.findall('nd')])
+                elem.clear()
+
+        # 道路に使われているノードだけに番号を振る
+        index = {}
+        lats = []
+        lons = []
+        sources = []
+        targets = []
+        for refs in ways:
+            for ref in refs:
+                if ref in node_coords and ref not in index:
+                    index[ref] = len(lats)
+                    lat, lon = node_coords[ref]
+                    lats.append(lat)
+                    lons.append(lon)
+            # 抽出範囲の外にあるノードの前後は結ばない（wayをそこで分ける）
+            for a, b in zip(refs, refs[1:]):
+                if a in index and b in index:
+                    sources.append(index[a])
+                    targets.append(index[b])
+
+        return cls.from_edges(lats, lons, sources, targets)
+
+    @classmethod
+    def from_edges(cls, lats, lons, sources, targets):
+        """
+        ノード座標と無向辺のリストからグラフを構築
+
+        Args:
+            lats, lons: ノードの緯度・経度
+            sources, targets: 辺の両端のノード番号
+
+        Returns:
+            LocalPedestrianGraph
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+
+        # 歩行者は一方通行を考慮しないので両方向の辺を張る
+        src = np.concatenate([sources, targets])
+        dst = np.concatenate([targets, sources])
+        weights = geodesy.haversine(lats[src], lons[src], lats[dst], lons[dst]) * 1000
+
+        order = np.argsort(src, kind='stable')
+        indptr = np.zeros(len(lats) + 1, dtype=np.int64)
+        np.add.at(indptr, src + 1, 1)
+        indptr = np.cumsum(indptr)
+
+        return cls(lats, lons, indptr, dst[order], weights[order])
+
+    @classmethod
+    def load(cls, path):
+        """
+        グラフファイルを読み込む（.npz は保存済みの配列、それ以外は .osm XML として構築）
+
+        Args:
+            path: グラフファイルのパス
+
+        Returns:
+            LocalPedestrianGraph
+        """
+        if path.endswith('.npz'):
+            data = np.load(path)
+            return cls(data['lats'], data['lons'], data['indptr'], data['indices'], data['weights'])
+        return cls.from_osm_xml(path)
+
+    def save(self, path):
+        """構築済みのグラフを .npz ファイルに保存（次回以降の起動を速くする）"""
+        np.savez_compressed(
+            path, lats=self.lats, lons=self.lons,
+            indptr=self.indptr, indices=self.indices, weights=self.weights
+        )
+
+    def nearest_node(self, lat, lon):
+        """緯度経度に最も近いノード番号（グリッドは初回呼び出し時に作成）"""
+        if self._node_grid is None:
+            self._node_grid = NodeGrid(self.lats, self.lons)
+        return self._node_grid.nearest(lat, lon)
+
+    def shortest_path(self, source, target):
+        """
+        A*探索で2ノード間の最短経路を求める（ヒューリスティックは目的地までの直線距離）
+
+        Args:
+            source: 出発ノード番号
+            target: 到着ノード番号
+
+        Returns:
+            (経路上のノード番号のリスト, 距離（メートル）)。到達できない場合は (None, None)
+        """
+        if source == target:
+            return [source], 0.0
+
+        target_lat = self.lats[target]
+        target_lon = self.lons[target]
+
+        best = {source: 0.0}
+        previous = {}
+        closed = set()
+        queue = [(0.0, 0.0, source)]
+
+        while queue:
+            _, cost, node = heapq.heappop(queue)
+            if node == target:
+                path = [node]
+                while node in previous:
+                    node = previous[node]
+                    path.append(node)
+                return path[::-1], cost
+            if node in closed:
+                continue
+            closed.add(node)
+
+            start, end = self.indptr[node], self.indptr[node + 1]
+            neighbors = self.indices[start:end]
+            costs = cost + self.weights[start:end].astype(np.float64)
+            # 隣接ノードのヒューリスティックはまとめて計算する
+            estimates = geodesy.haversine(self.lats[neighbors], self.lons[neighbors], target_lat, target_lon) * 1000
+            for neighbor, new_cost, estimate in zip(neighbors.tolist(), costs.tolist(), estimates.tolist()):
+                if neighbor in closed or new_cost >= best.get(neighbor, float('inf')):
+                    continue
+                best[neighbor] = new_cost
+                previous[neighbor] = node
+                heapq.heappush(queue, (new_cost + estimate, new_cost, neighbor))
+
+        return None, None
+
+    def route(self, coordinates):
+        """
+        経由地点を順に通る経路を求め、ORSと同じ形のGeoJSONを返す
+
+        Args:
+            coordinates: [[lng1, lat1], [lng2, lat2], ...] 形式の経由地点
+
+        Returns:
+            GeoJSON FeatureCollection。経路が見つからない区間がある場合はNone
+        """
+        nodes = [self.nearest_node(lat, lng) for lng, lat in coordinates]
+
+        path = [nodes[0]]
+        segments = []
+        way_points = [0]
+        for source, target in zip(nodes, nodes[1:]):
+            leg, distance = self.shortest_path(source, target)
+            if leg is None:
+                return None
+            start_index = len(path) - 1
+            path.extend(leg[1:])
+            way_points.append(len(path) - 1)
+            segments.append({
+                "distance": round(distance, 1),
+                "duration": round(distance / WALKING_SPEED_MPS, 1),
+                "steps": [{
+                    "distance": round(distance, 1),
+                    "duration": round(distance / WALKING_SPEED_MPS, 1),
+                    "type": 11,
+                    "instruction": "",
+                    "name": "-",
+                    "way_points": [start_index, len(path) - 1]
+                }]
+            })
+
+        line = [[float(self.lons[node]), float(self.lats[node])] for node in path]
+        lons = [c[0] for c in line]
+        lats = [c[1] for c in line]
+        bbox = [min(lons), min(lats), max(lons), max(lats)]
+        total = sum(segment["distance"] for segment in segments)
+
+        return {
+            "type": "FeatureCollection",
+            "bbox": bbox,
+            "features": [{
+                "bbox": bbox,
+                "type": "Feature",
+                "properties": {
+                    "segments": segments,
+                    "way_points": way_points,
+                    "summary": {
+                        "distance": round(total, 1),
+                        "duration": round(total / WALKING_SPEED_MPS, 1)
+                    }
+                },
+                "geometry": {
+                    "coordinates": line,
+                    "type": "LineString"
+                }
+            }],
+            "metadata": {
+                "service": "local",
+                "query": {"coordinates": coordinates, "profile": "foot-walking", "format": "geojson"}
+            }
+        }
+
+
+def _is_walkable(tags):
+    """wayのタグが歩行者の通れる道路を表すか"""
+    if tags.get('highway') not in PEDESTRIAN_HIGHWAYS:
+        return False
+    if tags.get('foot') == 'no' or tags.get('access') in ('no', 'private'):
+        return tags.get('foot') in ('yes', 'designated', 'permissive')
+    return True
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_local_graph(path):
+    """
+    グラフを初回呼び出し時に読み込み、以降は同じものを返す
+
+    Args:
+        path: グラフファイル（.npz または .osm）のパス
+
+    Returns:
+        LocalPedestrianGraph
+    """
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                if not path or not os.path.exists(path):
+                    raise FileNotFoundError(f"Local routing graph not found: {path}")
+                _graph = LocalPedestrianGraph.load(path)
+    return _graph
+
+
+# .osm から .npz を作成するコマンド（例: python -m services.local_router tokyo.osm tokyo.npz）
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("使い方: python -m services.local_router <入力.osm> <出力.npz>")
+        sys.exit(1)
+
+    graph = LocalPedestrianGraph.from_osm_xml(sys.argv[1])
+    graph.save(sys.argv[2])
+    print(f"ノード数: {graph.node_count}, 辺数: {len(graph.indices)}")
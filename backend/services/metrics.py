@@ -0,0 +1,222 @@
+"""
+処理時間・外部API・キャッシュの計測モジュール
+カウンタとヒストグラムをプロセス内に集計し、Prometheusのテキスト形式で出力します。
+ルート生成の各段階（図形の配置・POI検索・経路探索・保存）、Flaskのハンドラ、
+Overpass・ORSへのリクエストの所要時間とステータスコードを記録します
+"""
+
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 秒単位のヒストグラムの区切り（ルート生成は外部APIの待ちで数十秒かかることがある）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value):
+    """数値をPrometheusのテキスト形式で表す"""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    """{"a": "x"} を {a="x"} の形にする（値の \\ " 改行はエスケープする）"""
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """ラベルの組ごとに増え続ける値"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        """値を増やす"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """ラベルの組の現在の値"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        """(名前, ラベル, 値) の列"""
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """ラベルの組ごとの観測値の分布（区切りごとの累積件数・合計・件数）"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # ラベルの組 -> [区切りごとの件数, 合計, 件数]
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def observe(self, value, **labels):
+        """観測値を追加"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """with ブロックの所要時間（秒）を観測値として追加（例外で抜けた場合も記録する）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        """ラベルの組の観測回数"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def samples(self):
+        """(名前, ラベル, 値) の列（_bucket は累積件数）"""
+        with self._lock:
+            values = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        for key, (counts, total, count) in values:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", labels + [("le", _format_value(bound))], cumulative
+            yield self.name + "_bucket", labels + [("le", "+Inf")], count
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+class MetricsRegistry:
+    """
+    計測値の登録先
+
+    カウンタ・ヒストグラムのほか、出力のたびに値を集める関数（collector）を登録できる。
+    collector は (名前, 種類, 説明, [(ラベルの辞書, 値), ...]) の列を返す
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        """カウンタを作成して登録"""
+        metric = Counter(name, documentation, labelnames)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """ヒストグラムを作成して登録"""
+        metric = Histogram(name, documentation, labelnames, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        """出力のたびに呼ぶ関数を登録（デコレータとしても使える）"""
+        with self._lock:
+            self._collectors.append(func)
+        return func
+
+    def render(self):
+        """全ての計測値をPrometheusのテキスト形式（version 0.0.4）で出力"""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for collect in collectors:
+            try:
+                families = list(collect())
+            except Exception as e:
+                logger.warning(f"Metrics collector error: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+# アプリケーション全体で共有する登録先と計測値
+metrics = MetricsRegistry()
+
+http_request_seconds = metrics.histogram(
+    "gpsketch_http_request_duration_seconds",
+    "Flaskのハンドラの処理時間（秒）",
+    ("method", "endpoint", "status")
+)
+route_stage_seconds = metrics.histogram(
+    "gpsketch_route_stage_duration_seconds",
+    "ルート生成の段階ごとの処理時間（秒）",
+    ("stage",)
+)
+upstream_request_seconds = metrics.histogram(
+    "gpsketch_upstream_request_duration_seconds",
+    "外部APIへの1回のリクエストの所要時間（秒、リトライは別に数える）",
+    ("service",)
+)
+upstream_requests_total = metrics.counter(
+    "gpsketch_upstream_requests_total",
+    "外部APIへのリクエスト数（status はステータスコード、接続できなかった場合は例外名）",
+    ("service", "status")
+)
+
+
+def stage(name):
+    """ルート生成の段階の所要時間を計る（with stage("directions"): ...）"""
+    return route_stage_seconds.time(stage=name)
@@ -0,0 +1,151 @@
+"""
+POIキャッシュモジュール
+Overpass APIで取得した名称のある場所を、ジオハッシュのタイルと検索半径ごとに保持します。
+プロセス内のLRUキャッシュと、TTL付きのSQLiteファイルの2段構成です。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from services.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# キャッシュ設定（環境変数で上書き可能）
+POI_TILE_PRECISION = int(os.getenv("POI_TILE_PRECISION", "7"))  # ジオハッシュの文字数（7で約150m四方）
+POI_CACHE_MAXSIZE = int(os.getenv("POI_CACHE_MAXSIZE", "4096"))  # プロセス内に保持するタイル数
+POI_CACHE_TTL_SEC = int(os.getenv("POI_CACHE_TTL_SEC", str(7 * 24 * 3600)))  # エントリの有効期間（メモリ・ディスク共通）
+POI_CACHE_PATH = os.getenv(
+    "POI_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "poi_cache.sqlite3")
+)
+
+
+class PoiCache:
+    """
+    タイル単位のPOIキャッシュ
+
+    キーは (ジオハッシュ, 検索半径)、値はそのタイルの周辺で見つかった評価済みの場所のリスト。
+    メモリで見つからなければSQLiteファイルを参照し、見つかればメモリに載せ直す。
+    メモリには (登録時刻, 場所のリスト) を保持し、ディスクと同じ有効期間で期限切れにする
+    """
+
+    def __init__(self, path=POI_CACHE_PATH, maxsize=POI_CACHE_MAXSIZE, ttl_sec=POI_CACHE_TTL_SEC):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self.memory = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        """SQLiteの接続を取得（初回のみテーブルを作成）"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS poi_tiles ("
+                " tile TEXT NOT NULL,"
+                " radius INTEGER NOT NULL,"
+                " places TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (tile, radius))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, tile, radius):
+        """
+        タイルの場所リストを取得
+
+        Args:
+            tile: ジオハッシュ文字列
+            radius: 検索半径（メートル）
+
+        Returns:
+            評価済みの場所のリスト。キャッシュにない・期限切れの場合はNone
+        """
+        key = (tile, int(radius))
+        entry = self.memory.get(key)
+        if entry is not None and not self._expired(entry[0]):
+            return entry[1]
+
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT places, created_at FROM poi_tiles WHERE tile = ? AND radius = ?", key
+                ).fetchone()
+                if row is not None and self._expired(row[1]):
+                    # 期限切れのエントリは削除してミス扱い
+                    conn.execute("DELETE FROM poi_tiles WHERE tile = ? AND radius = ?", key)
+                    conn.commit()
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                self.disk_hits += 1
+        except sqlite3.Error as e:
+            logger.warning(f"POI cache read error: {e}")
+            self.misses += 1
+            return None
+
+        places = json.loads(row[0])
+        # メモリのエントリもディスクに登録した時刻で期限切れにする
+        self.memory.put(key, (row[1], places))
+        return places
+
+    def peek(self, tile, radius):
+        """ヒット・ミスを記録せず、メモリ上のタイルの場所リストだけを参照（期限切れならNone）"""
+        entry = self.memory.peek((tile, int(radius)))
+        if entry is None or self._expired(entry[0]):
+            return None
+        return entry[1]
+
+    def _expired(self, created_at):
+        """登録時刻から有効期間を過ぎているか"""
+        return time.time() - created_at > self.ttl_sec
+
+    def put(self, tile, radius, places):
+        """
+        タイルの場所リストを登録
+
+        Args:
+            tile: ジオハッシュ文字列
+            radius: 検索半径（メートル）
+            places: 評価済みの場所のリスト
+        """
+        key = (tile, int(radius))
+        created_at = time.time()
+        self.memory.put(key, (created_at, places))
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO poi_tiles (tile, radius, places, created_at) VALUES (?, ?, ?, ?)",
+                    (key[0], key[1], json.dumps(places, ensure_ascii=False), created_at)
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"POI cache write error: {e}")
+
+    def stats(self):
+        """キャッシュのヒット・ミス数を返す"""
+        memory_stats = self.memory.stats()
+        return {
+            "memory_hits": memory_stats["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_size": memory_stats["size"],
+        }
+
+
+# アプリケーション全体で共有するキャッシュ
+poi_cache = PoiCache()
@@ -0,0 +1,115 @@
+"""
+エンコード済みレスポンスモジュール
+作成後に変わらないデータ（保存したルートなど）のJSONレスポンスを一度だけシリアライズして圧縮し、
+ETag付きのバイト列としてプロセス内にキャッシュして、そのまま返せるようにします
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+from services.cache import LRUCache
+
+try:
+    import brotli
+except ImportError:  # brotli は任意（インストールされていなければgzipのみ）
+    brotli = None
+
+RESPONSE_CACHE_MAXSIZE = int(os.getenv("RESPONSE_CACHE_MAXSIZE", "256"))  # メモリに保持するレスポンス数
+GZIP_LEVEL = 6                  # 保存するgzipの圧縮レベル
+BROTLI_QUALITY = 5              # brotliの圧縮品質（リクエスト時に圧縮してキャッシュする）
+
+
+def encode_json(payload):
+    """
+    レスポンスのJSONを一度だけシリアライズし、gzipで圧縮したバイト列とETagを返す
+
+    Args:
+        payload: レスポンスの辞書
+
+    Returns:
+        (ETag（引用符なしのハッシュ）, gzip圧縮したJSONのバイト列)
+    """
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    # mtime=0 で圧縮結果を内容だけで決まるようにする
+    return etag, gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def choose_encoding(accept_encoding):
+    """
+    Accept-Encoding ヘッダーから返す圧縮形式を選ぶ
+
+    Returns:
+        "br" / "gzip" / "identity"
+    """
+    accepted = set()
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        # q=0 は受け付けない指定
+        if q > 0:
+            accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match ヘッダーがETag（圧縮形式ごとの接尾辞を除いた部分）と一致するか"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"').split("-")[0] == etag:
+            return True
+    return False
+
+
+class EncodedResponse:
+    """
+    1つのレスポンスの圧縮形式ごとのバイト列
+
+    gzip は作成時に圧縮したものをそのまま使い、無圧縮とbrotliは必要になったときに一度だけ作る
+    """
+
+    def __init__(self, etag, gzip_body):
+        self.etag = etag
+        self._bodies = {"gzip": gzip_body}
+
+    def body(self, encoding):
+        """圧縮形式に対応するバイト列"""
+        body = self._bodies.get(encoding)
+        if body is None:
+            raw = self._bodies.get("identity") or gzip.decompress(self._bodies["gzip"])
+            self._bodies["identity"] = raw
+            if encoding == "br":
+                body = brotli.compress(raw, quality=BROTLI_QUALITY)
+                self._bodies["br"] = body
+            else:
+                body = raw
+        return body
+
+    def etag_for(self, encoding):
+        """圧縮形式ごとの強いETag（表現ごとに異なる値にする）"""
+        if encoding == "identity":
+            return f'"{self.etag}"'
+        return f'"{self.etag}-{encoding}"'
+
+
+# ルートIDごとのエンコード済みレスポンス
+route_responses = LRUCache(RESPONSE_CACHE_MAXSIZE)
@@ -0,0 +1,139 @@
+"""
+近くの既存ルートの検索モジュール
+ルートの出発地点を routes.start_geohash に保存しておき、周囲のジオハッシュのタイルの
+前方一致でインデックスを使って候補を絞ってから、実際の距離で近い順に並べます。
+同じイラスト・同じくらいの距離のルートが近くにあれば、生成せずにそのルートを使い回せます
+"""
+
+import json
+import math
+import os
+
+from sqlalchemy import or_
+from sqlalchemy.orm import defer
+
+from models import db, Route
+from services.geometry_service import expand_geojson
+from utils import geodesy, geohash
+
+START_GEOHASH_PRECISION = 9     # 保存するジオハッシュの文字数（約5m四方、検索時は前方一致で粗くする）
+REUSE_RADIUS_M = float(os.getenv("ROUTE_REUSE_RADIUS_M", "300"))                # 使い回す出発地点のずれの上限（メートル）
+REUSE_DISTANCE_TOLERANCE = float(os.getenv("ROUTE_REUSE_DISTANCE_TOLERANCE", "0.1"))  # 使い回す距離の差の上限（割合）
+NEARBY_MAX_CANDIDATES = 500     # 距離を計算する候補の数の上限
+
+
+def start_geohash(lat, lon):
+    """ルートの出発地点のジオハッシュ（routes.start_geohash に保存する値）"""
+    return geohash.encode(lat, lon, START_GEOHASH_PRECISION)
+
+
+def search_precision(lat, radius_m):
+    """
+    半径 radius_m の円が中心のタイルと周囲8タイルに収まる最も細かいジオハッシュの文字数
+
+    Args:
+        lat: 検索地点の緯度
+        radius_m: 検索半径（メートル）
+
+    Returns:
+        ジオハッシュの文字数（1〜START_GEOHASH_PRECISION）
+    """
+    meters_per_deg = math.radians(1) * geodesy.EARTH_RADIUS_KM * 1000
+    for precision in range(START_GEOHASH_PRECISION, 0, -1):
+        # 文字数ごとのタイルの大きさ（経度は偶数ビット目から割るので緯度より1ビット多い）
+        lon_bits = (5 * precision + 1) // 2
+        lat_bits = 5 * precision // 2
+        width_m = 360.0 / 2 ** lon_bits * meters_per_deg * math.cos(math.radians(lat))
+        height_m = 180.0 / 2 ** lat_bits * meters_per_deg
+        if min(width_m, height_m) >= radius_m:
+            return precision
+    return 1
+
+
+def find_nearby_routes(lat, lon, radius_m, animal_name=None, distance_km=None,
+                       distance_tolerance=None, limit=20):
+    """
+    出発地点が近いルートを近い順に検索
+
+    Args:
+        lat, lon: 検索地点の緯度・経度
+        radius_m: 検索半径（メートル）
+        animal_name: イラスト名で絞る場合に指定
+        distance_km: 目標距離で絞る場合に指定
+        distance_tolerance: distance_km との差の上限（割合、省略時は REUSE_DISTANCE_TOLERANCE）
+        limit: 返す件数の上限
+
+    Returns:
+        [(Route, 出発地点までの距離（メートル）), ...]（route_geojson は遅延読み込み）
+    """
+    precision = search_precision(lat, radius_m)
+    center = geohash.encode(lat, lon, precision)
+    cells = [center] + geohash.neighbors(center)
+
+    # タイルの前方一致は idx_routes_start_geohash の範囲検索になる
+    query = (
+        db.session.query(Route)
+        .options(defer(Route.route_geojson))
+        .filter(or_(*[Route.start_geohash.like(cell + "%") for cell in cells]))
+    )
+    if animal_name is not None:
+        query = query.filter(Route.animal_name == animal_name)
+    if distance_km is not None:
+        tolerance = REUSE_DISTANCE_TOLERANCE if distance_tolerance is None else distance_tolerance
+        query = query.filter(Route.distance_km.between(
+            distance_km * (1 - tolerance), distance_km * (1 + tolerance)
+        ))
+    candidates = query.limit(NEARBY_MAX_CANDIDATES).all()
+    if not candidates:
+        return []
+
+    # タイルは正方形なので、円の外側の候補を実際の距離で除く
+    distances_m = geodesy.haversine(
+        lat, lon,
+        [route.stat_end_latitude for route in candidates],
+        [route.stat_end_longitude for route in candidates]
+    ) * 1000
+    nearby = [
+        (route, float(distance_m))
+        for route, distance_m in zip(candidates, distances_m)
+        if distance_m <= radius_m
+    ]
+    nearby.sort(key=lambda item: (item[1], abs((item[0].distance_km or 0) - (distance_km or 0))))
+    return nearby[:limit]
+
+
+def find_reusable_route(params):
+    """
+    ルート生成のパラメータに合う既存のルートを探し、生成結果と同じ形で返す
+
+    Args:
+        params: parse_generate_request が返すパラメータ
+
+    Returns:
+        create_route の戻り値と同じ形の辞書（"reused": True 付き）。合うルートがなければNone
+    """
+    nearby = find_nearby_routes(
+        params["current_lat"], params["current_lon"], REUSE_RADIUS_M,
+        animal_name=params["shape"], distance_km=float(params["target_distance"]), limit=1
+    )
+    if not nearby:
+        return None
+    route, distance_m = nearby[0]
+
+    route_geojson = route.route_geojson
+    if isinstance(route_geojson, str):
+        route_geojson = json.loads(route_geojson)
+    route_geojson = expand_geojson(route_geojson)
+    features = route_geojson.get("features")
+    if isinstance(features, dict):
+        features = [features]
+
+    return {
+        "route_id": route.id,
+        "type": "FeatureCollection",
+        "features": features,
+        "waypoints": route_geojson.get("waypoints"),
+        "total_distance": route_geojson.get("total_distance", route.actual_route_distance_km),
+        "reused": True,
+        "start_offset_m": round(distance_m, 1)
+    }
@@ -1,7 +1,53 @@
+import hashlib
 import math
 import requests
 import json
+import logging
 import os
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from services.cache import LRUCache
+from services.http_client import http_client
+from services.local_router import get_local_graph
+from services.metrics import stage
+from services.poi_cache import poi_cache, POI_TILE_PRECISION
+from services.shape_registry import shape_registry
+from utils import geodesy, geohash
+
+logger = logging.getLogger(__name__)
+
+# 外部APIの接続先（ベンチマークではローカルのスタブサーバーに向ける）
+OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+ORS_BASE_URL = os.getenv("ORS_BASE_URL", "https://api.openrouteservice.org")
+
+# 経由地点スナップ（Overpass検索）の並列実行設定
+SNAP_MAX_WORKERS = 8       # 同時に投げる検索の上限
+SNAP_DEADLINE_SEC = 15.0   # 全地点の検索で共有する締め切り（秒）
+SNAP_RADIUS_M = 300        # 経由地点を探す半径（メートル）
+
+# 配置候補の探索設定（generate_running_route の top_k が2以上の場合）
+PLACEMENT_ROTATIONS_DEG = tuple(range(0, 360, 30))  # 試す回転角（度）
+PLACEMENT_SCALES = (0.85, 1.0, 1.15)                 # 試す縮尺
+MAX_PLACEMENT_LATITUDE = 85.0                        # 頂点として許す緯度の絶対値の上限
+PLACEMENT_HIT_SCORE = 1.0                            # スナップ先が見つかりそうな頂点1つあたりの評価
+PLACEMENT_DENSITY_SCORE = 0.01                       # 周辺の場所1件あたりの評価
+PLACEMENT_WATER_PENALTY = 0.5                        # 水域に吸着しそうな頂点1つあたりの減点
+PLACEMENT_MAX_TOP_K = 5                              # ORSで検証する候補数の上限
+
+# デトア係数の既定値（地域ごとの学習値がない場合に使う）
+DEFAULT_DETOUR_FACTOR = 1.4
+
+# ルート検索設定
+ROUTING_BACKEND = os.getenv("ROUTING_BACKEND", "ors")  # "ors"（OpenRouteService）または "local"（ローカルグラフ）
+LOCAL_GRAPH_PATH = os.getenv("LOCAL_GRAPH_PATH", "")    # ローカルグラフ（.npz または .osm）のパス
+ORS_PROFILE = "foot-walking"
+DIRECTIONS_CACHE_PRECISION = 6  # キャッシュキーにする座標の小数桁数（約0.1m）
+DIRECTIONS_CACHE_MAXSIZE = int(os.getenv("DIRECTIONS_CACHE_MAXSIZE", "512"))  # 保持するレスポンス数
+
+# 同じ経由地点列に対するORSレスポンスのキャッシュ
+directions_cache = LRUCache(DIRECTIONS_CACHE_MAXSIZE)
 
 
 def haversine_distance(lat1, lon1, lat2, lon2):
@@ -21,15 +67,16 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     
     return R * c
 
-def calculate_geo_coordinates(current_lat, current_lon, points, target_distance):
+def calculate_geo_coordinates(current_lat, current_lon, points, target_distance, detour_factor=DEFAULT_DETOUR_FACTOR):
     """
     座標点リストから対応する緯度経度を計算する
     
     Args:
         current_lat: 現在地の緯度
         current_lon: 現在地の経度
-        points: [(x1,y1), (x2,y2), ..., (xn,yn)] 形式の座標リスト
+        points: [(x1,y1), (x2,y2), ..., (xn,yn)] 形式の座標リスト、または登録済みのShape
         target_distance: 目標となる総距離（km）
+        detour_factor: 実際の道のり÷直線距離の見込み（迂回係数）
         
     Returns:
         計算された緯度経度のリスト [(a1,b1), (a2,b2), ..., (an,bn)]
@@ -38,77 +85,18 @@ def calculate_geo_coordinates(current_lat, current_lon, points, target_distance)
     if n < 2:
         return [(current_lat, current_lon)]
     
-    # ステップ1: 各ベクトルの方向と大きさを計算
-    directions = []  # 方向角（ラジアン）
-    distances = []   # ベクトルの大きさ
-    
-    for i in range(n - 1):
-        x1, y1 = points[i]
-        x2, y2 = points[i + 1]
-        
-        # ベクトル (x2-x1, y2-y1) の方向を計算
-        # (0,-1) を基準として時計回りの角度
-        dx = x2 - x1
-        dy = y2 - y1
-        
-        # arctan2は(-π, π]の範囲で角度を返す
-        # (0,-1)を基準にするので、π/2を加えて調整
-        angle = math.atan2(dx, -dy)
-        
-        # 角度が負の場合は2πを加えて[0, 2π)の範囲に変換
-        if angle < 0:
-            angle += 2 * math.pi
-        
-        # ベクトルの大きさを計算
-        magnitude = math.sqrt(dx**2 + dy**2)
-        
-        directions.append(angle)
-        distances.append(magnitude)
-    
-    # 最後の点から最初の点へのベクトル
-    x_last, y_last = points[n - 1]
-    x_first, y_first = points[0]
-    
-    dx = x_first - x_last
-    dy = y_first - y_last
-    
-    # 最後のベクトルの方向
-    angle = math.atan2(dx, -dy)
-    if angle < 0:
-        angle += 2 * math.pi
-    
-    # 最後のベクトルの大きさ
-    magnitude = math.sqrt(dx**2 + dy**2)
-    
-    directions.append(angle)
-    distances.append(magnitude)
+    # ステップ1: 各ベクトルの方向と大きさ（周長を1とした長さ）を取得
+    # (0,-1) を基準として時計回りの角度。最後のベクトルは最後の点から最初の点へ
+    shape = shape_registry.resolve(points)
     
     # ステップ2: スケーリング係数hを計算
-    total_distance_raw = sum(distances)
-
-    detour_factor=1.4 #デトア係数：直線距離に一定の係数を掛けることです。この係数は「迂回係数」または「デトア係数」と呼ばれます。
-
-    h = target_distance /detour_factor / total_distance_raw
+    # デトア係数：直線距離に一定の係数を掛けることです。この係数は「迂回係数」または「デトア係数」と呼ばれます。
+    h = target_distance / detour_factor
     
-    # ステップ3: 緯度経度を計算
-    geo_coords = [(current_lat, current_lon)]  # 初期位置
+    # ステップ3: 緯度経度を計算（最後のベクトルは最初に戻るので省略）
+    coords = geodesy.walk_polygons(current_lat, current_lon, shape.bearings_deg[:-1], shape.lengths[:-1] * h)[0]
     
-    lat, lon = current_lat, current_lon
-    for i in range(n):
-        if i < n - 1:  # 通常のポイント
-            direction = directions[i]
-            distance = distances[i] * h
-        else:  # 最後の点は省略（最初に戻る）
-            break
-        
-        # 地球上の緯度経度を計算
-        next_lat, next_lon = calculate_destination_point(lat, lon, math.degrees(direction), distance)
-        geo_coords.append((next_lat, next_lon))
-        
-        # 次のポイントの起点を更新
-        lat, lon = next_lat, next_lon
-    
-    return geo_coords
+    return [(float(lat), float(lon)) for lat, lon in coords]
 
 def calculate_destination_point(lat, lon, bearing_deg, distance_km):
     """
@@ -155,131 +143,362 @@ def calculate_destination_point(lat, lon, bearing_deg, distance_km):
     
     return dest_lat, dest_lon
 
-def find_named_places_osm(lat, lon, radius=100):
+def _fallback_waypoint(lat, lon):
+    """検索できなかった地点を元の座標のまま経由地点にする"""
+    return {
+        'name': f"Waypoint at {lat:.6f}, {lon:.6f}",
+        'lat': lat,
+        'lng': lon
+    }
+
+# ランニングに適した場所のタイプのリスト
+RUNNING_FRIENDLY_TYPES = [
+    'park', 'playground', 'garden', 'sports_centre', 'stadium',
+    'school', 'university', 'college', 'public_building',
+    'station', 'bus_stop', 'subway_entrance', 'cafe', 'restaurant',
+    'convenience', 'supermarket', 'mall', 'landmark', 'attraction',
+    'memorial', 'monument', 'viewpoint', 'tourism'
+]
+
+def _score_element(element):
     """
-    OpenStreetMapのOverpass APIを使って指定された緯度経度の周辺で名称のある場所を検索
+    Overpassの要素1件を経由地点候補として評価する
     
     Args:
-        lat: 緯度
-        lon: 経度
+        element: Overpass APIの要素（node / way / relation）
+        
+    Returns:
+        評価済みの場所の情報。座標が取れない要素の場合はNone
+    """
+    # 座標を取得（ウェイやリレーションの場合はcenterプロパティを使用）
+    if element['type'] == 'node':
+        lat = element['lat']
+        lon = element['lon']
+    else:
+        if 'center' in element:
+            lat = element['center']['lat']
+            lon = element['center']['lon']
+        else:
+            return None
+    
+    # タグから情報を取得
+    tags = element.get('tags', {})
+    name = tags.get('name', f"Point at {lat:.6f}, {lon:.6f}")
+    
+    # スコアリング（ランニングに適した場所を優先）
+    score = 0
+    
+    # 名前があれば基本スコア
+    if 'name' in tags:
+        score += 10
+    
+    # ランニングに適したタイプの場所にボーナス
+    for key, value in tags.items():
+        if key in RUNNING_FRIENDLY_TYPES or value in RUNNING_FRIENDLY_TYPES:
+            score += 5
+        
+        # 特に重要な場所タイプにボーナス
+        if (key == 'leisure' and value == 'park') or \
+           (key == 'amenity' and value in ['school', 'university']):
+            score += 3
+    
+    # ノードは通常ウェイやリレーションより小さい場所なので調整
+    if element['type'] == 'node':
+        score -= 2
+    
+    return {
+        'name': name,
+        'lat': lat,
+        'lng': lon,
+        'score': score,
+        'type': element['type'],
+        'tags': tags
+    }
+
+def _best_place(scored_places, lat, lon):
+    """評価済みの候補から最も適した場所を選ぶ（候補がなければ元の座標）"""
+    if not scored_places:
+        # 名称のある場所が見つからない場合は元の座標を返す
+        return _fallback_waypoint(lat, lon)
+    
+    # スコアでソートして最も適した場所を返す
+    best = sorted(scored_places, key=lambda x: x['score'], reverse=True)[0]
+    return {
+        'name': best['name'],
+        'lat': best['lat'],
+        'lng': best['lng']
+    }
+
+def _around_statements(lat, lon, radius):
+    """名前を持つノード、ウェイ、リレーションを検索するOverpassクエリ文"""
+    return f"""
+      node(around:{radius},{lat},{lon})["name"];
+      way(around:{radius},{lat},{lon})["name"];
+      relation(around:{radius},{lat},{lon})["name"];"""
+
+def _tile_query_radius(tile, radius):
+    """タイル内のどの地点から検索しても漏れがないよう、タイル中心からの検索半径を広げる"""
+    lat_min, lat_max, lon_min, lon_max = geohash.decode_bbox(tile)
+    center_lat, center_lon = geohash.decode(tile)
+    half_diagonal_m = haversine_distance(center_lat, center_lon, lat_max, lon_max) * 1000
+    return int(math.ceil(radius + half_diagonal_m))
+
+def _fetch_tiles(tiles, radius, deadline=None):
+    """
+    キャッシュにないタイルの周辺の場所を1回のOverpassクエリで取得し、キャッシュに登録
+    
+    Args:
+        tiles: ジオハッシュ文字列のリスト
         radius: 検索半径（メートル）
+        deadline: 問い合わせの締め切り（time.monotonic() 基準、Noneならクライアントの既定値）
         
     Returns:
-        名称のある場所の情報（名前、緯度、経度）
+        {ジオハッシュ: 評価済みの場所のリスト} の辞書。Overpassへの問い合わせに失敗した場合はNone
     """
-    overpass_url = "https://overpass-api.de/api/interpreter"
+    centers = {tile: geohash.decode(tile) for tile in tiles}
+    query_radius = {tile: _tile_query_radius(tile, radius) for tile in tiles}
     
-    # 名前を持つノード、ウェイ、リレーションを検索するクエリ
+    statements = "".join(
+        _around_statements(centers[tile][0], centers[tile][1], query_radius[tile]) for tile in tiles
+    )
     overpass_query = f"""
     [out:json];
-    (
-      node(around:{radius},{lat},{lon})["name"];
-      way(around:{radius},{lat},{lon})["name"];
-      relation(around:{radius},{lat},{lon})["name"];
+    ({statements}
     );
     out center;
     """
     
-    response = requests.get(overpass_url, params={'data': overpass_query})
+    try:
+        with stage("poi_lookup"):
+            response = http_client.post(
+                OVERPASS_URL, data={'data': overpass_query}, service="overpass", deadline=deadline
+            )
+    except requests.RequestException as e:
+        logger.warning(f"Overpass API Error: {e}")
+        return None
+    
+    if response.status_code != 200:
+        logger.warning(f"Overpass API Error: {response.status_code} - {response.text[:200]}")
+        return None
+    
+    data = response.json()
+    
+    places = [place for place in map(_score_element, data['elements']) if place is not None]
+    
+    # 各要素を、検索範囲に含むすべてのタイルに振り分ける
+    places_by_tile = {tile: [] for tile in tiles}
+    if places:
+        distances_m = geodesy.haversine_matrix(
+            [centers[tile][0] for tile in tiles], [centers[tile][1] for tile in tiles],
+            [p['lat'] for p in places], [p['lng'] for p in places]
+        ) * 1000
+        for row, tile in zip(distances_m, tiles):
+            places_by_tile[tile] = [place for place, d in zip(places, row) if d <= query_radius[tile]]
+    
+    for tile, places in places_by_tile.items():
+        poi_cache.put(tile, radius, places)
+    
+    return places_by_tile
+
+def _places_within(places, lat, lon, radius):
+    """地点から検索半径内にある場所だけを取り出す"""
+    if not places:
+        return []
+    distances = geodesy.haversine(lat, lon, [p['lat'] for p in places], [p['lng'] for p in places])
+    return [place for place, d in zip(places, distances) if d <= radius / 1000]
+
+def find_named_places_osm(lat, lon, radius=100, deadline=None):
+    """
+    OpenStreetMapのOverpass APIを使って指定された緯度経度の周辺で名称のある場所を検索
+    
+    結果はジオハッシュのタイル単位でキャッシュし、同じタイル内の地点はOverpassを呼ばずに検索する
+    
+    Args:
+        lat: 緯度
+        lon: 経度
+        radius: 検索半径（メートル）
+        deadline: Overpassへの問い合わせの締め切り（time.monotonic() 基準）
+        
+    Returns:
+        名称のある場所の情報（名前、緯度、経度）
+    """
+    tile = geohash.encode(lat, lon, POI_TILE_PRECISION)
+    places = poi_cache.get(tile, radius)
+    if places is None:
+        fetched = _fetch_tiles([tile], radius, deadline)
+        places = fetched[tile] if fetched is not None else []
+    
+    return _best_place(_places_within(places, lat, lon, radius), lat, lon)
+
+def load_tiles(tiles, radius, deadline=None):
+    """
+    タイルの場所リストをキャッシュから引き、足りないタイルだけを1回のOverpassクエリでまとめて取得
     
-    if response.status_code == 200:
-        data = response.json()
+    Args:
+        tiles: ジオハッシュ文字列のリスト（重複可）
+        radius: 検索半径（メートル）
+        deadline: Overpassへの問い合わせの締め切り（time.monotonic() 基準）
         
-        if data['elements']:
-            # ランニングに適した場所のタイプのリスト
-            running_friendly_types = [
-                'park', 'playground', 'garden', 'sports_centre', 'stadium',
-                'school', 'university', 'college', 'public_building',
-                'station', 'bus_stop', 'subway_entrance', 'cafe', 'restaurant',
-                'convenience', 'supermarket', 'mall', 'landmark', 'attraction',
-                'memorial', 'monument', 'viewpoint', 'tourism'
-            ]
-            
-            # 場所を評価してソート
-            scored_places = []
-            
-            for element in data['elements']:
-                # 座標を取得（ウェイやリレーションの場合はcenterプロパティを使用）
-                if element['type'] == 'node':
-                    lat = element['lat']
-                    lon = element['lon']
-                else:
-                    if 'center' in element:
-                        lat = element['center']['lat']
-                        lon = element['center']['lon']
-                    else:
-                        continue
-                
-                # タグから情報を取得
-                tags = element.get('tags', {})
-                name = tags.get('name', f"Point at {lat:.6f}, {lon:.6f}")
-                
-                # スコアリング（ランニングに適した場所を優先）
-                score = 0
-                
-                # 名前があれば基本スコア
-                if 'name' in tags:
-                    score += 10
-                
-                # ランニングに適したタイプの場所にボーナス
-                for key, value in tags.items():
-                    if key in running_friendly_types or value in running_friendly_types:
-                        score += 5
-                    
-                    # 特に重要な場所タイプにボーナス
-                    if (key == 'leisure' and value == 'park') or \
-                       (key == 'amenity' and value in ['school', 'university']):
-                        score += 3
-                
-                # ノードは通常ウェイやリレーションより小さい場所なので調整
-                if element['type'] == 'node':
-                    score -= 2
-                
-                scored_places.append({
-                    'name': name,
-                    'lat': lat,
-                    'lng': lon,
-                    'score': score,
-                    'type': element['type'],
-                    'tags': tags
-                })
-            
-            # スコアでソート
-            scored_places.sort(key=lambda x: x['score'], reverse=True)
-            
-            # 最も適した場所を返す
-            if scored_places:
-                return {
-                    'name': scored_places[0]['name'],
-                    'lat': scored_places[0]['lat'],
-                    'lng': scored_places[0]['lng']
-                }
-    
-    # 名称のある場所が見つからない場合は元の座標を返す
-    return {
-        'name': f"Waypoint at {lat:.6f}, {lon:.6f}",
-        'lat': lat,
-        'lng': lon
-    }
+    Returns:
+        {ジオハッシュ: 評価済みの場所のリスト} の辞書。Overpassへの問い合わせに失敗した場合はNone
+    """
+    places_by_tile = {}
+    missing = []
+    for tile in tiles:
+        if tile in places_by_tile or tile in missing:
+            continue
+        places = poi_cache.get(tile, radius)
+        if places is None:
+            missing.append(tile)
+        else:
+            places_by_tile[tile] = places
+    
+    if missing:
+        fetched = _fetch_tiles(missing, radius, deadline)
+        if fetched is None:
+            return None
+        places_by_tile.update(fetched)
+    
+    return places_by_tile
+
+def find_named_places_osm_batch(geo_coords, radius=100, deadline=None):
+    """
+    キャッシュにない地点の周辺検索を1回のOverpass unionクエリにまとめて実行し、
+    見つかった場所を最も近い地点に振り分けて経由地点を選ぶ
+    
+    Args:
+        geo_coords: [(lat1, lon1), (lat2, lon2), ...] 形式の緯度経度リスト
+        radius: 検索半径（メートル）
+        deadline: Overpassへの問い合わせの締め切り（time.monotonic() 基準）
+        
+    Returns:
+        入力と同じ順序の経由地点リスト。Overpassへの問い合わせに失敗した場合はNone
+    """
+    if not geo_coords:
+        return []
+    
+    tiles = [geohash.encode(lat, lon, POI_TILE_PRECISION) for lat, lon in geo_coords]
+    places_by_tile = load_tiles(tiles, radius, deadline)
+    if places_by_tile is None:
+        return None
+    
+    # 検索半径内の場所のうち、その地点が最も近いものだけを候補にする
+    anchor_lats = [lat for lat, _ in geo_coords]
+    anchor_lons = [lon for _, lon in geo_coords]
+    waypoints = []
+    for i, ((lat, lon), tile) in enumerate(zip(geo_coords, tiles)):
+        candidates = _places_within(places_by_tile[tile], lat, lon, radius)
+        if candidates:
+            distances = geodesy.haversine_matrix(
+                [p['lat'] for p in candidates], [p['lng'] for p in candidates], anchor_lats, anchor_lons
+            )
+            nearest = distances.argmin(axis=1)
+            candidates = [place for place, j in zip(candidates, nearest) if j == i]
+        waypoints.append(_best_place(candidates, lat, lon))
+    
+    return waypoints
+
+def snap_waypoints(geo_coords, radius=300, max_workers=SNAP_MAX_WORKERS, deadline_sec=SNAP_DEADLINE_SEC):
+    """
+    各地点周辺の名称のある場所を検索し、経由地点に置き換える
+    
+    まず全地点を1回のOverpassクエリでまとめて検索し、失敗した場合は
+    地点ごとの検索を並列に実行する
+    
+    Args:
+        geo_coords: [(lat1, lon1), (lat2, lon2), ...] 形式の緯度経度リスト
+        radius: 検索半径（メートル）
+        max_workers: 同時に実行する検索の上限
+        deadline_sec: まとめた検索と地点ごとの検索で共有する締め切り（秒）。超過した地点は元の座標を使う
+        
+    Returns:
+        入力と同じ順序の経由地点リスト [{'name': ..., 'lat': ..., 'lng': ...}, ...]
+    """
+    if not geo_coords:
+        return []
+    
+    # まとめた検索と地点ごとの検索で同じ締め切りを使う
+    deadline = time.monotonic() + deadline_sec
+    waypoints = find_named_places_osm_batch(geo_coords, radius, deadline)
+    if waypoints is not None:
+        return waypoints
+    
+    if time.monotonic() >= deadline:
+        logger.warning("Overpass lookup timed out: using the projected coordinates")
+        return [_fallback_waypoint(lat, lon) for lat, lon in geo_coords]
+    
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(geo_coords)))
+    try:
+        futures = [executor.submit(find_named_places_osm, lat, lon, radius, deadline) for lat, lon in geo_coords]
+        
+        waypoints = []
+        for (lat, lon), future in zip(geo_coords, futures):
+            remaining = max(0.0, deadline - time.monotonic())
+            try:
+                waypoints.append(future.result(timeout=remaining))
+            except FutureTimeoutError:
+                logger.warning(f"Overpass lookup timed out: {lat:.6f}, {lon:.6f}")
+                waypoints.append(_fallback_waypoint(lat, lon))
+            except Exception as e:
+                logger.warning(f"Overpass lookup failed: {lat:.6f}, {lon:.6f} - {e}")
+                waypoints.append(_fallback_waypoint(lat, lon))
+        return waypoints
+    finally:
+        # 締め切りを過ぎた検索の完了は待たない
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _directions_cache_key(profile, coordinates):
+    """経由地点の順序付き座標列（小数6桁に丸める）とプロファイルからキャッシュキーを作る"""
+    rounded = [[round(lng, DIRECTIONS_CACHE_PRECISION), round(lat, DIRECTIONS_CACHE_PRECISION)] for lng, lat in coordinates]
+    payload = json.dumps([profile, rounded], separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
-def get_route_distance(waypoints, ors_api_key):
+def get_route_distance(waypoints, ors_api_key, profile=ORS_PROFILE, backend=None):
     """
-    OpenRouteServiceを使って実際のルート距離を計算
+    経路探索バックエンドを使って実際のルート距離を計算
+    
+    同じ経由地点列の結果はキャッシュし、2回目以降は経路探索を行わない
     
     Args:
         waypoints: 経由地点のリスト [{'lat': a1, 'lng': b1}, ...]
         ors_api_key: OpenRouteService API Key
+        profile: ORSの移動手段プロファイル
+        backend: "ors" または "local"（Noneの場合は ROUTING_BACKEND）
         
     Returns:
         実際のルート総距離（km）とGeoJSON形式のルート情報
     """
-    url = "https://api.openrouteservice.org/v2/directions/foot-walking/geojson"
+    backend = backend or ROUTING_BACKEND
     
     # 座標リストを作成
     coordinates = []
     for point in waypoints:
         coordinates.append([point['lng'], point['lat']])
     
+    # 同じ経由地点列のレスポンスがあればそれを使う
+    cache_key = _directions_cache_key(f"{backend}:{profile}", coordinates)
+    content = directions_cache.get(cache_key)
+    
+    if content is None:
+        with stage("directions"):
+            if backend == "local":
+                content = _local_directions(coordinates)
+            else:
+                content = _ors_directions(coordinates, ors_api_key, profile)
+        if content is None:
+            return None, None
+        directions_cache.put(cache_key, content)
+    
+    # 呼び出し側で書き換えられても影響しないよう、キャッシュには生のレスポンスを保持して毎回パースする
+    route_data = json.loads(content)
+    # 総距離を取得（メートルからキロメートルに変換）
+    total_distance = route_data['features'][0]['properties']['summary']['distance'] / 1000
+    return total_distance, route_data
+
+def _ors_directions(coordinates, ors_api_key, profile):
+    """OpenRouteServiceでルートを検索し、レスポンスの生データを返す（失敗時はNone）"""
+    url = f"{ORS_BASE_URL}/v2/directions/{profile}/geojson"
+    
     headers = {
         "Authorization": ors_api_key,
         "Content-Type": "application/json"
@@ -289,38 +508,61 @@ def get_route_distance(waypoints, ors_api_key):
         "coordinates": coordinates
     }
     
-    response = requests.post(url, json=body, headers=headers)
-    if response.status_code == 200:
-        route_data = response.json()
-        # 総距離を取得（メートルからキロメートルに変換）
-        total_distance = route_data['features'][0]['properties']['summary']['distance'] / 1000
-        return total_distance, route_data
-    else:
-        print(f"OpenRouteService API Error: {response.status_code} - {response.text}")
-        return None, None
+    try:
+        response = http_client.post(url, json=body, headers=headers, service="ors")
+    except requests.RequestException as e:
+        logger.error(f"OpenRouteService API Error: {e}")
+        return None
+    if response.status_code != 200:
+        logger.error(f"OpenRouteService API Error: {response.status_code} - {response.text}")
+        return None
     
-def generate_running_route(current_lat, current_lon, points, target_distance, ors_api_key):
+    return response.content
+
+def _local_directions(coordinates):
+    """ローカルの歩行者グラフでルートを検索し、ORSと同じ形のGeoJSONを返す（失敗時はNone）"""
+    try:
+        route_data = get_local_graph(LOCAL_GRAPH_PATH).route(coordinates)
+    except (OSError, ValueError) as e:
+        logger.error(f"Local routing error: {e}")
+        return None
+    if route_data is None:
+        logger.warning("Local routing error: no path between waypoints")
+        return None
+    
+    return json.dumps(route_data).encode('utf-8')
+
+def polygon_length(waypoints):
     """
-    ランニングルートを生成する
+    経由地点を順に結び、最初の地点に戻る多角形の直線距離の合計を計算
     
     Args:
-        current_lat: 現在地の緯度
-        current_lon: 現在地の経度
-        points: [(x1,y1), (x2,y2), ..., (xn,yn)] 形式の座標リスト
-        target_distance: 目標となる総距離（km）
-        ors_api_key: OpenRouteService API Key
+        waypoints: 経由地点のリスト [{'lat': a1, 'lng': b1}, ...]
         
     Returns:
-        ルート情報（経由地点と総距離）のJSON
+        直線距離の合計（km）
+    """
+    total = 0.0
+    for i in range(len(waypoints)):
+        p1 = waypoints[i]
+        p2 = waypoints[(i + 1) % len(waypoints)]
+        total += haversine_distance(p1['lat'], p1['lng'], p2['lat'], p2['lng'])
+    return total
+
+def _route_through(geo_coords, ors_api_key):
     """
-    # 座標から緯度経度を計算
-    geo_coords = calculate_geo_coordinates(current_lat, current_lon, points, target_distance)
+    投影した地点を名称のある場所にスナップし、ORSで循環ルートを検索する
     
-    # 各地点周辺の名称のある場所を検索
-    waypoints = []
-    for lat, lon in geo_coords:
-        waypoint = find_named_places_osm(lat, lon, radius=300)
-        waypoints.append(waypoint)
+    Args:
+        geo_coords: [(lat1, lon1), (lat2, lon2), ...] 形式の緯度経度リスト
+        ors_api_key: OpenRouteService API Key
+        
+    Returns:
+        (経由地点リスト, 実際のルート総距離（km）, GeoJSON形式のルート情報)
+    """
+    # 各地点周辺の名称のある場所を検索（並列実行、順序は維持）
+    with stage("snap"):
+        waypoints = snap_waypoints(geo_coords, radius=SNAP_RADIUS_M)
     
     # 最初の地点を最後にも追加して循環ルートにする
     if waypoints and len(waypoints) > 0:
@@ -334,15 +576,181 @@ def generate_running_route(current_lat, current_lon, points, target_distance, or
     actual_distance, route_data = get_route_distance(waypoints, ors_api_key)
     
     waypoints.pop()#出発地と到着地は同じなので、到着地を除外
+    return waypoints, actual_distance, route_data
+
+def generate_placements(current_lat, current_lon, points, target_distance, detour_factor,
+                        rotations_deg=PLACEMENT_ROTATIONS_DEG, scales=PLACEMENT_SCALES):
+    """
+    図形を回転・拡大縮小した配置候補の緯度経度をまとめて計算
+    
+    Args:
+        current_lat: 現在地の緯度
+        current_lon: 現在地の経度
+        points: [(x1,y1), (x2,y2), ..., (xn,yn)] 形式の座標リスト、または登録済みのShape
+        target_distance: 目標となる総距離（km）
+        detour_factor: 迂回係数
+        rotations_deg: 試す回転角（度、時計回り）のリスト
+        scales: 試す縮尺（目標距離に対する倍率）のリスト
+        
+    Returns:
+        (配置パラメータのリスト [{'rotation_deg': r, 'scale': s}, ...], (k, n, 2) の緯度経度配列)
+        先頭は回転0度・縮尺1の配置（従来の配置）
+    """
+    shape = shape_registry.resolve(points)
+    h = target_distance / detour_factor
+    
+    # 従来の配置を先頭にする
+    params = [{'rotation_deg': 0.0, 'scale': 1.0}]
+    params += [
+        {'rotation_deg': float(r), 'scale': float(sc)}
+        for r in rotations_deg for sc in scales
+        if not (r % 360 == 0 and sc == 1.0)
+    ]
+    rotation = np.array([p['rotation_deg'] for p in params])[:, None]
+    scale = np.array([p['scale'] for p in params])[:, None]
+    
+    # 最後のベクトルは最初に戻るので省略
+    bearings = shape.bearings_deg[:-1][None, :] + rotation
+    lengths = shape.lengths[:-1][None, :] * h * scale
+    coords = geodesy.walk_polygons(current_lat, current_lon, bearings, lengths)
+    
+    return params, coords
+
+def score_placements(coords, radius=SNAP_RADIUS_M):
+    """
+    配置候補を外部APIを呼ばずに評価する
+    
+    メモリ上のPOIキャッシュにある場所だけを使い、スナップ先が見つかりそうな頂点が多い配置ほど
+    高く評価する。緯度の範囲外の頂点や、水域（湖・川など）に吸着しそうな頂点は減点する
+    
+    Args:
+        coords: (k, n, 2) の緯度経度配列
+        radius: スナップの検索半径（メートル）
+        
+    Returns:
+        (k,) の評価値の配列（大きいほど良い）
+    """
+    k, n, _ = coords.shape
+    scores = np.zeros(k)
+    
+    # 範囲外（極付近）の頂点を含む配置は除外
+    out_of_bounds = (np.abs(coords[:, :, 0]) > MAX_PLACEMENT_LATITUDE).any(axis=1)
+    
+    tiles = np.array([
+        [geohash.encode(lat, lon, POI_TILE_PRECISION) for lat, lon in candidate]
+        for candidate in coords
+    ])
+    for tile in np.unique(tiles):
+        places = poi_cache.peek(tile, radius)
+        if not places:
+            continue
+        
+        place_lats = [p['lat'] for p in places]
+        place_lngs = [p['lng'] for p in places]
+        is_water = np.array([_is_water(p.get('tags', {})) for p in places])
+        
+        # このタイルに含まれる頂点と、タイル内の場所の距離
+        rows, cols = np.nonzero(tiles == tile)
+        distances_m = geodesy.haversine_matrix(coords[rows, cols, 0], coords[rows, cols, 1], place_lats, place_lngs) * 1000
+        within = distances_m <= radius
+        
+        has_place = (within & ~is_water).any(axis=1)
+        has_water = (within & is_water).any(axis=1)
+        np.add.at(scores, rows, has_place * PLACEMENT_HIT_SCORE + within.sum(axis=1) * PLACEMENT_DENSITY_SCORE)
+        np.add.at(scores, rows, has_water * -PLACEMENT_WATER_PENALTY)
+    
+    scores[out_of_bounds] = -np.inf
+    return scores
+
+def _is_water(tags):
+    """タグが水域（湖・川など）を表すか"""
+    return tags.get('natural') == 'water' or 'waterway' in tags or 'water' in tags
+
+def generate_running_route(current_lat, current_lon, points, target_distance, ors_api_key, detour_factor=None, top_k=1):
+    """
+    ランニングルートを生成する
+    
+    Args:
+        current_lat: 現在地の緯度
+        current_lon: 現在地の経度
+        points: [(x1,y1), (x2,y2), ..., (xn,yn)] 形式の座標リスト
+        target_distance: 目標となる総距離（km）
+        ors_api_key: OpenRouteService API Key
+        detour_factor: 迂回係数（Noneの場合は既定値）
+        top_k: ORSで検証する配置候補の数。2以上の場合は回転・拡大縮小した配置を
+            オフラインで評価し、上位の候補を並列に検証して目標距離に最も近いものを返す
+        
+    Returns:
+        ルート情報（経由地点と総距離）のJSON
+    """
+    if detour_factor is None:
+        detour_factor = DEFAULT_DETOUR_FACTOR
+    
+    placement = None
+    if top_k is None or top_k <= 1:
+        # 座標から緯度経度を計算
+        with stage("placement"):
+            geo_coords = calculate_geo_coordinates(current_lat, current_lon, points, target_distance, detour_factor)
+        waypoints, actual_distance, route_data = _route_through(geo_coords, ors_api_key)
+    else:
+        waypoints, actual_distance, route_data, placement = _search_placements(
+            current_lat, current_lon, points, target_distance, ors_api_key, detour_factor, top_k
+        )
+    
     # 結果を整形
     result = {
         "waypoints": waypoints,
         "total_distance": actual_distance,
+        "straight_distance": polygon_length(waypoints),
+        "detour_factor": detour_factor,
         "route": route_data
     }
+    if placement is not None:
+        result["placement"] = placement
     return result
     # return json.dumps(result, indent=2, ensure_ascii=False) #テスト用
 
+def _search_placements(current_lat, current_lon, points, target_distance, ors_api_key, detour_factor, top_k):
+    """
+    配置候補をオフラインで絞り込み、上位top_k件だけをORSで並列に検証する
+    
+    Returns:
+        目標距離に最も近い候補の (経由地点リスト, 実際の距離, ルート情報, 配置パラメータ)
+    """
+    top_k = min(top_k, PLACEMENT_MAX_TOP_K)
+    with stage("placement"):
+        params, coords = generate_placements(current_lat, current_lon, points, target_distance, detour_factor)
+        scores = score_placements(coords)
+    
+    # 評価の高い順（同点なら従来の配置に近い順）に上位を選ぶ
+    order = [i for i in np.argsort(-scores, kind='stable') if np.isfinite(scores[i])][:top_k]
+    if not order:
+        order = [0]
+    
+    candidates = [[(float(lat), float(lon)) for lat, lon in coords[i]] for i in order]
+    
+    # 上位候補の周辺POIを1回のOverpassクエリでまとめて取得しておく（失敗しても各候補で再検索する）
+    load_tiles(
+        [geohash.encode(lat, lon, POI_TILE_PRECISION) for candidate in candidates for lat, lon in candidate],
+        SNAP_RADIUS_M
+    )
+    
+    with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+        results = list(executor.map(lambda geo_coords: _route_through(geo_coords, ors_api_key), candidates))
+    
+    # 目標距離に最も近い候補を選ぶ（ルートが得られなかった候補は除く）
+    best = None
+    for i, (waypoints, actual_distance, route_data) in zip(order, results):
+        if actual_distance is None:
+            continue
+        if best is None or abs(actual_distance - target_distance) < abs(best[1] - target_distance):
+            best = (waypoints, actual_distance, route_data, params[i])
+    
+    if best is None:
+        waypoints, actual_distance, route_data = results[0]
+        return waypoints, actual_distance, route_data, params[order[0]]
+    return best
+
 
 # # テスト用のメイン実行部分（このファイルが直接実行された場合のみ実行）
 # if __name__ == "__main__":
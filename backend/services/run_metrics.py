@@ -0,0 +1,164 @@
+"""
+ラン指標の計算モジュール
+走行軌跡の座標と時刻から距離・移動時間・ペース・1kmごとのスプリットを、
+全ての点をまとめたNumPyの配列計算で求めます。軌跡をチャンクで受け取る場合は、
+前のチャンクまでの状態を引き継いで続きだけを計算します
+"""
+
+import numpy as np
+
+from utils import geodesy
+
+MOVING_SPEED_MIN_MPS = 0.5     # これより遅い区間は停止中として距離・時間に含めない（GPSのぶれ対策）
+MOVING_SPEED_MAX_MPS = 12.0    # これより速い区間はGPSの飛びとして除く
+CALORIES_PER_KM = 60           # 1kmあたりの消費カロリー（体重の情報がないので一定）
+
+
+class RunMetricsAccumulator:
+    """
+    走行軌跡から指標を積み上げて計算する
+
+    update() に点の配列を順に渡すと、前回の最後の点から続けて距離と時間を加算する。
+    状態は to_dict() / from_dict() でJSONとして保存・復元できる
+    """
+
+    def __init__(self):
+        self.points = 0
+        self.distance_km = 0.0
+        self.moving_sec = 0.0
+        self.first_time = None
+        self.last = None            # [緯度, 経度, 時刻（UNIX秒）]
+        self.splits = []            # 1kmごとの所要時間（移動時間の秒）
+        self.split_start_sec = 0.0  # 最後のスプリットを区切ったときの移動時間
+
+    def update(self, lats, lons, times):
+        """
+        点のチャンクを追加
+
+        Args:
+            lats, lons: 緯度・経度の配列
+            times: 時刻（UNIX秒）の配列
+
+        Returns:
+            各点のスタートからの距離（km）の配列
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        times = np.asarray(times, dtype=float)
+        if len(lats) == 0:
+            return np.empty(0)
+
+        # 前のチャンクの最後の点から続ける（最初のチャンクは最初の点を起点にする）
+        if self.last is not None:
+            prev = np.asarray(self.last, dtype=float)[:, None]
+        else:
+            prev = np.array([[lats[0]], [lons[0]], [times[0]]])
+            self.first_time = float(times[0])
+        prev_lats = np.concatenate([prev[0], lats[:-1]])
+        prev_lons = np.concatenate([prev[1], lons[:-1]])
+        prev_times = np.concatenate([prev[2], times[:-1]])
+
+        seg_km = geodesy.haversine(prev_lats, prev_lons, lats, lons)
+        seg_sec = times - prev_times
+
+        # 移動中の区間だけを数える
+        with np.errstate(divide='ignore', invalid='ignore'):
+            speed = np.where(seg_sec > 0, seg_km * 1000 / seg_sec, np.inf)
+        moving = (speed >= MOVING_SPEED_MIN_MPS) & (speed <= MOVING_SPEED_MAX_MPS)
+        seg_km = np.where(moving, seg_km, 0.0)
+        seg_sec = np.where(moving, seg_sec, 0.0)
+
+        cum_km = self.distance_km + np.cumsum(seg_km)
+        cum_sec = self.moving_sec + np.cumsum(seg_sec)
+        self._add_splits(cum_km, cum_sec)
+
+        self.points += len(lats)
+        self.distance_km = float(cum_km[-1])
+        self.moving_sec = float(cum_sec[-1])
+        self.last = [float(lats[-1]), float(lons[-1]), float(times[-1])]
+        return cum_km
+
+    def _add_splits(self, cum_km, cum_sec):
+        """このチャンクで通過したkmの地点の移動時間を線形補間で求め、スプリットに追加"""
+        kms = np.arange(len(self.splits) + 1, np.floor(cum_km[-1]) + 1)
+        if len(kms) == 0:
+            return
+
+        # 各kmを通過した区間の前後の累積距離・時間
+        all_km = np.concatenate([[self.distance_km], cum_km])
+        all_sec = np.concatenate([[self.moving_sec], cum_sec])
+        after = np.searchsorted(all_km, kms, side='left')
+        km0, km1 = all_km[after - 1], all_km[after]
+        sec0, sec1 = all_sec[after - 1], all_sec[after]
+        crossed = sec0 + (kms - km0) / (km1 - km0) * (sec1 - sec0)
+
+        split_secs = np.diff(np.concatenate([[self.split_start_sec], crossed]))
+        self.splits.extend(round(float(sec), 1) for sec in split_secs)
+        self.split_start_sec = float(crossed[-1])
+
+    def summary(self):
+        """
+        指標の集計結果
+
+        Returns:
+            {"distance_km", "elapsed_sec", "moving_time_sec", "pace_min_per_km", "calories", "splits"} の辞書。
+            splits は [{"km", "time_sec", "pace_min_per_km"}, ...]（最後の1km未満の区間は含まない）
+        """
+        elapsed = self.last[2] - self.first_time if self.last is not None else 0.0
+        return {
+            "distance_km": round(self.distance_km, 3),
+            "elapsed_sec": round(elapsed, 1),
+            "moving_time_sec": round(self.moving_sec, 1),
+            "pace_min_per_km": pace_min_per_km(self.moving_sec, self.distance_km),
+            "calories": int(self.distance_km * CALORIES_PER_KM),
+            "splits": [
+                {"km": i + 1, "time_sec": sec, "pace_min_per_km": round(sec / 60, 2)}
+                for i, sec in enumerate(self.splits)
+            ],
+        }
+
+    def to_dict(self):
+        """保存用の状態"""
+        return {
+            "points": self.points,
+            "distance_km": self.distance_km,
+            "moving_sec": self.moving_sec,
+            "first_time": self.first_time,
+            "last": self.last,
+            "splits": self.splits,
+            "split_start_sec": self.split_start_sec,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """to_dict() の状態から復元（to_dict() が書き出す項目だけを読み込む）"""
+        accumulator = cls()
+        if state:
+            for key in accumulator.to_dict():
+                if key in state:
+                    value = state[key]
+                    setattr(accumulator, key, list(value) if isinstance(value, list) else value)
+        return accumulator
+
+
+def pace_min_per_km(seconds, distance_km):
+    """所要時間と距離からペース（分/km）を計算（距離が0ならNone）"""
+    if distance_km <= 0:
+        return None
+    return round(seconds / 60 / distance_km, 2)
+
+
+def compute_run_metrics(lats, lons, times):
+    """
+    軌跡全体から指標を計算
+
+    Args:
+        lats, lons: 緯度・経度の配列
+        times: 時刻（UNIX秒）の配列
+
+    Returns:
+        RunMetricsAccumulator.summary() と同じ形の辞書
+    """
+    accumulator = RunMetricsAccumulator()
+    accumulator.update(lats, lons, times)
+    return accumulator.summary()
@@ -0,0 +1,160 @@
+"""
+図形レジストリモジュール
+特徴点抽出の結果（static/keypoints_results の CSV）から動物の図形を読み込み、
+ルート生成に使う辺の方位角・長さ・周長を図形ごとに一度だけ計算してメモリに保持します
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import threading
+
+import numpy as np
+
+from services.cache import LRUCache
+from utils import geodesy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHAPE = "hiyoko"  # 用意されていないイラストの場合に使う図形
+SHAPE_VECTORS_CACHE_MAXSIZE = 256  # 名前のない座標列について保持するベクトル数
+
+
+def points_hash(points):
+    """座標点リストの内容ハッシュ"""
+    data = np.asarray(points, dtype=np.int64).tobytes()
+    return hashlib.sha256(data).hexdigest()
+
+
+class Shape:
+    """
+    図形（座標点リスト）と、そこから計算した辺のベクトル
+
+    bearings_deg[i] と lengths[i] は点iから点i+1（最後は最後の点から最初の点）への辺の
+    方位角（度、北が0度で時計回り）と、周長を1とした長さ
+    """
+
+    def __init__(self, name, points):
+        self.name = name
+        self.points = [tuple(int(v) for v in point) for point in points]
+        self.content_hash = points_hash(self.points)
+
+        directions, magnitudes = geodesy.shape_vectors(self.points)
+        self.perimeter = float(magnitudes.sum())
+        self.bearings_deg = np.degrees(directions)
+        self.lengths = magnitudes / self.perimeter if self.perimeter > 0 else magnitudes
+
+        # 計算済みの配列は共有するので書き換えを禁止する
+        self.bearings_deg.flags.writeable = False
+        self.lengths.flags.writeable = False
+
+    def __len__(self):
+        return len(self.points)
+
+    def to_dict(self):
+        """APIで返す形式"""
+        return {"name": self.name, "points": self.points, "hash": self.content_hash}
+
+
+class ShapeRegistry:
+    """
+    名前と内容ハッシュで図形を引けるレジストリ
+
+    名前付きの図形は起動時にCSVから読み込む。名前のない座標列も内容ハッシュで
+    ベクトルをキャッシュするので、同じ図形を毎回計算し直すことはない
+    """
+
+    def __init__(self):
+        self._by_name = {}
+        self._by_hash = LRUCache(SHAPE_VECTORS_CACHE_MAXSIZE)
+        self._lock = threading.Lock()
+
+    def register(self, name, points):
+        """
+        図形を登録
+
+        Args:
+            name: 図形の名前（動物名など）
+            points: [(x1,y1), (x2,y2), ...] 形式の座標リスト
+
+        Returns:
+            登録したShape
+        """
+        shape = Shape(name, points)
+        with self._lock:
+            self._by_name[name] = shape
+        self._by_hash.put(shape.content_hash, shape)
+        return shape
+
+    def load_directory(self, directory):
+        """
+        特徴点抽出の結果ディレクトリから図形を読み込む
+
+        ファイル名は「{名前}_keypoints_{タイムスタンプ}.csv」。同じ名前が複数ある場合は
+        タイムスタンプが最も新しいものを使う
+
+        Args:
+            directory: CSVのあるディレクトリ
+
+        Returns:
+            読み込んだ図形の名前のリスト
+        """
+        latest = {}
+        for path in sorted(glob.glob(os.path.join(directory, "*_keypoints_*.csv"))):
+            name = os.path.basename(path).split("_keypoints_")[0]
+            latest[name] = path  # ソート済みなので後のものほど新しい
+
+        loaded = []
+        for name, path in latest.items():
+            try:
+                points = np.loadtxt(path, delimiter=",", comments="#", dtype=np.int64, ndmin=2)
+            except ValueError as e:
+                logger.warning(f"Shape load error: {path} - {e}")
+                continue
+            self.register(name, points.tolist())
+            loaded.append(name)
+        return loaded
+
+    def get(self, name, default=DEFAULT_SHAPE):
+        """
+        名前で図形を取得
+
+        Args:
+            name: 図形の名前
+            default: 見つからない場合に使う図形の名前
+
+        Returns:
+            Shape（defaultも見つからない場合はNone）
+        """
+        shape = self._by_name.get(name)
+        if shape is None and default is not None:
+            shape = self._by_name.get(default)
+        return shape
+
+    def names(self):
+        """登録済みの図形の名前"""
+        return sorted(self._by_name)
+
+    def resolve(self, points):
+        """
+        座標点リストに対応するShapeを内容ハッシュで取得（なければ計算してキャッシュ）
+
+        Args:
+            points: Shape または [(x1,y1), (x2,y2), ...] 形式の座標リスト
+
+        Returns:
+            Shape
+        """
+        if isinstance(points, Shape):
+            return points
+        content_hash = points_hash(points)
+        shape = self._by_hash.get(content_hash)
+        if shape is None:
+            shape = Shape(None, points)
+            self._by_hash.put(content_hash, shape)
+        return shape
+
+
+# アプリケーション全体で共有するレジストリ
+shape_registry = ShapeRegistry()
@@ -0,0 +1,184 @@
+"""
+図形アップロードモジュール
+ユーザーがアップロードしたイラストから特徴点を抽出し、画像の内容ハッシュを図形IDとして
+図形レジストリに登録します。抽出はリクエストスレッドとは別のプロセスで行い、
+同じ画像の再アップロードには抽出済みの結果をそのまま返します
+"""
+
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from datetime import datetime
+
+from services.job_service import JobQueue, JobTimeoutError
+from services.shape_registry import shape_registry
+
+# アップロードを受け付ける画像の拡張子
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif'}
+
+
+def _extract_in_child(image_path, conn):
+    """子プロセスで特徴点を抽出し、結果をパイプで返す"""
+    from utils.extract_keypoints import extract_keypoints_from_image
+
+    try:
+        conn.send(extract_keypoints_from_image(image_path))
+    finally:
+        conn.close()
+
+
+class ShapeUploadService:
+    """
+    アップロード画像の保存・特徴点抽出・結果のキャッシュを行う
+
+    抽出結果は保存ディレクトリの manifest.json に内容ハッシュごとに記録し、
+    起動時に読み込んで図形レジストリに登録する
+    """
+
+    def __init__(self, upload_dir, workers=2, max_queue=16, timeout_sec=60.0, processes=2):
+        self.upload_dir = upload_dir
+        self.jobs = JobQueue("shape", max_workers=workers, max_queue=max_queue, timeout_sec=timeout_sec)
+        # 同時に動かす抽出プロセスの数
+        self._process_slots = threading.BoundedSemaphore(processes)
+        self._lock = threading.Lock()
+        # 同じ画像の受け付けを1つずつ行う（ジョブの確認・画像の保存・登録をまとめて行う）
+        self._submit_lock = threading.Lock()
+
+    def load(self):
+        """保存済みの抽出結果を図形レジストリに登録"""
+        from utils.extract_keypoints import load_manifest
+
+        if not os.path.exists(self.upload_dir):
+            return []
+        images = load_manifest(self.upload_dir)
+        for content_hash, entry in images.items():
+            shape_registry.register(content_hash, entry['keypoints'])
+        return list(images)
+
+    def submit(self, data, filename):
+        """
+        アップロード画像を受け付ける
+
+        Args:
+            data: 画像ファイルのバイト列
+            filename: 元のファイル名（拡張子の判定に使う）
+
+        Returns:
+            (図形ID, 状態) のタプル。状態は ready（抽出済み）/ queued / running
+
+        Raises:
+            ValueError: 対応していない形式の場合
+            QueueFullError: 抽出待ちが上限に達している場合
+        """
+        ext = os.path.splitext(filename or '')[1].lower()
+        if ext not in ALLOWED_EXTENSIONS:
+            raise ValueError(f"対応していない画像形式です: {ext or filename}")
+        if not data:
+            raise ValueError("画像が空です")
+
+        shape_id = hashlib.sha256(data).hexdigest()
+
+        with self._submit_lock:
+            # 抽出済みならすぐに返す
+            if shape_registry.get(shape_id, default=None) is not None:
+                return shape_id, "ready"
+
+            # 同じ画像の抽出が進行中ならそのジョブを使う
+            job = self.jobs.get(shape_id)
+            if job is not None and job["status"] in ("queued", "running"):
+                return shape_id, job["status"]
+
+            if not os.path.exists(self.upload_dir):
+                os.makedirs(self.upload_dir, exist_ok=True)
+            image_path = os.path.join(self.upload_dir, f"{shape_id}{ext}")
+            # ファイル名は内容ハッシュなので、保存済みなら中身は同じ（抽出中のファイルは開き直さない）
+            if not os.path.exists(image_path):
+                tmp_path = f"{image_path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, image_path)
+
+            self.jobs.submit(self._extract, shape_id, image_path, job_id=shape_id)
+        return shape_id, "queued"
+
+    def _extract(self, deadline, shape_id, image_path):
+        """
+        ジョブワーカーで特徴点を抽出し、図形レジストリとマニフェストに登録
+
+        抽出は画像ごとに別のプロセスで行い、締め切りを過ぎたら子プロセスを終了させる
+        （処理が止まった画像があっても、抽出プロセスの枠を使い続けない）
+        """
+        if not self._process_slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise JobTimeoutError("keypoint extraction timed out waiting for a worker process")
+        try:
+            keypoints = self._run_extraction(deadline, image_path)
+        finally:
+            self._process_slots.release()
+
+        if keypoints is None or len(keypoints) < 3:
+            raise RuntimeError("画像から特徴点を抽出できませんでした")
+
+        points = [[int(x), int(y)] for x, y in keypoints]
+        self._save_manifest_entry(shape_id, image_path, points)
+        shape_registry.register(shape_id, points)
+        return points
+
+    def _run_extraction(self, deadline, image_path):
+        """子プロセスで特徴点を抽出し、締め切りまで結果を待つ"""
+        # スレッドを持つWebプロセスからforkしないようspawnで起動する
+        context = multiprocessing.get_context("spawn")
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_extract_in_child, args=(image_path, sender), daemon=True)
+        process.start()
+        sender.close()
+        try:
+            if not receiver.poll(max(0.0, deadline - time.monotonic())):
+                raise JobTimeoutError("keypoint extraction timed out")
+            try:
+                return receiver.recv()
+            except EOFError:
+                # 結果を返す前に子プロセスが異常終了した
+                raise RuntimeError("keypoint extraction worker crashed")
+        finally:
+            receiver.close()
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    def _save_manifest_entry(self, shape_id, image_path, points):
+        """抽出結果をマニフェストに追記"""
+        from utils.extract_keypoints import load_manifest, save_manifest
+
+        with self._lock:
+            images = load_manifest(self.upload_dir)
+            images[shape_id] = {
+                'name': shape_id,
+                'source': os.path.basename(image_path),
+                'keypoints': points,
+                'extracted_at': datetime.now().isoformat(timespec='seconds'),
+            }
+            save_manifest(self.upload_dir, images)
+
+    def status(self, shape_id):
+        """
+        図形の抽出状態を取得
+
+        Args:
+            shape_id: 図形ID（画像の内容ハッシュ）
+
+        Returns:
+            {"shape_id", "status", "points" or "error"} の辞書。見つからない場合はNone
+        """
+        shape = shape_registry.get(shape_id, default=None)
+        if shape is not None:
+            return {"shape_id": shape_id, "status": "ready", "points": shape.points}
+
+        job = self.jobs.get(shape_id)
+        if job is None:
+            return None
+        response = {"shape_id": shape_id, "status": job["status"]}
+        if job["error"]:
+            response["error"] = job["error"]
+        return response
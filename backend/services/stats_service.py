@@ -0,0 +1,131 @@
+"""
+ラン集計モジュール
+ラン記録の合計・動物ごと・期間ごとの距離、回数、平均ペースを、
+インデックスのある列に対するSQLの集計で求めます
+"""
+
+import os
+import time
+
+from sqlalchemy import Integer, case, cast, func
+
+from models import db, Route, Run
+from services.cache import LRUCache
+
+STATS_PERIODS = ("day", "week", "month")
+STATS_CACHE_TTL_SEC = float(os.getenv("STATS_CACHE_TTL_SEC", "30"))  # 同じ条件の集計結果を使い回す秒数
+STATS_CACHE_MAXSIZE = 128
+
+_stats_cache = LRUCache(STATS_CACHE_MAXSIZE)
+
+
+def clear_stats_cache():
+    """集計結果のキャッシュを消す（ランを完了したときに呼ぶ）"""
+    _stats_cache.clear()
+
+
+def period_expression(period):
+    """
+    start_time を期間ごとにまとめるSQL式（データベースの方言ごとに作る）
+
+    Args:
+        period: "day" / "week"（ISO週） / "month"
+
+    Returns:
+        期間のラベル（"2025-04-26" / "2025-W17" / "2025-04"）を返すSQL式
+    """
+    if db.engine.dialect.name == "sqlite":
+        if period == "week":
+            # SQLiteの %W はISO週ではないので、週の木曜日の年と年内の日数からISO週を求める
+            thursday = func.date(Run.start_time, "weekday 0", "-3 days")
+            week = (cast(func.strftime("%j", thursday), Integer) - 1) // 7 + 1
+            return func.printf("%s-W%02d", func.strftime("%Y", thursday), week)
+        formats = {"day": "%Y-%m-%d", "month": "%Y-%m"}
+        return func.strftime(formats[period], Run.start_time)
+    formats = {"day": "%Y-%m-%d", "week": "%x-W%v", "month": "%Y-%m"}
+    return func.date_format(Run.start_time, formats[period])
+
+
+def _aggregates():
+    """
+    回数・距離・カロリーの合計と平均ペースの集計列
+
+    平均ペースは移動時間の合計 ÷ 距離の合計（ランごとの移動時間は ペース × 距離）。
+    ペースのないランは平均ペースに含めない
+    """
+    paced_distance = case((Run.pace_min_per_km.isnot(None), Run.actual_distance_km))
+    return (
+        func.count(Run.id).label("runs"),
+        func.coalesce(func.sum(Run.actual_distance_km), 0.0).label("distance_km"),
+        (
+            func.sum(Run.pace_min_per_km * Run.actual_distance_km) / func.nullif(func.sum(paced_distance), 0)
+        ).label("avg_pace_min_per_km"),
+        func.coalesce(func.sum(Run.calories), 0).label("calories"),
+    )
+
+
+def _row_to_dict(row, **keys):
+    """集計結果の行をレスポンスの辞書にする"""
+    pace = row.avg_pace_min_per_km
+    return dict(
+        keys,
+        runs=int(row.runs),
+        distance_km=round(float(row.distance_km), 3),
+        avg_pace_min_per_km=round(float(pace), 2) if pace is not None else None,
+        calories=int(row.calories),
+    )
+
+
+def run_stats(start=None, end=None, period="month"):
+    """
+    ラン記録を集計
+
+    Args:
+        start: 集計する start_time の下限（datetime、含む）
+        end: 集計する start_time の上限（datetime、含まない）
+        period: 期間ごとの集計の単位（STATS_PERIODS のいずれか）
+
+    Returns:
+        {"totals": {...}, "by_animal": [...], "by_period": [...]} の辞書
+    """
+    if period not in STATS_PERIODS:
+        raise ValueError(f"period は {STATS_PERIODS} のいずれかを指定してください: {period}")
+
+    key = (start, end, period)
+    cached = _stats_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < STATS_CACHE_TTL_SEC:
+        return cached[1]
+
+    def filtered(query):
+        # start_time のインデックスで範囲を絞る
+        if start is not None:
+            query = query.filter(Run.start_time >= start)
+        if end is not None:
+            query = query.filter(Run.start_time < end)
+        return query
+
+    totals = filtered(db.session.query(*_aggregates())).one()
+
+    by_animal = (
+        filtered(db.session.query(Route.animal_name, *_aggregates()).join(Route, Run.route_id == Route.id))
+        .group_by(Route.animal_name)
+        .order_by(func.count(Run.id).desc(), Route.animal_name)
+        .all()
+    )
+
+    label = period_expression(period).label("period")
+    by_period = (
+        filtered(db.session.query(label, *_aggregates()).filter(Run.start_time.isnot(None)))
+        .group_by(label)
+        .order_by(label)
+        .all()
+    )
+
+    result = {
+        "period": period,
+        "totals": _row_to_dict(totals),
+        "by_animal": [_row_to_dict(row, animal_name=row.animal_name) for row in by_animal],
+        "by_period": [_row_to_dict(row, period=row.period) for row in by_period],
+    }
+    _stats_cache.put(key, (time.monotonic(), result))
+    return result
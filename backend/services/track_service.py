@@ -0,0 +1,188 @@
+"""
+走行軌跡の記録モジュール
+ラン中に送られてくるGPSの測位点をまとめて track_points テーブルに書き込み、
+スタートからの距離やペースなどの指標を前回の最後の点から続けて計算します
+"""
+
+import uuid
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import insert
+
+from models import db, Run, TrackPoint
+from services.run_metrics import RunMetricsAccumulator
+
+TRACK_INSERT_BATCH_SIZE = 500  # 1回の複数行INSERTに含める点の数
+
+
+class TrackOffsetError(Exception):
+    """チャンクの開始位置が記録済みの点数と合わない（途中のチャンクが抜けている）"""
+
+    def __init__(self, expected):
+        super().__init__(f"offset must be {expected}")
+        self.expected = expected
+
+
+def parse_track_points(points):
+    """
+    送信された測位点を検証して取り出す
+
+    Args:
+        points: [{"latitude", "longitude", "timestamp"(ISO 8601), "route_index"(省略可)}, ...]
+            timestamp は必須（時刻がないと区間の速度が求まらず、距離・ペースを計算できない）
+
+    Returns:
+        (緯度の配列, 経度の配列, 時刻のリスト, ルート上の区間番号のリスト)
+
+    Raises:
+        ValueError: 形式が不正な場合
+    """
+    if not isinstance(points, list):
+        raise ValueError("points はリストで指定してください")
+
+    lats = np.empty(len(points))
+    lons = np.empty(len(points))
+    timestamps = []
+    route_indices = []
+    for i, point in enumerate(points):
+        try:
+            lats[i] = float(point["latitude"])
+            lons[i] = float(point["longitude"])
+            timestamp = point.get("timestamp")
+            if not timestamp:
+                raise ValueError("timestamp がありません")
+            timestamps.append(datetime.fromisoformat(timestamp))
+            route_index = point.get("route_index")
+            route_indices.append(int(route_index) if route_index is not None else None)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ValueError(f"points[{i}] が不正です: {e}") from e
+
+    if np.any(np.abs(lats) > 90) or np.any(np.abs(lons) > 180):
+        raise ValueError("緯度経度の範囲が不正です")
+
+    return lats, lons, timestamps, route_indices
+
+
+def metrics_state(metrics):
+    """
+    runs.metrics から計算途中の状態を取り出す
+
+    runs.metrics は {"state": 計算途中の状態, "summary": 完了時の集計結果} の形で保存する
+    （以前は状態をそのまま保存していた）
+    """
+    if metrics is None:
+        return None
+    return metrics["state"] if "state" in metrics else metrics
+
+
+def load_metrics(run):
+    """
+    ランの指標の計算状態を取得
+
+    状態を保存していないラン（指標の計算を入れる前に記録したもの）は、記録済みの点から計算し直す
+    """
+    state = metrics_state(run.metrics)
+    if state is not None:
+        return RunMetricsAccumulator.from_dict(state)
+
+    accumulator = RunMetricsAccumulator()
+    rows = (
+        db.session.query(TrackPoint.latitude, TrackPoint.longitude, TrackPoint.timestamp)
+        .filter(TrackPoint.run_id == run.id)
+        .order_by(TrackPoint.seq)
+        .all()
+    )
+    if rows:
+        lats, lons, timestamps = zip(*rows)
+        accumulator.update(lats, lons, [timestamp.timestamp() for timestamp in timestamps])
+    return accumulator
+
+
+def append_track_points(run_id, points, offset):
+    """
+    ランの軌跡に測位点のチャンクを追加（コミットは呼び出し側で行う）
+
+    offset はチャンクの最初の点の通し番号（送信済みの点数）。再送されたチャンクのうち
+    記録済みの点は読み飛ばすので、同じチャンクを2回送っても重複しない
+
+    Args:
+        run_id: ランID
+        points: 測位点のリスト（parse_track_points の形式）
+        offset: チャンクの最初の点の通し番号
+
+    Returns:
+        {"received": 追加した点数, "total_points": 記録済みの点数, "distance_km": スタートからの距離}
+
+    Raises:
+        LookupError: ランが見つからない場合
+        ValueError: 測位点の形式が不正な場合
+        TrackOffsetError: offset が記録済みの点数より大きい場合
+    """
+    # 同じランのチャンクを並行して書き込まないよう、ランの行をロックする
+    run = db.session.query(Run).filter_by(id=run_id).with_for_update().first()
+    if run is None:
+        raise LookupError(f"Run not found: {run_id}")
+
+    lats, lons, timestamps, route_indices = parse_track_points(points)
+
+    metrics = load_metrics(run)
+    recorded = metrics.points
+    if offset > recorded:
+        raise TrackOffsetError(recorded)
+
+    # 記録済みの点は読み飛ばす
+    skip = recorded - offset
+    lats, lons = lats[skip:], lons[skip:]
+    timestamps, route_indices = timestamps[skip:], route_indices[skip:]
+    if len(lats) == 0:
+        return {"received": 0, "total_points": recorded, "distance_km": metrics.distance_km}
+
+    # 前回の最後の点から続けて、スタートからの累積距離と指標を計算する
+    distances = metrics.update(lats, lons, [timestamp.timestamp() for timestamp in timestamps])
+    run.metrics = {"state": metrics.to_dict()}
+
+    rows = [
+        {
+            "id": str(uuid.uuid4()),
+            "run_id": run_id,
+            "seq": recorded + i,
+            "timestamp": timestamps[i],
+            "latitude": float(lats[i]),
+            "longitude": float(lons[i]),
+            "distance_from_start": float(distances[i]),
+            "route_index": route_indices[i],
+        }
+        for i in range(len(lats))
+    ]
+
+    # 複数行INSERTでまとめて書き込む
+    for start in range(0, len(rows), TRACK_INSERT_BATCH_SIZE):
+        db.session.execute(insert(TrackPoint), rows[start:start + TRACK_INSERT_BATCH_SIZE])
+
+    return {
+        "received": len(rows),
+        "total_points": recorded + len(rows),
+        "distance_km": float(distances[-1])
+    }
+
+
+def track_geometry(run_id):
+    """
+    記録済みの軌跡をGeoJSONのLineStringで取得
+
+    Args:
+        run_id: ランID
+
+    Returns:
+        LineString。点がない場合はNone
+    """
+    rows = (
+        db.session.query(TrackPoint.longitude, TrackPoint.latitude)
+        .filter(TrackPoint.run_id == run_id)
+        .order_by(TrackPoint.seq)
+        .all()
+    )
+    if not rows:
+        return None
+    return {"type": "LineString", "coordinates": [[lon, lat] for lon, lat in rows]}
@@ -0,0 +1,64 @@
+"""
+テストの共通設定
+アプリはSQLiteのメモリ上のデータベースで起動し、Overpass・ORSには接続しない
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+# backend ディレクトリを import の起点にする（アプリと同じ `from services...` で読み込む）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# アプリを読み込む前に接続先を差し替える
+os.environ["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+os.environ.setdefault("POI_CACHE_PATH", os.path.join(tempfile.mkdtemp(prefix="gpsketch-test-"), "poi.sqlite3"))
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import app as flask_app
+    return flask_app
+
+
+@pytest.fixture
+def db_session(app):
+    """テストごとに空のテーブルを作り直す"""
+    from models import db
+
+    with app.app_context():
+        db.create_all()
+        yield db.session
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app, db_session):
+    return app.test_client()
+
+
+@pytest.fixture
+def route(db_session):
+    """ランの記録先になるルート"""
+    from models import Route
+
+    route = Route(
+        animal_name="hiyoko",
+        distance_km=3.0,
+        stat_end_latitude=35.681236,
+        stat_end_longitude=139.767125,
+        route_geojson={
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": [[139.767125, 35.681236], [139.787125, 35.681236]]},
+                "properties": {}
+            }]
+        }
+    )
+    db_session.add(route)
+    db_session.commit()
+    return route
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from services.adherence_service import ADHERENCE_FAR_CELL_M, score_adherence
+from utils import geodesy
+
+LAT0, LON0 = 35.681236, 139.767125
+M_PER_DEG_LAT = 111195.0
+
+
+def _route(length_m=2000.0, step_m=100.0):
+    """東向きにまっすぐ伸びるルートの [[lng, lat], ...]"""
+    m_per_deg_lon = M_PER_DEG_LAT * np.cos(np.radians(LAT0))
+    xs = np.arange(0.0, length_m + step_m, step_m)
+    return [[LON0 + x / m_per_deg_lon, LAT0] for x in xs]
+
+
+def _offset_track(north_m, count=50, length_m=2000.0):
+    m_per_deg_lon = M_PER_DEG_LAT * np.cos(np.radians(LAT0))
+    xs = np.linspace(0.0, length_m, count)
+    return np.full(count, LAT0 + north_m / M_PER_DEG_LAT), LON0 + xs / m_per_deg_lon
+
+
+def test_track_on_route_covers_it():
+    lats, lons = _offset_track(0.0, count=400)
+
+    result = score_adherence(_route(), lats, lons)
+
+    assert result["coverage_percent"] == pytest.approx(100.0)
+    assert result["on_route_percent"] == 100.0
+    assert result["off_route_count"] == 0
+
+
+def test_deviation_of_far_points_is_exact_within_far_cell():
+    lats, lons = _offset_track(200.0)
+
+    result = score_adherence(_route(), lats, lons)
+
+    assert result["on_route_percent"] == 0.0
+    assert result["max_deviation_m"] == pytest.approx(200.0, abs=1.0)
+    assert result["off_route_count"] == 1
+
+
+def test_deviation_is_capped_beyond_far_cell():
+    lats, lons = _offset_track(3000.0)
+
+    result = score_adherence(_route(), lats, lons)
+
+    assert result["max_deviation_m"] == ADHERENCE_FAR_CELL_M
+    assert result["coverage_percent"] == 0.0
+
+
+def test_matches_brute_force_deviation():
+    rng = np.random.default_rng(0)
+    route = _route(length_m=3000.0, step_m=50.0)
+    lats = LAT0 + rng.uniform(-300, 300, 500) / M_PER_DEG_LAT
+    lons = LON0 + rng.uniform(0, 3000, 500) / (M_PER_DEG_LAT * np.cos(np.radians(LAT0)))
+
+    result = score_adherence(route, lats, lons, tolerance_m=30.0)
+
+    # 全ての線分と比べたずれの最大
+    r = np.asarray(route)
+    lat0, lon0 = r[:, 1].mean(), r[:, 0].mean()
+    rx, ry = geodesy.local_xy(r[:, 1], r[:, 0], lat0, lon0)
+    px, py = geodesy.local_xy(lats, lons, lat0, lon0)
+    ax, ay, bx, by = rx[:-1], ry[:-1], rx[1:], ry[1:]
+    dx, dy = bx - ax, by - ay
+    t = np.clip(((px[:, None] - ax) * dx + (py[:, None] - ay) * dy) / (dx * dx + dy * dy), 0, 1)
+    d = np.hypot(px[:, None] - (ax + t * dx), py[:, None] - (ay + t * dy)).min(axis=1)
+
+    assert result["max_deviation_m"] == pytest.approx(d.max(), abs=0.1)
+    assert result["on_route_percent"] == pytest.approx(100.0 * np.mean(d <= 30.0), abs=0.1)
+
+
+def test_missing_input_returns_none():
+    assert score_adherence([[LON0, LAT0]], [LAT0], [LON0]) is None
+    assert score_adherence(_route(), [], []) is None
@@ -0,0 +1,38 @@
+import logging
+
+import pytest
+
+from models import DetourEstimate
+from services import detour_service
+from services.detour_service import DETOUR_PRIOR_WEIGHT, DETOUR_WINDOW, record_detour_sample
+from services.route_service import DEFAULT_DETOUR_FACTOR
+
+
+def _sequential_factor(ratios):
+    """1件ずつ読んで書く場合の推定値"""
+    factor, samples = DEFAULT_DETOUR_FACTOR, 0
+    for ratio in ratios:
+        weight = min(samples + DETOUR_PRIOR_WEIGHT + 1, DETOUR_WINDOW)
+        factor += (ratio - factor) / weight
+        samples += 1
+    return factor, samples
+
+
+def test_upsert_matches_sequential_average(db_session):
+    ratios = [1.2, 1.5, 1.1, 2.0]
+    for ratio in ratios:
+        record_detour_sample(35.68, 139.76, 1.0, ratio)
+
+    estimate = db_session.get(DetourEstimate, detour_service.detour_cell(35.68, 139.76))
+    factor, samples = _sequential_factor(ratios)
+    assert estimate.samples == samples
+    assert estimate.factor == pytest.approx(factor)
+
+
+def test_unsupported_database_skips_sample(db_session, monkeypatch, caplog):
+    monkeypatch.setattr(detour_service, "_upsert_statement", lambda cell, ratio: None)
+
+    with caplog.at_level(logging.WARNING):
+        assert record_detour_sample(35.68, 139.76, 1.0, 1.3) is None
+    assert "unsupported database" in caplog.text
+    assert db_session.query(DetourEstimate).count() == 0
@@ -0,0 +1,36 @@
+import pytest
+
+from app import parse_generate_request
+from services.route_service import PLACEMENT_MAX_TOP_K
+
+
+def test_defaults():
+    params = parse_generate_request({"shape": "hiyoko"})
+
+    assert params["shape"] == "hiyoko"
+    assert params["candidates"] == 1
+    assert params["reuse"] is False
+
+
+@pytest.mark.parametrize("candidates, expected", [(1, 1), (3, 3), (0, 1), (-2, 1), (100, PLACEMENT_MAX_TOP_K)])
+def test_candidates_are_clamped(candidates, expected):
+    assert parse_generate_request({"candidates": candidates})["candidates"] == expected
+
+
+@pytest.mark.parametrize("candidates", [2.7, True, False, "3", None, [2], {"n": 2}])
+def test_non_integer_candidates_are_rejected(candidates):
+    with pytest.raises(ValueError, match="candidates"):
+        parse_generate_request({"candidates": candidates})
+
+
+@pytest.mark.parametrize("data", [None, {}, {"latitude": None}, {"shape": ""}, {"shape": "x" * 65}, {"shape": 1}])
+def test_invalid_requests_are_rejected(data):
+    with pytest.raises(ValueError):
+        parse_generate_request(data)
+
+
+def test_generate_returns_json_400_for_bad_candidates(client):
+    response = client.post("/api/route/generate", json={"candidates": 2.7})
+
+    assert response.status_code == 400
+    assert "candidates" in response.get_json()["error"]
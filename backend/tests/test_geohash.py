@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from services.route_lookup_service import START_GEOHASH_PRECISION, search_precision
+from utils import geodesy, geohash
+
+
+def test_encode_known_value():
+    # 広く使われている参照値
+    assert geohash.encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash.encode(35.681236, 139.767125, 7) == "xn76urx"
+
+
+def test_decode_bbox_contains_point():
+    rng = np.random.default_rng(0)
+    for lat, lon in zip(rng.uniform(-89, 89, 200), rng.uniform(-179, 179, 200)):
+        for precision in (3, 5, 7, 9):
+            lat_min, lat_max, lon_min, lon_max = geohash.decode_bbox(geohash.encode(lat, lon, precision))
+            assert lat_min <= lat <= lat_max
+            assert lon_min <= lon <= lon_max
+
+
+def test_neighbors_surround_the_tile():
+    center = geohash.encode(35.681236, 139.767125, 7)
+    cells = geohash.neighbors(center)
+
+    assert len(cells) == 8
+    assert center not in cells
+    lat_min, lat_max, lon_min, lon_max = geohash.decode_bbox(center)
+    for cell in cells:
+        lat, lon = geohash.decode(cell)
+        assert abs(lat - (lat_min + lat_max) / 2) <= (lat_max - lat_min) * 1.01
+        assert abs(lon - (lon_min + lon_max) / 2) <= (lon_max - lon_min) * 1.01
+
+
+def test_neighbors_wrap_the_antimeridian_and_stop_at_poles():
+    east = geohash.encode(0.0, 179.99, 5)
+    assert any(geohash.decode(cell)[1] < 0 for cell in geohash.neighbors(east))
+
+    north = geohash.encode(89.99, 0.0, 3)
+    assert len(geohash.neighbors(north)) == 5
+
+
+@pytest.mark.parametrize("lat", [0.0, 35.68, 60.0])
+@pytest.mark.parametrize("radius_m", [50.0, 300.0, 2000.0])
+def test_search_tiles_cover_radius(lat, radius_m):
+    """検索半径の円に入る地点は、中心のタイルと周囲8タイルのどれかの前方一致にかかる"""
+    precision = search_precision(lat, radius_m)
+    center = geohash.encode(lat, 139.76, precision)
+    cells = [center] + geohash.neighbors(center)
+
+    rng = np.random.default_rng(1)
+    bearings = rng.uniform(0, 360, 300)
+    distances_km = rng.uniform(0, radius_m, 300) / 1000
+    lats, lons = geodesy.destination_points(lat, 139.76, bearings, distances_km)
+    for point_lat, point_lon in zip(lats, lons):
+        stored = geohash.encode(point_lat, point_lon, START_GEOHASH_PRECISION)
+        assert any(stored.startswith(cell) for cell in cells)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from services.geometry_service import compact_geojson, expand_geojson, line_coordinates
+from utils import geodesy, polyline
+
+
+def _wiggly_line(count=500, seed=0):
+    rng = np.random.default_rng(seed)
+    lons = 139.76 + np.cumsum(rng.uniform(0, 0.0002, count))
+    lats = 35.68 + np.cumsum(rng.uniform(-0.0001, 0.0001, count))
+    return np.column_stack([lons, lats]).round(6).tolist()
+
+
+def test_polyline_known_value():
+    # Google の仕様の例（precision 5）
+    coordinates = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+
+    assert polyline.encode(coordinates, precision=5) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert polyline.decode("_p~iF~ps|U_ulLnnqC_mqNvxq`@", precision=5) == coordinates
+
+
+@pytest.mark.parametrize("precision", [5, 6])
+def test_polyline_round_trip(precision):
+    coordinates = _wiggly_line()
+    coordinates.append([-179.999999, -89.999999])
+
+    decoded = polyline.decode(polyline.encode(coordinates, precision), precision)
+
+    assert np.allclose(decoded, coordinates, atol=10 ** -precision)
+
+
+def test_polyline_empty():
+    assert polyline.encode([]) == ""
+    assert polyline.decode("") == []
+
+
+def test_simplify_stays_within_tolerance():
+    coordinates = _wiggly_line()
+    kept = polyline.simplify_indices(coordinates, 2.0, keep=[100, 250])
+
+    assert kept[0] == 0 and kept[-1] == len(coordinates) - 1
+    assert {100, 250} <= set(kept.tolist())
+
+    # 間引いた点から残した折れ線までの距離が許容誤差以内
+    xy = np.column_stack(geodesy.local_xy(np.array(coordinates)[:, 1], np.array(coordinates)[:, 0]))
+    for start, end in zip(kept[:-1], kept[1:]):
+        a, b = xy[start], xy[end]
+        inner = xy[start + 1:end]
+        if len(inner) == 0:
+            continue
+        ab = b - a
+        t = np.clip(((inner - a) @ ab) / (ab @ ab), 0, 1)
+        assert np.hypot(*(inner - (a + t[:, None] * ab)).T).max() <= 2.0 + 1e-6
+
+
+def test_compact_feature_remaps_way_points():
+    coordinates = _wiggly_line(300)
+    feature = {
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": coordinates},
+        "properties": {
+            "way_points": [0, 120, 299],
+            "segments": [
+                {"steps": [{"way_points": [0, 57]}, {"way_points": [57, 120]}]},
+                {"steps": [{"way_points": [120, 299]}]},
+            ],
+        },
+    }
+    collection = {"type": "FeatureCollection", "features": [feature]}
+
+    compacted = compact_geojson(collection, tolerance_m=5.0)
+    assert isinstance(compacted["features"][0]["geometry"]["coordinates"], str)
+    # 元のオブジェクトは変更しない
+    assert feature["properties"]["way_points"] == [0, 120, 299]
+
+    expanded = expand_geojson(compacted)
+    line = line_coordinates(expanded)
+    properties = expanded["features"][0]["properties"]
+    assert len(line) < len(coordinates)
+    # 付け替えた way_points は元と同じ座標を指す
+    for old, new in zip([0, 120, 299], properties["way_points"]):
+        assert np.allclose(line[new], coordinates[old], atol=1e-6)
+    steps = [step for segment in properties["segments"] for step in segment["steps"]]
+    for old_points, step in zip([[0, 57], [57, 120], [120, 299]], steps):
+        for old, new in zip(old_points, step["way_points"]):
+            assert np.allclose(line[new], coordinates[old], atol=1e-6)
+
+
+def test_expand_leaves_uncompacted_geojson():
+    line = {"type": "LineString", "coordinates": [[139.76, 35.68], [139.77, 35.69]]}
+
+    assert expand_geojson(line) is line
+    assert compact_geojson(line, encoding="none") is line
+    assert expand_geojson(compact_geojson(line)) == line
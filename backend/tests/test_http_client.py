@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from services.http_client import HttpClient
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def _client(monkeypatch, handler, **kwargs):
+    client = HttpClient(backoff_base=0.01, backoff_max=0.05, **kwargs)
+    monkeypatch.setattr(client.session, "request", handler)
+    return client
+
+
+def test_retries_server_errors_then_succeeds(monkeypatch):
+    statuses = [503, 502, 200]
+    client = _client(monkeypatch, lambda method, url, **kwargs: FakeResponse(statuses.pop(0)))
+
+    assert client.get("http://upstream.test/x").status_code == 200
+    assert statuses == []
+
+
+def test_does_not_retry_read_timeout_on_post(monkeypatch):
+    calls = []
+
+    def handler(method, url, **kwargs):
+        calls.append(method)
+        raise requests.ReadTimeout("slow")
+
+    client = _client(monkeypatch, handler)
+    with pytest.raises(requests.ReadTimeout):
+        client.post("http://upstream.test/x")
+    assert len(calls) == 1
+
+
+def test_attempt_timeout_is_capped_by_deadline(monkeypatch):
+    timeouts = []
+
+    def handler(method, url, timeout=None, **kwargs):
+        timeouts.append(timeout)
+        return FakeResponse(200)
+
+    client = _client(monkeypatch, handler)
+    client.get("http://upstream.test/x", deadline=time.monotonic() + 1.0)
+    assert max(timeouts[0]) <= 1.0
+
+
+def test_waiting_for_host_slot_is_bounded_by_deadline(monkeypatch):
+    release = threading.Event()
+    entered = threading.Event()
+
+    def handler(method, url, **kwargs):
+        entered.set()
+        release.wait(5)
+        return FakeResponse(200)
+
+    client = _client(monkeypatch, handler, host_concurrency=1)
+    holder = threading.Thread(target=client.get, args=("http://upstream.test/slow",))
+    holder.start()
+    assert entered.wait(5)
+
+    start = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        client.get("http://upstream.test/other", deadline=time.monotonic() + 0.2)
+    assert time.monotonic() - start < 1.0
+
+    release.set()
+    holder.join()
+    # 待ちを諦めたリクエストは同時リクエストの枠を使わない
+    assert client._host_semaphore("http://upstream.test/").acquire(timeout=0)
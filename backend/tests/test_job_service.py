@@ -0,0 +1,61 @@
+import threading
+import time
+
+from services.job_service import JobQueue, JobTimeoutError
+
+
+def _wait(queue, job_id, timeout=5.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        job = queue.get(job_id)
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_job_past_deadline_is_running_until_it_finishes():
+    queue = JobQueue("test", max_workers=1, timeout_sec=0.05)
+    release = threading.Event()
+
+    def slow(deadline):
+        release.wait(5)
+        return "saved"
+
+    job_id = queue.submit(slow)
+    time.sleep(0.1)
+    # 締め切りを過ぎても関数が戻るまでは timeout にしない
+    assert queue.get(job_id)["status"] == "running"
+
+    release.set()
+    job = _wait(queue, job_id)
+    assert job["status"] == "succeeded"
+    assert job["result"] == "saved"
+
+
+def test_job_timeout_is_reported_when_function_gives_up():
+    queue = JobQueue("test", max_workers=1, timeout_sec=0.05)
+
+    def gives_up(deadline):
+        time.sleep(max(0.0, deadline - time.monotonic()))
+        raise JobTimeoutError("too late")
+
+    job = _wait(queue, queue.submit(gives_up))
+    assert job["status"] == "timeout"
+    assert job["error"] == "too late"
+
+
+def test_submit_with_same_job_id_reuses_active_job():
+    queue = JobQueue("test", max_workers=1)
+    release = threading.Event()
+    calls = []
+
+    def work(deadline):
+        calls.append(1)
+        release.wait(5)
+
+    assert queue.submit(work, job_id="abc") == "abc"
+    assert queue.submit(work, job_id="abc") == "abc"
+    release.set()
+    _wait(queue, "abc")
+    assert len(calls) == 1
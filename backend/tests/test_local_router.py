@@ -0,0 +1,44 @@
+import numpy as np
+
+from services.local_router import LocalPedestrianGraph, NodeGrid
+from utils import geodesy
+
+OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="35.6800" lon="139.7600"/>
+  <node id="2" lat="35.6800" lon="139.7610"/>
+  <node id="4" lat="35.6800" lon="139.7630"/>
+  <node id="5" lat="35.6800" lon="139.7640"/>
+  <way id="10">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="4"/><nd ref="5"/>
+    <tag k="highway" v="footway"/>
+  </way>
+</osm>
+"""
+
+
+def test_way_is_split_at_missing_node(tmp_path):
+    path = tmp_path / "extract.osm"
+    path.write_text(OSM)
+
+    graph = LocalPedestrianGraph.from_osm_xml(str(path))
+
+    assert graph.node_count == 4
+    # 抽出範囲外のノード3を挟む2と4は結ばない
+    left, _ = graph.shortest_path(graph.nearest_node(35.68, 139.7600), graph.nearest_node(35.68, 139.7610))
+    across, _ = graph.shortest_path(graph.nearest_node(35.68, 139.7610), graph.nearest_node(35.68, 139.7630))
+    assert left is not None
+    assert across is None
+
+
+def test_node_grid_matches_full_scan():
+    rng = np.random.default_rng(1)
+    lats = 35.68 + rng.uniform(-0.05, 0.05, 3000)
+    lons = 139.76 + rng.uniform(-0.05, 0.05, 3000)
+    grid = NodeGrid(lats, lons, cell_size=300.0)
+
+    queries = np.column_stack([35.68 + rng.uniform(-0.2, 0.2, 200), 139.76 + rng.uniform(-0.2, 0.2, 200)])
+    for lat, lon in queries:
+        x, y = geodesy.local_xy(lats, lons, grid.lat0, grid.lon0)
+        qx, qy = geodesy.local_xy(lat, lon, grid.lat0, grid.lon0)
+        assert grid.nearest(lat, lon) == int(np.argmin(np.hypot(x - qx, y - qy)))
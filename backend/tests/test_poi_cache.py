@@ -0,0 +1,45 @@
+import time
+
+from services.poi_cache import PoiCache
+
+PLACES = [{"name": "東京駅", "lat": 35.6812, "lon": 139.7671}]
+
+
+def test_memory_and_disk_hits(tmp_path):
+    path = str(tmp_path / "poi.sqlite3")
+    cache = PoiCache(path=path, ttl_sec=60)
+    cache.put("xn76urx", 500, PLACES)
+
+    assert cache.get("xn76urx", 500) == PLACES
+    assert cache.peek("xn76urx", 500) == PLACES
+
+    # 別のプロセスはディスクから読み込む
+    other = PoiCache(path=path, ttl_sec=60)
+    assert other.get("xn76urx", 500) == PLACES
+    assert other.stats()["disk_hits"] == 1
+    assert other.get("xn76urx", 250) is None
+
+
+def test_memory_entries_expire(tmp_path, monkeypatch):
+    cache = PoiCache(path=str(tmp_path / "poi.sqlite3"), ttl_sec=60)
+    cache.put("xn76urx", 500, PLACES)
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+
+    assert cache.peek("xn76urx", 500) is None
+    assert cache.get("xn76urx", 500) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_entry_loaded_from_disk_keeps_its_original_age(tmp_path, monkeypatch):
+    path = str(tmp_path / "poi.sqlite3")
+    PoiCache(path=path, ttl_sec=60).put("xn76urx", 500, PLACES)
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 50)
+    cache = PoiCache(path=path, ttl_sec=60)
+    assert cache.get("xn76urx", 500) == PLACES
+
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("xn76urx", 500) is None
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from services.run_metrics import RunMetricsAccumulator, compute_run_metrics
+
+
+def _track(count=2000, seed=0):
+    """3m/s前後で進み、途中で止まったりGPSが飛んだりする軌跡"""
+    rng = np.random.default_rng(seed)
+    step_m = rng.uniform(2.5, 3.5, count)
+    step_m[300:360] = 0.1           # 停止中
+    step_m[[800, 1500]] = 500.0     # GPSの飛び
+    times = 1735707600.0 + np.arange(count, dtype=float)
+    lats = 35.68 + np.cumsum(step_m) / 111195.0
+    lons = np.full(count, 139.76)
+    return lats, lons, times
+
+
+@pytest.mark.parametrize("chunk_sizes", [[1], [7], [250], [1, 999, 1000], [1999, 1]])
+def test_chunked_updates_match_whole_track(chunk_sizes):
+    lats, lons, times = _track()
+    whole = compute_run_metrics(lats, lons, times)
+
+    accumulator = RunMetricsAccumulator()
+    start = 0
+    i = 0
+    while start < len(lats):
+        end = start + chunk_sizes[i % len(chunk_sizes)]
+        accumulator.update(lats[start:end], lons[start:end], times[start:end])
+        # 保存して読み込み直しても続きから計算できる
+        accumulator = RunMetricsAccumulator.from_dict(accumulator.to_dict())
+        start = end
+        i += 1
+    chunked = accumulator.summary()
+
+    assert chunked["distance_km"] == pytest.approx(whole["distance_km"], abs=1e-9)
+    assert chunked["moving_time_sec"] == pytest.approx(whole["moving_time_sec"], abs=1e-6)
+    assert chunked["elapsed_sec"] == whole["elapsed_sec"]
+    assert [split["time_sec"] for split in chunked["splits"]] == pytest.approx(
+        [split["time_sec"] for split in whole["splits"]], abs=0.11
+    )
+
+
+def test_stops_and_gps_jumps_are_excluded():
+    lats, lons, times = _track()
+
+    summary = compute_run_metrics(lats, lons, times)
+
+    # 停止中の60区間と2回の飛びは距離・移動時間に含めない
+    assert summary["moving_time_sec"] == pytest.approx(len(lats) - 1 - 60 - 2)
+    assert 5.0 < summary["distance_km"] < 6.2
+    assert summary["elapsed_sec"] == len(lats) - 1
+    assert len(summary["splits"]) == int(summary["distance_km"])
+    assert summary["pace_min_per_km"] == pytest.approx(
+        summary["moving_time_sec"] / 60 / summary["distance_km"], abs=0.01
+    )
+
+
+def test_empty_track():
+    summary = RunMetricsAccumulator().summary()
+
+    assert summary["distance_km"] == 0
+    assert summary["pace_min_per_km"] is None
+    assert summary["splits"] == []
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+from models import Run
+
+
+def _track(count=200, lat=35.681236, lon=139.767125):
+    """予定ルートに沿って東へ約4.5m・1.5秒ごとに進む測位点"""
+    start = datetime(2025, 1, 1, 6, 0, 0)
+    return [
+        {
+            "latitude": lat,
+            "longitude": lon + 0.00005 * i,
+            "timestamp": (start + timedelta(seconds=1.5 * i)).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+def _start_run(client, route):
+    return client.post(
+        "/api/runs/start", json={"route_id": route.id, "start_time": "2025-01-01T06:00:00"}
+    ).get_json()["run_id"]
+
+
+def test_complete_with_recorded_track(client, route):
+    run_id = _start_run(client, route)
+    client.post(f"/api/runs/{run_id}/track", json={"offset": 0, "points": _track()})
+
+    response = client.post("/api/route/complete", json={"run_id": run_id})
+
+    assert response.status_code == 201
+    body = response.get_json()
+    assert 0.85 < body["metrics"]["distance_km"] < 0.95
+    assert body["adherence"]["coverage_percent"] > 40
+
+
+def test_complete_without_track_stores_nulls(client, route, db_session):
+    run_id = _start_run(client, route)
+    planned = route.route_geojson
+
+    response = client.post("/api/route/complete", json={
+        "run_id": run_id, "start_time": "2025-01-01T06:00:00", "geojson": planned
+    })
+
+    assert response.status_code == 201
+    assert response.get_json()["metrics"] is None
+    assert response.get_json()["adherence"] is None
+    run = db_session.get(Run, run_id)
+    assert run.end_time is not None
+    assert run.actual_distance_km is None
+    assert run.pace_min_per_km is None
+    assert run.track_geojson is None
+    assert run.adherence is None
+
+
+def test_complete_without_run_id_stores_nulls(client, route, db_session):
+    response = client.post("/api/route/complete", json={
+        "route_id": route.id, "start_time": "2025-01-01T06:00:00", "geojson": route.route_geojson
+    })
+
+    assert response.status_code == 201
+    run = db_session.get(Run, response.get_json()["run_id"])
+    assert run.actual_distance_km is None
+    assert run.adherence is None
+
+
+def test_complete_requires_route_and_start_time(client):
+    assert client.post("/api/route/complete", json={"route_id": "x"}).status_code == 400
+
+
+def test_adherence_get_does_not_store(client, route, db_session):
+    run_id = _start_run(client, route)
+    client.post(f"/api/runs/{run_id}/track", json={"offset": 0, "points": _track()})
+
+    response = client.get(f"/api/runs/{run_id}/adherence")
+
+    assert response.status_code == 200
+    assert response.get_json()["coverage_percent"] > 40
+    db_session.expire_all()
+    assert db_session.get(Run, run_id).adherence is None
+
+
+def test_adherence_get_without_track_is_404(client, route):
+    run_id = _start_run(client, route)
+
+    assert client.get(f"/api/runs/{run_id}/adherence").status_code == 404
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import decode_runs_cursor, encode_runs_cursor
+from models import Run
+
+
+@pytest.mark.parametrize("start_time", [datetime(2025, 4, 26, 7, 30, 15, 123456), None])
+def test_cursor_round_trip(start_time):
+    run = Run(id="7f1c2a4e-0000-4000-8000-000000000001", start_time=start_time)
+
+    assert decode_runs_cursor(encode_runs_cursor(run)) == (start_time, run.id)
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "bm90IGpzb24=", "WzFd", "WyJ4IiwgImEiXQ=="])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_runs_cursor(cursor)
+
+
+def test_pages_cover_every_run_once(client, route, db_session):
+    base = datetime(2025, 1, 1, 6, 0, 0)
+    expected = []
+    for i in range(23):
+        # 同じ開始時刻のランと開始時刻のないランも含める
+        start_time = None if i % 7 == 0 else base + timedelta(hours=i // 3)
+        run = Run(id=f"00000000-0000-4000-8000-{i:012d}", route_id=route.id, start_time=start_time)
+        db_session.add(run)
+        expected.append((start_time, run.id))
+    db_session.commit()
+    # 開始時刻・IDの降順（開始時刻のないランは最後）
+    expected.sort(key=lambda item: (item[0] is not None, item[0] or base, item[1]), reverse=True)
+
+    seen = []
+    cursor = None
+    while True:
+        url = "/api/runs?limit=5" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        assert response.status_code == 200
+        seen.extend(run["id"] for run in response.get_json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert seen == [run_id for _, run_id in expected]
+
+
+def test_bad_cursor_returns_400(client):
+    assert client.get("/api/runs?cursor=not-base64!").status_code == 400
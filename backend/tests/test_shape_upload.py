@@ -0,0 +1,53 @@
+import os
+import threading
+import time
+
+import pytest
+
+from services import shape_upload_service
+from services.job_service import JobTimeoutError
+from services.shape_upload_service import ShapeUploadService
+
+
+def hang_in_child(image_path, conn):
+    """止まってしまった抽出の代わり（子プロセスで実行される）"""
+    time.sleep(60)
+
+
+def test_duplicate_upload_does_not_rewrite_image_during_extraction(tmp_path, monkeypatch):
+    service = ShapeUploadService(str(tmp_path), workers=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def extract(deadline, shape_id, image_path):
+        started.set()
+        release.wait(5)
+        return []
+
+    monkeypatch.setattr(service, "_extract", extract)
+    shape_id, status = service.submit(b"image-bytes", "drawing.png")
+    assert status == "queued"
+    assert started.wait(5)
+
+    image_path = os.path.join(str(tmp_path), f"{shape_id}.png")
+    before = os.stat(image_path)
+    again_id, again_status = service.submit(b"image-bytes", "drawing.png")
+
+    assert again_id == shape_id
+    assert again_status == "running"
+    assert os.stat(image_path).st_ino == before.st_ino
+    assert os.stat(image_path).st_mtime_ns == before.st_mtime_ns
+    release.set()
+
+
+def test_hung_extraction_is_terminated_at_deadline(tmp_path, monkeypatch):
+    monkeypatch.setattr(shape_upload_service, "_extract_in_child", hang_in_child)
+    service = ShapeUploadService(str(tmp_path), processes=1)
+
+    start = time.monotonic()
+    with pytest.raises(JobTimeoutError):
+        service._extract(time.monotonic() + 3.0, "hash", str(tmp_path / "missing.png"))
+    assert time.monotonic() - start < 10
+
+    # 抽出プロセスの枠が空いている
+    assert service._process_slots.acquire(timeout=0)
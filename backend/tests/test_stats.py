@@ -0,0 +1,52 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from models import Run
+from services.stats_service import run_stats
+
+
+def _add_run(db_session, route, start_time, distance_km, pace):
+    db_session.add(Run(
+        route_id=route.id, start_time=start_time, end_time=start_time + timedelta(hours=1),
+        actual_distance_km=distance_km, pace_min_per_km=pace, calories=int(distance_km * 60)
+    ))
+    db_session.commit()
+
+
+@pytest.mark.parametrize("day", [
+    date(2021, 1, 1),    # ISO週では2020年の第53週
+    date(2021, 1, 4),
+    date(2024, 12, 30),  # ISO週では2025年の第1週
+    date(2025, 4, 26),
+    date(2025, 12, 28),
+])
+def test_week_label_is_iso_week(db_session, route, day):
+    _add_run(db_session, route, datetime.combine(day, datetime.min.time()).replace(hour=7), 5.0, 6.0)
+
+    label = run_stats(period="week", start=datetime.combine(day, datetime.min.time()),
+                      end=datetime.combine(day + timedelta(days=1), datetime.min.time()))["by_period"][0]["period"]
+
+    year, week, _ = day.isocalendar()
+    assert label == f"{year}-W{week:02d}"
+
+
+def test_average_pace_is_weighted_by_distance(db_session, route):
+    _add_run(db_session, route, datetime(2025, 5, 1, 7), 10.0, 5.0)
+    _add_run(db_session, route, datetime(2025, 5, 2, 7), 1.0, 8.0)
+    _add_run(db_session, route, datetime(2025, 5, 3, 7), 2.0, None)
+
+    totals = run_stats(start=datetime(2025, 5, 1), end=datetime(2025, 5, 4))["totals"]
+
+    assert totals["runs"] == 3
+    assert totals["distance_km"] == 13.0
+    # (10km × 5分 + 1km × 8分) ÷ 11km
+    assert totals["avg_pace_min_per_km"] == round(58 / 11, 2)
+
+
+def test_completing_a_run_clears_cached_stats(client, route):
+    assert client.get("/api/runs/stats").get_json()["totals"]["runs"] == 0
+
+    client.post("/api/route/complete", json={"route_id": route.id, "start_time": "2025-05-01T07:00:00"})
+
+    assert client.get("/api/runs/stats").get_json()["totals"]["runs"] == 1
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+def _points(count, start_lon=139.767125, lat=35.681236, step_deg=0.00005, with_timestamp=True):
+    """東向きに約4.5m間隔・1.5秒間隔（3m/s）で並ぶ測位点"""
+    start = datetime(2025, 1, 1, 6, 0, 0)
+    points = []
+    for i in range(count):
+        point = {"latitude": lat, "longitude": start_lon + step_deg * i}
+        if with_timestamp:
+            point["timestamp"] = (start + timedelta(seconds=1.5 * i)).isoformat()
+        points.append(point)
+    return points
+
+
+def _start_run(client, route):
+    response = client.post("/api/runs/start", json={"route_id": route.id, "start_time": "2025-01-01T06:00:00"})
+    assert response.status_code == 201
+    return response.get_json()["run_id"]
+
+
+def test_upload_track_accumulates_distance(client, route):
+    run_id = _start_run(client, route)
+    points = _points(400)
+
+    first = client.post(f"/api/runs/{run_id}/track", json={"offset": 0, "points": points[:250]})
+    second = client.post(f"/api/runs/{run_id}/track", json={"offset": 250, "points": points[250:]})
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert second.get_json()["total_points"] == 400
+    # 399区間 × 約4.5m
+    assert np.isclose(second.get_json()["distance_km"], 399 * 0.00451, rtol=0.02)
+
+
+def test_upload_track_skips_resent_points(client, route):
+    run_id = _start_run(client, route)
+    points = _points(20)
+
+    client.post(f"/api/runs/{run_id}/track", json={"offset": 0, "points": points[:15]})
+    response = client.post(f"/api/runs/{run_id}/track", json={"offset": 10, "points": points[10:]})
+
+    assert response.status_code == 200
+    assert response.get_json()["received"] == 5
+    assert response.get_json()["total_points"] == 20
+
+
+def test_upload_track_rejects_points_without_timestamp(client, route):
+    run_id = _start_run(client, route)
+
+    response = client.post(f"/api/runs/{run_id}/track", json={"offset": 0, "points": _points(400, with_timestamp=False)})
+
+    assert response.status_code == 400
+    assert "timestamp" in response.get_json()["error"]
+    # 途中まで記録されていない
+    assert client.post(
+        f"/api/runs/{run_id}/track", json={"offset": 0, "points": _points(2)}
+    ).get_json()["total_points"] == 2
+
+
+def test_upload_track_rejects_gap_in_offset(client, route):
+    run_id = _start_run(client, route)
+
+    response = client.post(f"/api/runs/{run_id}/track", json={"offset": 5, "points": _points(3)})
+
+    assert response.status_code == 409
+    assert response.get_json()["expected_offset"] == 0
@@ -3,8 +3,17 @@
 画像処理や地理情報処理などの共通関数を提供します
 """
 
-# 必要に応じてサブモジュールをインポートしてエクスポート
-from .extract_keypoints import extract_keypoints_from_image
-
 # バージョン情報
-__version__ = '0.1.0'
\ No newline at end of file
+__version__ = '0.1.0'
+
+
+def __getattr__(name):
+    """
+    重いサブモジュール（cv2 を使う extract_keypoints）は最初に参照されたときにインポートする
+
+    utils.geodesy などの軽いモジュールだけを使う場合に cv2 / matplotlib を読み込まないため
+    """
+    if name == 'extract_keypoints_from_image':
+        from .extract_keypoints import extract_keypoints_from_image
+        return extract_keypoints_from_image
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,10 +1,126 @@
-import cv2
+import argparse
+import hashlib
+import json
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 
-def opencv_keypoints(image_path, min_points=6, max_points=9, point_size=20):
+# cv2 と matplotlib は読み込みが重いので、抽出や可視化を実際に行う関数の中でインポートする
+# （マニフェストの読み書きだけを使うWebプロセスの起動を軽くするため）
+
+# 結果画像の保存方法
+#   opencv: 特徴点を描いたOpenCVの画像をそのまま書き出す（高速）
+#   matplotlib: タイトル付きの図として300dpiで保存する（従来の形式）
+#   none: 結果画像を保存しない（特徴点のCSVのみ）
+VISUALIZE_MODES = ('opencv', 'matplotlib', 'none')
+
+def _select_epsilon_index(contour, epsilon_values, target_points=10):
+    """
+    近似後の点数が target_points 以上で最も target_points に近くなる epsilon の番号を二分探索で求める
+    
+    点数は epsilon に対して単調に減るので、全ての epsilon で近似する代わりに
+    「target_points 以上になる最後の番号」と「その点数になる最初の番号」を二分探索する。
+    結果は全ての epsilon を試して選ぶ場合と同じになる
+    
+    Args:
+        contour: 輪郭
+        epsilon_values: 昇順の epsilon の配列
+        target_points: 目標の点数
+        
+    Returns:
+        選択した epsilon の番号
+    """
+    import cv2
+    
+    counts = {}
+    
+    def count(i):
+        if i not in counts:
+            counts[i] = len(cv2.approxPolyDP(contour, epsilon_values[i], True))
+        return counts[i]
+    
+    last = len(epsilon_values) - 1
+    
+    # 最小の epsilon でも target_points 未満なら、点数が最大になる最初の番号（=0）を選ぶ
+    if count(0) < target_points:
+        return 0
+    
+    # target_points 以上になる最後の番号を探す
+    if count(last) >= target_points:
+        boundary = last
+    else:
+        lo, hi = 0, last  # count(lo) >= target_points > count(hi)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if count(mid) >= target_points:
+                lo = mid
+            else:
+                hi = mid
+        boundary = lo
+    
+    # その点数になる最初の番号を探す
+    best_count = count(boundary)
+    lo, hi = -1, boundary  # count(lo) > best_count >= count(hi)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if count(mid) <= best_count:
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+def _symmetric_pair_scores(keypoints, angles, center_point):
+    """
+    中心を挟んで対称な点のペアを探し、スコアの高い順に返す
+    
+    全ペアの長さの比と角度差をNumPyでまとめて計算する
+    
+    Args:
+        keypoints: 角度順に並んだ特徴点のリスト
+        angles: 各特徴点の中心からの角度
+        center_point: 重心
+        
+    Returns:
+        [(i, j, score), ...] スコアの降順（同点の場合は (i, j) の昇順）
+    """
+    n = len(keypoints)
+    if n < 2:
+        return []
+    
+    # 中心から各点へのベクトルとその長さ
+    vectors = np.asarray(keypoints) - center_point
+    norms = np.array([np.sqrt(v.dot(v)) for v in vectors])
+    angles = np.asarray(angles)
+    
+    i_idx, j_idx = np.triu_indices(n, k=1)
+    norm_i = norms[i_idx]
+    norm_j = norms[j_idx]
+    
+    # ベクトルの長さがほぼ同じで、角度が反対（差がπに近い）
+    length_ratio = np.full(len(i_idx), np.inf)
+    np.divide(norm_i, norm_j, out=length_ratio, where=norm_j > 0)
+    angle_diff = np.abs(np.abs(angles[i_idx] - angles[j_idx]) - np.pi)
+    
+    # 対称性の条件：長さの比が0.8〜1.25の範囲、角度差がπ±0.3ラジアン
+    symmetric = (0.8 < length_ratio) & (length_ratio < 1.25) & (angle_diff < 0.3)
+    
+    # 対称度（角度差がπに近いほど高スコア）、長さの比（1に近いほど高スコア）、重要度（中心からの距離）
+    angle_score = 1 - angle_diff[symmetric] / 0.3
+    length_score = 1 - np.abs(length_ratio[symmetric] - 1) / 0.25
+    importance = (norm_i[symmetric] + norm_j[symmetric]) / 2
+    
+    # 総合スコア
+    scores = angle_score * 0.5 + length_score * 0.3 + importance * 0.2
+    
+    # スコアの高い順にソート（安定ソートで同点はペアの順序を保つ）
+    order = np.argsort(-scores, kind='stable')
+    pairs_i = i_idx[symmetric]
+    pairs_j = j_idx[symmetric]
+    return [(int(pairs_i[k]), int(pairs_j[k]), scores[k]) for k in order]
+
+def opencv_keypoints(image_path, min_points=6, max_points=9, point_size=20, draw=True):
     """
     OpenCVを使って画像から特徴点を抽出する
     
@@ -13,11 +129,14 @@ def opencv_keypoints(image_path, min_points=6, max_points=9, point_size=20):
         min_points: 最小特徴点数
         max_points: 最大特徴点数
         point_size: 可視化時の点のサイズ
+        draw: Falseの場合は可視化画像を作らない
         
     Returns:
         filtered_keypoints: 抽出された特徴点の座標リスト
-        result_img: 特徴点を可視化した画像
+        result_img: 特徴点を可視化した画像（draw=Falseの場合はNone）
     """
+    import cv2
+    
     # 画像読み込み
     img = cv2.imread(image_path)
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
@@ -31,104 +150,28 @@ def opencv_keypoints(image_path, min_points=6, max_points=9, point_size=20):
     # 最大の輪郭を取得
     contour = max(contours, key=cv2.contourArea)
     
-    # epsilon初期値を計算
-    epsilon = 0.01 * cv2.arcLength(contour, True)
-    
-    # 試行する値の範囲
-    epsilon_values = []
-    for mult in np.logspace(-2, 1, 30):  # より細かい範囲で多くの値を試す
-        epsilon_values.append(mult * cv2.arcLength(contour, True))
-    
-    # 各epsilonでの点の数を計算
-    point_counts = []
-    for eps in epsilon_values:
-        approx = cv2.approxPolyDP(contour, eps, True)
-        point_counts.append(len(approx))
-    
-    # 10個以上で最も10に近い点数を見つける
-    closest_to_10 = float('inf')
-    closest_idx = 0
+    # 試行する値の範囲（輪郭の長さは一度だけ計算する）
+    arc_length = cv2.arcLength(contour, True)
+    epsilon_values = np.logspace(-2, 1, 30) * arc_length
     
-    for i, count in enumerate(point_counts):
-        if count >= 10 and abs(count - 10) < closest_to_10:
-            closest_to_10 = abs(count - 10)
-            closest_idx = i
-    
-    # 10個以上の点が見つからない場合は、最大の点数を選択
-    if closest_to_10 == float('inf'):
-        closest_idx = np.argmax(point_counts)
-    
-    # 選択したepsilonで輪郭の近似を行う
-    epsilon = epsilon_values[closest_idx]
+    # 10個以上で最も10に近い点数になるepsilonで輪郭の近似を行う
+    epsilon = epsilon_values[_select_epsilon_index(contour, epsilon_values)]
     approx = cv2.approxPolyDP(contour, epsilon, True)
     keypoints = [point[0] for point in approx]
     
     # 重心を計算
     center_point = np.mean(keypoints, axis=0)
     
-    # 各点を角度でソート
-    angles = []
-    for point in keypoints:
-        # 中心からの相対座標
-        dx = point[0] - center_point[0]
-        dy = point[1] - center_point[1]
-        # 角度を計算（-π〜πの範囲）
-        angle = np.arctan2(dy, dx)
-        angles.append(angle)
-    
-    # 角度でソート
+    # 各点を角度でソート（中心からの相対座標の角度、-π〜πの範囲）
+    offsets = np.asarray(keypoints) - center_point
+    angles = np.arctan2(offsets[:, 1], offsets[:, 0])
+    
     sorted_indices = np.argsort(angles)
     keypoints = [keypoints[i] for i in sorted_indices]
-    angles = [angles[i] for i in sorted_indices]
-    
-    # 点の対称性を判定
-    # 左右対称: x座標の差が小さい
-    # 上下対称: y座標の差が小さい
-    symmetric_pairs = []
-    
-    for i in range(len(keypoints)):
-        for j in range(i+1, len(keypoints)):
-            p1 = np.array(keypoints[i])
-            p2 = np.array(keypoints[j])
-            
-            # 中心を通る直線に対して対称かをチェック
-            # 中心から各点へのベクトル
-            v1 = p1 - center_point
-            v2 = p2 - center_point
-            
-            # ベクトルの長さがほぼ同じで、角度が反対（差がπに近い）
-            length_ratio = np.linalg.norm(v1) / np.linalg.norm(v2) if np.linalg.norm(v2) > 0 else float('inf')
-            angle_diff = abs(abs(angles[i] - angles[j]) - np.pi)
-            
-            # 対称性の条件：長さの比が0.8〜1.25の範囲、角度差がπ±0.3ラジアン
-            if 0.8 < length_ratio < 1.25 and angle_diff < 0.3:
-                symmetric_pairs.append((i, j))
-    
-    # 対称ペアをスコア付け（優先度）
-    pair_scores = []
-    for i, j in symmetric_pairs:
-        p1 = np.array(keypoints[i])
-        p2 = np.array(keypoints[j])
-        
-        # 対称度（角度差がπに近いほど高スコア）
-        angle_diff = abs(abs(angles[i] - angles[j]) - np.pi)
-        angle_score = 1 - angle_diff / 0.3
-        
-        # 長さの比（1に近いほど高スコア）
-        v1 = p1 - center_point
-        v2 = p2 - center_point
-        length_ratio = np.linalg.norm(v1) / np.linalg.norm(v2) if np.linalg.norm(v2) > 0 else float('inf')
-        length_score = 1 - abs(length_ratio - 1) / 0.25
-        
-        # 重要度（中心からの距離）
-        importance = (np.linalg.norm(v1) + np.linalg.norm(v2)) / 2
-        
-        # 総合スコア
-        score = angle_score * 0.5 + length_score * 0.3 + importance * 0.2
-        pair_scores.append((i, j, score))
+    angles = angles[sorted_indices]
     
-    # スコアの高い順にソート
-    pair_scores.sort(key=lambda x: x[2], reverse=True)
+    # 点の対称性を判定し、対称ペアをスコア付け（優先度）
+    pair_scores = _symmetric_pair_scores(keypoints, angles, center_point)
     
     # 保持する点のリスト（インデックス）
     keep_indices = set()
@@ -143,9 +186,10 @@ def opencv_keypoints(image_path, min_points=6, max_points=9, point_size=20):
     
     # もし点の数が少なすぎる場合、残りのなるべく対称的な点を追加
     if len(keep_indices) < min_points:
+        distances = np.linalg.norm(np.asarray(keypoints) - center_point, axis=1)
         remaining = [i for i in range(len(keypoints)) if i not in keep_indices]
         # 中心からの距離でソート
-        remaining.sort(key=lambda i: np.linalg.norm(np.array(keypoints[i]) - center_point), reverse=True)
+        remaining.sort(key=lambda i: distances[i], reverse=True)
         
         # 必要な数だけ追加
         for i in remaining:
@@ -157,16 +201,15 @@ def opencv_keypoints(image_path, min_points=6, max_points=9, point_size=20):
     filtered_keypoints = [keypoints[i] for i in sorted(keep_indices)]
     
     # もう一度角度でソート
-    angles = []
-    for point in filtered_keypoints:
-        dx = point[0] - center_point[0]
-        dy = point[1] - center_point[1]
-        angle = np.arctan2(dy, dx)
-        angles.append(angle)
+    offsets = np.asarray(filtered_keypoints) - center_point
+    angles = np.arctan2(offsets[:, 1], offsets[:, 0])
     
     sorted_indices = np.argsort(angles)
     filtered_keypoints = [filtered_keypoints[i] for i in sorted_indices]
     
+    if not draw:
+        return filtered_keypoints, None
+    
     # 結果を可視化
     result_img = img.copy()
     
@@ -186,7 +229,7 @@ def opencv_keypoints(image_path, min_points=6, max_points=9, point_size=20):
     
     return filtered_keypoints, result_img
 
-def process_image(image_path, save_dir=None, min_points=6, max_points=9, point_size=30):
+def process_image(image_path, save_dir=None, min_points=6, max_points=9, point_size=30, visualize='opencv'):
     """
     画像を処理して特徴点を抽出し、結果を保存する
     
@@ -196,12 +239,19 @@ def process_image(image_path, save_dir=None, min_points=6, max_points=9, point_s
         min_points: 最小特徴点数
         max_points: 最大特徴点数
         point_size: 可視化時の点のサイズ
+        visualize: 結果画像の保存方法（VISUALIZE_MODES のいずれか）
         
     Returns:
         keypoints: 抽出された特徴点の座標リスト
     """
+    if visualize not in VISUALIZE_MODES:
+        raise ValueError(f"visualize は {VISUALIZE_MODES} のいずれかを指定してください: {visualize}")
+    
+    # 結果画像を保存しない場合は可視化画像も作らない
+    draw = bool(save_dir) and visualize != 'none'
+    
     # 特徴点抽出
-    keypoints, result_img = opencv_keypoints(image_path, min_points, max_points, point_size)
+    keypoints, result_img = opencv_keypoints(image_path, min_points, max_points, point_size, draw=draw)
     
     # 保存ディレクトリが指定されている場合のみ保存処理を実行
     if save_dir:
@@ -219,15 +269,14 @@ def process_image(image_path, save_dir=None, min_points=6, max_points=9, point_s
         if not os.path.exists(save_dir):
             os.makedirs(save_dir)
         
-        # Matplotlibを使用して画像を表示・保存
-        plt.figure(figsize=(10, 8))
-        plt.imshow(cv2.cvtColor(result_img, cv2.COLOR_BGR2RGB))
-        plt.title(f"特徴点: {base_name} ({len(keypoints)}点)")
-        plt.axis('off')
-        
-        # 画像を保存
-        plt.savefig(result_filepath, bbox_inches='tight', dpi=300)
-        plt.close()  # メモリリークを防ぐために図を閉じる
+        if visualize == 'opencv':
+            # 可視化画像をそのままPNGで書き出す
+            import cv2
+            cv2.imwrite(result_filepath, result_img)
+        elif visualize == 'matplotlib':
+            _save_figure(result_img, result_filepath, f"特徴点: {base_name} ({len(keypoints)}点)")
+        else:
+            result_filepath = None
         
         # 特徴点の座標を保存（CSVファイル）
         keypoints_filename = f"{base_name}_keypoints_{timestamp}.csv"
@@ -236,11 +285,26 @@ def process_image(image_path, save_dir=None, min_points=6, max_points=9, point_s
         
         print(f"処理完了: {base_name}")
         print(f"  特徴点数: {len(keypoints)}")
-        print(f"  結果画像: {result_filepath}")
+        if result_filepath:
+            print(f"  結果画像: {result_filepath}")
         print(f"  特徴点座標: {keypoints_filepath}")
     
     return keypoints
 
+def _save_figure(result_img, filepath, title):
+    """Matplotlibを使用してタイトル付きの図を保存"""
+    import cv2
+    import matplotlib.pyplot as plt
+    
+    plt.figure(figsize=(10, 8))
+    plt.imshow(cv2.cvtColor(result_img, cv2.COLOR_BGR2RGB))
+    plt.title(title)
+    plt.axis('off')
+    
+    # 画像を保存
+    plt.savefig(filepath, bbox_inches='tight', dpi=300)
+    plt.close()  # メモリリークを防ぐために図を閉じる
+
 # APIとして利用するための関数
 def extract_keypoints_from_image(image_path, min_points=6, max_points=9):
     """
@@ -261,47 +325,149 @@ def extract_keypoints_from_image(image_path, min_points=6, max_points=9):
         print(f"特徴点抽出エラー: {str(e)}")
         return None
 
-# テスト用のメイン実行部分（このファイルが直接実行された場合のみ実行）
-if __name__ == "__main__":
-    # 画像ファイルのディレクトリを指定
-    image_dir = "/backend/static/imgs"
+# 特徴点マニフェスト（画像の内容ハッシュごとの抽出結果）のファイル名
+MANIFEST_FILENAME = "manifest.json"
+
+# 画像ファイル拡張子のリスト
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.gif']
+
+def image_content_hash(image_path):
+    """画像ファイルの内容ハッシュ（SHA-256）"""
+    sha256 = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def load_manifest(save_dir):
+    """
+    保存ディレクトリの特徴点マニフェストを読み込む
     
-    # 保存先ディレクトリを設定
-    save_dir = "/backend/static/keypoints_results"
+    Args:
+        save_dir: 結果を保存するディレクトリ
+        
+    Returns:
+        {内容ハッシュ: {"name", "source", "keypoints", "extracted_at", "elapsed_sec"}} の辞書
+    """
+    manifest_path = os.path.join(save_dir, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f).get('images', {})
+
+def save_manifest(save_dir, images):
+    """特徴点マニフェストを書き込む（途中で中断しても壊れないよう一時ファイルから置き換える）"""
+    manifest_path = os.path.join(save_dir, MANIFEST_FILENAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'images': images}, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def _extract_for_batch(image_path, save_dir, min_points, max_points, visualize):
+    """ワーカープロセスで1枚の画像を処理し、(特徴点, 処理時間) を返す"""
+    started = time.perf_counter()
+    keypoints = process_image(image_path, save_dir, min_points=min_points, max_points=max_points, visualize=visualize)
+    elapsed = time.perf_counter() - started
+    return [[int(x), int(y)] for x, y in keypoints], elapsed
+
+def batch_extract(image_dir, save_dir, workers=None, min_points=6, max_points=9, force=False, visualize='opencv'):
+    """
+    ディレクトリ内の画像から特徴点をプロセスプールで並列に抽出する
     
-    # 画像ファイル拡張子のリスト
-    image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.gif']
+    内容ハッシュがマニフェストに登録済みの画像は処理しない
     
-    # ディレクトリが存在しない場合は作成
+    Args:
+        image_dir: 画像ファイルのディレクトリ
+        save_dir: 結果を保存するディレクトリ
+        workers: プロセス数（Noneの場合はCPU数）
+        min_points: 最小特徴点数
+        max_points: 最大特徴点数
+        force: Trueの場合は登録済みの画像も処理し直す
+        visualize: 結果画像の保存方法（VISUALIZE_MODES のいずれか）
+        
+    Returns:
+        (処理した画像数, スキップした画像数, 失敗した画像数)
+    """
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
         print(f"ディレクトリを作成しました: {save_dir}")
     
-    # 画像ディレクトリが存在するか確認
-    if not os.path.exists(image_dir):
-        print(f"エラー: 指定された画像ディレクトリが存在しません: {image_dir}")
-        exit(1)
-    
-    # 処理した画像の数をカウント
-    processed_count = 0
-    
-    # ディレクトリ内のすべてのファイルを処理
-    for filename in os.listdir(image_dir):
-        # 拡張子をチェック
-        ext = os.path.splitext(filename)[1].lower()
-        if ext in image_extensions:
-            image_path = os.path.join(image_dir, filename)
+    manifest = load_manifest(save_dir)
+    
+    # 内容ハッシュで処理済みの画像を除く（同じ内容の画像は1回だけ処理する）
+    pending = {}
+    skipped = 0
+    for filename in sorted(os.listdir(image_dir)):
+        if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        image_path = os.path.join(image_dir, filename)
+        content_hash = image_content_hash(image_path)
+        if (not force and content_hash in manifest) or content_hash in pending:
+            print(f"スキップ: {filename}（処理済み {content_hash[:12]}）")
+            skipped += 1
+            continue
+        pending[content_hash] = image_path
+    
+    processed = 0
+    failed = 0
+    started = time.perf_counter()
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_extract_for_batch, image_path, save_dir, min_points, max_points, visualize): (content_hash, image_path)
+            for content_hash, image_path in pending.items()
+        }
+        for future in as_completed(futures):
+            content_hash, image_path = futures[future]
+            filename = os.path.basename(image_path)
             try:
-                # 画像処理
-                process_image(image_path, save_dir, min_points=6, max_points=9)
-                processed_count += 1
+                keypoints, elapsed = future.result()
             except Exception as e:
                 print(f"エラー: {filename} の処理中にエラーが発生しました: {str(e)}")
+                failed += 1
+                continue
+            
+            manifest[content_hash] = {
+                'name': os.path.splitext(filename)[0],
+                'source': filename,
+                'keypoints': keypoints,
+                'extracted_at': datetime.now().isoformat(timespec='seconds'),
+                'elapsed_sec': round(elapsed, 3)
+            }
+            # 途中で中断しても処理済みの分は残るよう、1枚ごとに書き込む
+            save_manifest(save_dir, manifest)
+            processed += 1
+            print(f"  {filename}: {elapsed:.2f}秒")
+    
+    print(f"\n処理完了: {processed}個のファイルを処理しました（スキップ {skipped}個、失敗 {failed}個、{time.perf_counter() - started:.2f}秒）")
+    return processed, skipped, failed
+
+# バッチ抽出コマンド（例: python utils/extract_keypoints.py --workers 4）
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="画像ディレクトリから特徴点をまとめて抽出します")
+    parser.add_argument("--image-dir", default="/backend/static/imgs", help="画像ファイルのディレクトリ")
+    parser.add_argument("--save-dir", default="/backend/static/keypoints_results", help="結果を保存するディレクトリ")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（省略時はCPU数）")
+    parser.add_argument("--min-points", type=int, default=6, help="最小特徴点数")
+    parser.add_argument("--max-points", type=int, default=9, help="最大特徴点数")
+    parser.add_argument("--force", action="store_true", help="処理済みの画像も抽出し直す")
+    parser.add_argument("--visualize", choices=VISUALIZE_MODES, default="opencv",
+                        help="結果画像の保存方法（matplotlib は従来のタイトル付き300dpiの図、none は保存しない）")
+    args = parser.parse_args()
+    
+    # 画像ディレクトリが存在するか確認
+    if not os.path.exists(args.image_dir):
+        print(f"エラー: 指定された画像ディレクトリが存在しません: {args.image_dir}")
+        exit(1)
     
-    print(f"\n処理完了: {processed_count}個のファイルを処理しました")
+    processed_count, skipped_count, _ = batch_extract(
+        args.image_dir, args.save_dir, workers=args.workers,
+        min_points=args.min_points, max_points=args.max_points, force=args.force,
+        visualize=args.visualize
+    )
     
     # すべての処理完了後に結果のサマリーを表示
-    if processed_count > 0:
-        print(f"すべての結果は {save_dir} ディレクトリに保存されています")
+    if processed_count > 0 or skipped_count > 0:
+        print(f"すべての結果は {args.save_dir} ディレクトリに保存されています")
     else:
-        print(f"処理された画像はありませんでした。{image_dir} 内に適切な画像ファイルがあることを確認してください")
\ No newline at end of file
+        print(f"処理された画像はありませんでした。{args.image_dir} 内に適切な画像ファイルがあることを確認してください")
@@ -0,0 +1,188 @@
+"""
+NumPy版の測地計算モジュール
+route_service のスカラー版（haversine_distance / calculate_destination_point）と同じ式を、
+多数の地点・方位・距離に対してまとめて計算します
+"""
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0  # 地球の半径（km）
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    2点間の直線距離をキロメートルで計算（配列はブロードキャストされる）
+
+    Args:
+        lat1, lon1: 1点目の緯度・経度（度、スカラーまたは配列）
+        lat2, lon2: 2点目の緯度・経度（度、スカラーまたは配列）
+
+    Returns:
+        距離（km）の配列
+    """
+    lat1_rad = np.radians(lat1)
+    lon1_rad = np.radians(lon1)
+    lat2_rad = np.radians(lat2)
+    lon2_rad = np.radians(lon2)
+
+    dlon = lon2_rad - lon1_rad
+    dlat = lat2_rad - lat1_rad
+
+    a = np.sin(dlat / 2)**2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_matrix(lats1, lons1, lats2, lons2):
+    """
+    2つの地点群の全組み合わせの距離行列を計算
+
+    Args:
+        lats1, lons1: n個の地点の緯度・経度（度）
+        lats2, lons2: m個の地点の緯度・経度（度）
+
+    Returns:
+        (n, m) の距離行列（km）
+    """
+    lats1 = np.asarray(lats1, dtype=float)[:, None]
+    lons1 = np.asarray(lons1, dtype=float)[:, None]
+    lats2 = np.asarray(lats2, dtype=float)[None, :]
+    lons2 = np.asarray(lons2, dtype=float)[None, :]
+    return haversine(lats1, lons1, lats2, lons2)
+
+
+def initial_bearings(lat1, lon1, lat2, lon2):
+    """
+    1点目から2点目への方位角を計算（配列はブロードキャストされる）
+
+    Args:
+        lat1, lon1: 出発地点の緯度・経度（度）
+        lat2, lon2: 目的地の緯度・経度（度）
+
+    Returns:
+        方位角（度、北が0度、東が90度、[0, 360)）の配列
+    """
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    dlon = np.radians(lon2) - np.radians(lon1)
+
+    y = np.sin(dlon) * np.cos(lat2_rad)
+    x = np.cos(lat1_rad) * np.sin(lat2_rad) - np.sin(lat1_rad) * np.cos(lat2_rad) * np.cos(dlon)
+
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def destination_points(lat, lon, bearing_deg, distance_km):
+    """
+    出発地点から方位角と距離で決まる目的地の緯度経度を計算（配列はブロードキャストされる）
+
+    Args:
+        lat: 出発地点の緯度（度）
+        lon: 出発地点の経度（度）
+        bearing_deg: 方位角（度、北が0度、東が90度）
+        distance_km: 距離（キロメートル）
+
+    Returns:
+        目的地の (緯度の配列, 経度の配列)
+    """
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+    bearing_rad = np.radians(bearing_deg)
+
+    # 角距離（距離/地球半径）
+    angular_distance = np.asarray(distance_km, dtype=float) / EARTH_RADIUS_KM
+
+    dest_lat_rad = np.arcsin(
+        np.sin(lat_rad) * np.cos(angular_distance) +
+        np.cos(lat_rad) * np.sin(angular_distance) * np.cos(bearing_rad)
+    )
+
+    dest_lon_rad = lon_rad + np.arctan2(
+        np.sin(bearing_rad) * np.sin(angular_distance) * np.cos(lat_rad),
+        np.cos(angular_distance) - np.sin(lat_rad) * np.sin(dest_lat_rad)
+    )
+
+    dest_lat = np.degrees(dest_lat_rad)
+    dest_lon = np.degrees(dest_lon_rad)
+
+    # 経度を-180〜180の範囲に正規化
+    dest_lon = (dest_lon + 540) % 360 - 180
+
+    return dest_lat, dest_lon
+
+
+def shape_vectors(points):
+    """
+    座標点を順に結ぶ閉じた多角形の各辺の方向と長さを計算
+
+    Args:
+        points: [(x1,y1), (x2,y2), ..., (xn,yn)] 形式の座標リスト（画像座標、yは下向き）
+
+    Returns:
+        (方向角の配列（ラジアン、(0,-1)を基準に時計回り、[0, 2π)）, 長さの配列)
+        i番目は点iから点i+1（最後は点nから点1）へのベクトル
+    """
+    xy = np.asarray(points, dtype=float)
+    delta = np.roll(xy, -1, axis=0) - xy
+    dx = delta[:, 0]
+    dy = delta[:, 1]
+
+    directions = np.arctan2(dx, -dy)
+    directions = np.where(directions < 0, directions + 2 * np.pi, directions)
+    magnitudes = np.sqrt(dx**2 + dy**2)
+
+    return directions, magnitudes
+
+
+def walk_polygons(lat, lon, bearings_deg, distances_km):
+    """
+    出発地点から方位角と距離の列に沿って順に進んだ各地点を、複数の配置についてまとめて計算
+
+    Args:
+        lat: 出発地点の緯度（度、スカラーまたは (k,) 配列）
+        lon: 出発地点の経度（度、スカラーまたは (k,) 配列）
+        bearings_deg: (k, m) または (m,) の方位角（度）
+        distances_km: bearings_deg と同じ形の距離（km）
+
+    Returns:
+        (k, m+1, 2) の緯度経度配列（[:, 0] は出発地点）
+    """
+    bearings_deg = np.atleast_2d(np.asarray(bearings_deg, dtype=float))
+    distances_km = np.broadcast_to(np.asarray(distances_km, dtype=float), bearings_deg.shape)
+    k, m = bearings_deg.shape
+
+    coords = np.empty((k, m + 1, 2))
+    coords[:, 0, 0] = lat
+    coords[:, 0, 1] = lon
+
+    # 各ステップは前の地点に依存するのでステップ方向はループし、配置方向をまとめて計算する
+    for i in range(m):
+        coords[:, i + 1, 0], coords[:, i + 1, 1] = destination_points(
+            coords[:, i, 0], coords[:, i, 1], bearings_deg[:, i], distances_km[:, i]
+        )
+
+    return coords
+
+
+def local_xy(lats, lons, lat0=None, lon0=None):
+    """
+    緯度経度を基準点の周りの平面座標（メートル、東向きx・北向きy）に投影（正距円筒図法）
+
+    ルート1本程度の範囲なら距離の誤差は無視できる
+
+    Args:
+        lats, lons: 緯度・経度の配列（度）
+        lat0, lon0: 基準点（省略時は配列の平均）
+
+    Returns:
+        (x の配列, y の配列)
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    lat0 = lats.mean() if lat0 is None else lat0
+    lon0 = lons.mean() if lon0 is None else lon0
+    meters_per_deg = np.radians(1) * EARTH_RADIUS_KM * 1000
+    x = (lons - lon0) * np.cos(np.radians(lat0)) * meters_per_deg
+    y = (lats - lat0) * meters_per_deg
+    return x, y
@@ -0,0 +1,131 @@
+"""
+ジオハッシュのエンコード・デコード
+緯度経度をタイル単位のキャッシュキーや近傍検索に使う文字列へ変換します
+"""
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(lat, lon, precision=7):
+    """
+    緯度経度をジオハッシュ文字列に変換
+    
+    Args:
+        lat: 緯度
+        lon: 経度
+        precision: ジオハッシュの文字数（7で約150m四方）
+        
+    Returns:
+        ジオハッシュ文字列
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True  # 偶数ビットは経度、奇数ビットは緯度
+    
+    while len(geohash) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if lon >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits = bits << 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+        
+        even = not even
+        bit_count += 1
+        
+        # 5ビットごとに1文字
+        if bit_count == 5:
+            geohash.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    
+    return "".join(geohash)
+
+
+def decode_bbox(geohash):
+    """
+    ジオハッシュが表すタイルの範囲を計算
+    
+    Args:
+        geohash: ジオハッシュ文字列
+        
+    Returns:
+        (最小緯度, 最大緯度, 最小経度, 最大経度) のタプル
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    
+    for char in geohash:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            if bit:
+                target[0] = mid
+            else:
+                target[1] = mid
+            even = not even
+    
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def decode(geohash):
+    """
+    ジオハッシュが表すタイルの中心の緯度経度を計算
+    
+    Args:
+        geohash: ジオハッシュ文字列
+        
+    Returns:
+        (緯度, 経度) のタプル
+    """
+    lat_min, lat_max, lon_min, lon_max = decode_bbox(geohash)
+    return (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+
+
+def neighbors(geohash):
+    """
+    ジオハッシュのタイルを囲む8つのタイルを計算
+    
+    Args:
+        geohash: ジオハッシュ文字列
+        
+    Returns:
+        周囲のタイルのジオハッシュのリスト（北極・南極の外側のタイルは含まない）
+    """
+    lat_min, lat_max, lon_min, lon_max = decode_bbox(geohash)
+    lat_center = (lat_min + lat_max) / 2
+    lon_center = (lon_min + lon_max) / 2
+    height = lat_max - lat_min
+    width = lon_max - lon_min
+    
+    result = []
+    for dlat in (1, 0, -1):
+        for dlon in (-1, 0, 1):
+            if dlat == 0 and dlon == 0:
+                continue
+            lat = lat_center + dlat * height
+            if not -90.0 < lat < 90.0:
+                continue
+            # 経度は日付変更線をまたいで反対側のタイルにつなげる
+            lon = (lon_center + dlon * width + 180.0) % 360.0 - 180.0
+            neighbor = encode(lat, lon, len(geohash))
+            if neighbor not in result:
+                result.append(neighbor)
+    return result
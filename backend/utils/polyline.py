@@ -0,0 +1,123 @@
+"""
+折れ線の圧縮
+座標列をエンコード済みポリライン（Google Encoded Polyline 形式）の文字列に変換し、
+許容誤差の範囲で点を間引く Douglas-Peucker 法を提供します
+"""
+
+import numpy as np
+
+from utils import geodesy
+
+
+def encode(coordinates, precision=6):
+    """
+    [[lng, lat], ...] の座標列をエンコード済みポリラインに変換
+
+    Args:
+        coordinates: [[lng1, lat1], [lng2, lat2], ...] 形式の座標列（GeoJSONの順）
+        precision: 小数点以下の桁数（6で約0.1m）
+
+    Returns:
+        エンコード済みポリライン文字列（点の順は緯度・経度）
+    """
+    if len(coordinates) == 0:
+        return ""
+    factor = 10 ** precision
+    latlng = np.round(np.asarray(coordinates, dtype=float)[:, [1, 0]] * factor).astype(np.int64)
+
+    # 前の点との差分を、符号をビット0に移した非負整数にする
+    deltas = np.diff(latlng, axis=0, prepend=0).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    chars = []
+    for value in values.tolist():
+        # 下位から5ビットずつ、続きがあれば0x20を立てて出力する
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return "".join(chars)
+
+
+def decode(encoded, precision=6):
+    """
+    エンコード済みポリラインを [[lng, lat], ...] の座標列に戻す
+
+    Args:
+        encoded: エンコード済みポリライン文字列
+        precision: エンコード時と同じ小数点以下の桁数
+
+    Returns:
+        [[lng1, lat1], [lng2, lat2], ...] 形式の座標列
+    """
+    values = []
+    value = 0
+    shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = 0
+            shift = 0
+
+    if not values:
+        return []
+    latlng = np.cumsum(np.asarray(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return np.round(latlng[:, [1, 0]], precision).tolist()
+
+
+def simplify_indices(coordinates, tolerance_m, keep=()):
+    """
+    Douglas-Peucker 法で残す点の番号を求める
+
+    元の折れ線からの距離が tolerance_m 以下に収まる範囲で点を間引く。
+    距離は座標列の中心付近で平面に投影して計算する（ルートの範囲なら誤差は無視できる）
+
+    Args:
+        coordinates: [[lng1, lat1], [lng2, lat2], ...] 形式の座標列
+        tolerance_m: 許容する誤差（メートル）
+        keep: 必ず残す点の番号（区間の境界など）
+
+    Returns:
+        残す点の番号の昇順の配列（最初と最後の点は必ず含む）
+    """
+    xy = np.asarray(coordinates, dtype=float)[:, :2]
+    n = len(xy)
+    if n <= 2:
+        return np.arange(n)
+
+    # 経度・緯度をメートルの平面座標に変換
+    points = np.column_stack(geodesy.local_xy(xy[:, 1], xy[:, 0]))
+
+    kept = np.zeros(n, dtype=bool)
+    anchors = sorted({0, n - 1} | {int(i) for i in keep if 0 <= int(i) < n})
+    kept[anchors] = True
+
+    # 必ず残す点で区切った区間ごとに、最も離れた点で再帰的に分割する
+    stack = list(zip(anchors, anchors[1:]))
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a = points[start]
+        b = points[end]
+        inner = points[start + 1:end]
+        ab = b - a
+        length = np.hypot(ab[0], ab[1])
+        if length == 0:
+            distances = np.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+        else:
+            # 線分までの距離（線分の外側は端点までの距離）
+            t = np.clip(((inner - a) @ ab) / length**2, 0, 1)
+            nearest = a + t[:, None] * ab
+            distances = np.hypot(inner[:, 0] - nearest[:, 0], inner[:, 1] - nearest[:, 1])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            index = start + 1 + farthest
+            kept[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    return np.flatnonzero(kept)
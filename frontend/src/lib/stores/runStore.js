@@ -1,4 +1,4 @@
-import { writable } from 'svelte/store';
+import { writable, get } from 'svelte/store';
 
 // ランデータを保存するストア
 export const runs = writable([]);
@@ -6,6 +6,27 @@ export const runs = writable([]);
 export const isLoading = writable(false);
 // エラー情報を保存するストア
 export const error = writable(null);
+// 次のページのカーソル（続きがない場合はnull）
+export const nextCursor = writable(null);
+
+// 1ページの件数
+const PAGE_SIZE = 50;
+
+// 1ページ分のランデータを取得する（詳細画面で軌跡を表示するので track_geojson も含める）
+const fetchRunPage = async (cursor) => {
+  const params = new URLSearchParams({ include_track: '1', limit: String(PAGE_SIZE) });
+  if (cursor) {
+    params.set('cursor', cursor);
+  }
+  const response = await fetch(`http://localhost:5000/api/runs?${params}`);
+
+  if (!response.ok) {
+    throw new Error('ラン記録の取得に失敗しました');
+  }
+
+  const data = await response.json();
+  return { data, cursor: response.headers.get('X-Next-Cursor') };
+};
 
 // APIからデータを取得する関数
 export const fetchRunCollection = async () => {
@@ -13,18 +34,31 @@ export const fetchRunCollection = async () => {
   error.set(null);
   
   try {
-    const response = await fetch("http://localhost:5000/api/runs");
-    
-    if (!response.ok) {
-      throw new Error('ラン記録の取得に失敗しました');
-    }
-    
-    const data = await response.json();
-    runs.set(data);
+    const page = await fetchRunPage(null);
+    runs.set(page.data);
+    nextCursor.set(page.cursor);
   } catch (err) {
     console.error('エラー:', err);
     error.set(err.message);
   } finally {
     isLoading.set(false);
   }
-};
\ No newline at end of file
+};
+
+// 続きのページを取得して追加する関数
+export const fetchMoreRuns = async () => {
+  const cursor = get(nextCursor);
+  if (!cursor) {
+    return;
+  }
+  error.set(null);
+
+  try {
+    const page = await fetchRunPage(cursor);
+    runs.update((current) => [...current, ...page.data]);
+    nextCursor.set(page.cursor);
+  } catch (err) {
+    console.error('エラー:', err);
+    error.set(err.message);
+  }
+};
@@ -5,15 +5,20 @@ USE touka_db;
 -- routes テーブル
 CREATE TABLE routes (
   id CHAR(36) PRIMARY KEY,
-  animal_name TEXT NOT NULL,
+  animal_name VARCHAR(64) NOT NULL,
   distance_km FLOAT NOT NULL,
   actual_route_distance_km FLOAT,
+  straight_distance_km FLOAT,
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   route_geojson JSON,
   stat_end_latitude FLOAT,
   stat_end_longitude FLOAT,
+  start_geohash VARCHAR(12),
   image_url TEXT,
-  image_bounds JSON
+  image_bounds JSON,
+  INDEX idx_routes_animal_name (animal_name),
+  INDEX idx_routes_created_at (created_at),
+  INDEX idx_routes_start_geohash (start_geohash, animal_name)
 );
 
 -- runs テーブル
@@ -26,17 +31,32 @@ CREATE TABLE runs (
   pace_min_per_km FLOAT,
   calories INT,
   track_geojson JSON,
-  FOREIGN KEY (route_id) REFERENCES routes(id)
+  metrics JSON,
+  adherence JSON,
+  FOREIGN KEY (route_id) REFERENCES routes(id),
+  INDEX idx_runs_start_time_id (start_time, id),
+  INDEX idx_runs_route_id_start_time (route_id, start_time),
+  INDEX idx_runs_start_time_stats (start_time, route_id, actual_distance_km, pace_min_per_km, calories)
 );
 
 -- track_points テーブル
 CREATE TABLE track_points (
   id CHAR(36) PRIMARY KEY,
-  route_id CHAR(36) NOT NULL,
+  run_id CHAR(36) NOT NULL,
+  seq INT NOT NULL,
   timestamp TIMESTAMP,
   latitude FLOAT,
   longitude FLOAT,
   distance_from_start FLOAT,
   route_index INT,
-  FOREIGN KEY (route_id) REFERENCES routes(id)
+  FOREIGN KEY (run_id) REFERENCES runs(id),
+  UNIQUE KEY uq_track_points_run_seq (run_id, seq)
+);
+
+-- detour_estimates テーブル（地域ごとの迂回係数）
+CREATE TABLE detour_estimates (
+  cell VARCHAR(12) PRIMARY KEY,
+  factor FLOAT NOT NULL,
+  samples INT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
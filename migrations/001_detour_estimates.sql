@@ -0,0 +1,13 @@
+-- 地域ごとの迂回係数の学習
+-- init.sql で作成済みの既存データベースに適用する
+
+USE touka_db;
+
+ALTER TABLE routes ADD COLUMN straight_distance_km FLOAT AFTER actual_route_distance_km;
+
+CREATE TABLE detour_estimates (
+  cell VARCHAR(12) PRIMARY KEY,
+  factor FLOAT NOT NULL,
+  samples INT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
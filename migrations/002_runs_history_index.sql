@@ -0,0 +1,6 @@
+-- ラン履歴（/api/runs）のキーセットページング用インデックス
+-- init.sql で作成済みの既存データベースに適用する
+
+USE touka_db;
+
+CREATE INDEX idx_runs_start_time_id ON runs (start_time, id);
@@ -0,0 +1,20 @@
+-- track_points をランに紐づける（init.sql では routes.id を参照していた）
+-- init.sql で作成済みの既存データベースに適用する
+-- これまで track_points に書き込む処理はなかったので、テーブルを作り直す
+
+USE touka_db;
+
+DROP TABLE IF EXISTS track_points;
+
+CREATE TABLE track_points (
+  id CHAR(36) PRIMARY KEY,
+  run_id CHAR(36) NOT NULL,
+  seq INT NOT NULL,
+  timestamp TIMESTAMP,
+  latitude FLOAT,
+  longitude FLOAT,
+  distance_from_start FLOAT,
+  route_index INT,
+  FOREIGN KEY (run_id) REFERENCES runs(id),
+  UNIQUE KEY uq_track_points_run_seq (run_id, seq)
+);
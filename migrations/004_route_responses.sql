@@ -0,0 +1,9 @@
+-- ルート取得（GET /api/route/<id>）のエンコード済みレスポンス
+-- init.sql で作成済みの既存データベースに適用する
+-- 既存のルートは最初に取得されたときにレスポンスを作って保存する
+
+USE touka_db;
+
+ALTER TABLE routes
+  ADD COLUMN response_gzip MEDIUMBLOB,
+  ADD COLUMN response_etag CHAR(32);
@@ -0,0 +1,14 @@
+-- ラン集計（/api/runs/stats）用のインデックス
+-- init.sql で作成済みの既存データベースに適用する
+-- animal_name はTEXTのままではインデックスを張れないので VARCHAR(64)（図形IDのハッシュが入る長さ）にする
+
+USE touka_db;
+
+ALTER TABLE routes
+  MODIFY COLUMN animal_name VARCHAR(64) NOT NULL,
+  ADD INDEX idx_routes_animal_name (animal_name),
+  ADD INDEX idx_routes_created_at (created_at);
+
+ALTER TABLE runs
+  ADD INDEX idx_runs_route_id_start_time (route_id, start_time),
+  ADD INDEX idx_runs_start_time_stats (start_time, route_id, actual_distance_km, pace_min_per_km, calories);
@@ -0,0 +1,6 @@
+-- 軌跡から計算したランの指標（距離・移動時間・ペース・スプリット）
+-- init.sql で作成済みの既存データベースに適用する
+
+USE touka_db;
+
+ALTER TABLE runs ADD COLUMN metrics JSON AFTER track_geojson;
@@ -0,0 +1,7 @@
+-- ランの予定ルートに対する追従度
+-- init.sql で作成済みの既存データベースに適用する
+-- 既存のランは GET /api/runs/<run_id>/adherence で最初に取得されたときに計算して保存する
+
+USE touka_db;
+
+ALTER TABLE runs ADD COLUMN adherence JSON AFTER metrics;
@@ -0,0 +1,13 @@
+-- 出発地点が近い既存ルートの検索
+-- init.sql で作成済みの既存データベースに適用する
+
+USE touka_db;
+
+ALTER TABLE routes ADD COLUMN start_geohash VARCHAR(12) AFTER stat_end_longitude;
+
+-- 既存のルートの出発地点のジオハッシュ（ST_GeoHash の引数は経度・緯度の順）
+UPDATE routes
+SET start_geohash = ST_GeoHash(stat_end_longitude, stat_end_latitude, 9)
+WHERE stat_end_latitude IS NOT NULL AND stat_end_longitude IS NOT NULL;
+
+CREATE INDEX idx_routes_start_geohash ON routes (start_geohash, animal_name);
@@ -0,0 +1,9 @@
+-- ルート取得（GET /api/route/<id>）のレスポンスをデータベースに保存しない
+-- init.sql で作成済みの既存データベースに適用する
+-- レスポンスは最初に取得されたときに route_geojson から作り、プロセス内にだけキャッシュする
+
+USE touka_db;
+
+ALTER TABLE routes
+  DROP COLUMN response_gzip,
+  DROP COLUMN response_etag;